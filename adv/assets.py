@@ -0,0 +1,195 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import pygame
+
+# 画像アセットのキャッシュ
+# デコード・変換・拡大縮小済みのサーフェスをメモリ予算内で保持し（LRUで追い出し）、
+# 読み込みはワーカースレッドで行うのでシーン切り替え時にディスク読み込みで止まらない
+# 相対パスは base_dir から探す。bundle（bundle.AssetBundle）を設定すると、そこにある画像は
+# デコードせずにメモリマップから直接使う（LRUの予算には数えない）
+# バンドルに違う大きさしかない画像は、ファイルではなくバンドルの画像をワーカーで拡大縮小してLRUに入れる
+
+
+def _surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class AssetManager:
+    def __init__(self, budget_bytes=64 * 1024 * 1024, notify_event=None, base_dir=None, bundle=None):
+        self.budget_bytes = budget_bytes
+        self.notify_event = notify_event  # 読み込み完了時に投げるイベントの種類
+        self.base_dir = base_dir  # 相対パスの基準のフォルダ（None の場合はカレントディレクトリ）
+        self.bundle = bundle
+        self.used_bytes = 0
+        self._surfaces = OrderedDict()  # (path, size): Surface
+        self._failed = {}  # (path, size): エラーメッセージ（失敗した読み込みは再試行しない）
+        self._requested = set()  # ワーカーに依頼済みのキー
+        self._ready = []  # ワーカーが読み込み終えた (key, 世代, surface, error)
+        self._generations = {}  # パス: 世代（invalidate のたびに増やし、それより前の依頼の結果は捨てる）
+        self._mtimes = {}  # パス: 読み込んだときのファイルの更新時刻（ファイルがなかった場合は None）
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="asset-loader", daemon=True)
+        self._worker.start()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, path):
+        return os.path.join(self.base_dir, path) if self.base_dir else path
+
+    # 画像があるかどうか（バンドルかファイル）
+    def exists(self, path):
+        return (self.bundle is not None and path in self.bundle) or os.path.exists(self.resolve(path))
+
+    # ファイル（バンドルにある場合はバンドルの画像）を読み込んで指定サイズに拡大縮小する（ワーカースレッド・メインスレッド共通）
+    def _decode(self, path, size):
+        image = self.bundle.largest_image(path) if self.bundle is not None else None
+        if image is None:
+            # 読む前に記録する（読んでいる間に書き換えられた場合も、次の modified で気づける）
+            self._mtimes[path] = self._file_mtime(path)
+            image = pygame.image.load(self.resolve(path))
+        if size is not None and image.get_size() != tuple(size):
+            image = pygame.transform.scale(image, size)
+        return image
+
+    def _file_mtime(self, path):
+        try:
+            return os.stat(self.resolve(path)).st_mtime_ns
+        except OSError:
+            return None
+
+    # 読み込んだ後でファイルが変わったか（バンドルの画像・まだ読み込んでいない画像は False）
+    def modified(self, path):
+        return path in self._mtimes and self._file_mtime(path) != self._mtimes[path]
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            key, generation = request
+            if self._generations.get(key[0], 0) != generation:
+                continue  # 依頼した後で invalidate された
+            try:
+                result = (key, generation, self._decode(*key), None)
+            except Exception as e:
+                result = (key, generation, None, str(e))
+            with self._lock:
+                self._ready.append(result)
+            if self.notify_event is not None and pygame.display.get_init():
+                pygame.event.post(pygame.event.Event(self.notify_event))
+
+    # ワーカーの読み込み結果を取り込む（convert() はメインスレッドで行う）
+    def _adopt_ready(self):
+        if not self._ready:
+            return
+        with self._lock:
+            ready, self._ready = self._ready, []
+        for key, generation, image, error in ready:
+            if self._generations.get(key[0], 0) != generation:
+                continue  # invalidate する前のファイルの結果
+            self._requested.discard(key)
+            if error is not None:
+                self._failed[key] = error
+                print(f"画像を読み込めませんでした: {key[0]} ({error})")
+            else:
+                self._store(key, image)
+
+    def _store(self, key, image):
+        if pygame.display.get_surface() is not None:
+            if image.get_flags() & pygame.SRCALPHA:
+                image = image.convert_alpha()
+            else:
+                image = image.convert()
+        old = self._surfaces.pop(key, None)
+        if old is not None:
+            self.used_bytes -= _surface_bytes(old)
+        self._surfaces[key] = image
+        self.used_bytes += _surface_bytes(image)
+        # 予算を超えたら古いものから追い出す（今入れたものは残す）
+        while self.used_bytes > self.budget_bytes and len(self._surfaces) > 1:
+            _, evicted = self._surfaces.popitem(last=False)
+            self.used_bytes -= _surface_bytes(evicted)
+        return image
+
+    def _request(self, key):
+        if key in self._surfaces or key in self._failed or key in self._requested:
+            return
+        self._requested.add(key)
+        self._queue.put((key, self._generations.get(key[0], 0)))
+
+    # バンドルにある画像（ない場合は None）
+    def _bundled(self, path, size):
+        if self.bundle is None:
+            return None
+        return self.bundle.image(path, size)
+
+    # サーフェスを取得する（未読み込みなら読み込みを依頼して None を返し、待たない）
+    def get(self, path, size=None):
+        surface = self._bundled(path, size)
+        if surface is not None:
+            self.hits += 1
+            return surface
+        self._adopt_ready()
+        key = (path, tuple(size) if size is not None else None)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        self._request(key)
+        return None
+
+    # その場で読み込む（起動時など、待ってもよい場合に使う）
+    def load_now(self, path, size=None):
+        surface = self._bundled(path, size)
+        if surface is not None:
+            return surface
+        self._adopt_ready()
+        key = (path, tuple(size) if size is not None else None)
+        if key in self._surfaces:
+            return self._surfaces[key]
+        if key in self._failed:
+            return None
+        try:
+            return self._store(key, self._decode(*key))
+        except Exception as e:
+            self._failed[key] = str(e)
+            print(f"画像を読み込めませんでした: {path} ({e})")
+            return None
+
+    # 複数の画像を先読みする
+    def prefetch(self, paths, size=None):
+        self._adopt_ready()
+        for path in paths:
+            if path and self._bundled(path, size) is None:
+                self._request((path, tuple(size) if size is not None else None))
+
+    # キャッシュから取り除く（失敗記録も消すので次回は読み直す）
+    # 読み込み中の依頼は世代を進めて結果を捨てるので、古いファイルの画像が後から入ることはない
+    def invalidate(self, path):
+        self._generations[path] = self._generations.get(path, 0) + 1
+        self._requested = {key for key in self._requested if key[0] != path}
+        self._mtimes.pop(path, None)
+        for key in [k for k in self._surfaces if k[0] == path]:
+            self.used_bytes -= _surface_bytes(self._surfaces.pop(key))
+        for key in [k for k in self._failed if k[0] == path]:
+            del self._failed[key]
+
+    def stats(self):
+        return {
+            "entries": len(self._surfaces),
+            "used_bytes": self.used_bytes,
+            "failed": len(self._failed),
+            "pending": len(self._requested),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bundled": len(self.bundle) if self.bundle is not None else 0,
+        }
+
+    def shutdown(self):
+        self._queue.put(None)
@@ -0,0 +1,742 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# 画面を使わずに実行するため、pygame を読み込む前にダミーのドライバを指定する
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# 描画・ロジックのベンチマーク
+# 大きさの違う合成シーンを作り、game_loop のフレームレート・テキストの折り返し・シーンの読み込み時間とメモリ・
+# アイテムのクリック判定・セーブ/ロードを測る。結果はJSONで書き出し、保存しておいた基準と比べて
+# しきい値を超えて遅くなった項目があれば終了コード1で終わる
+# 上限のある項目（定常状態のボタン描画で Surface を作らない・メモリが増えない）は、基準がなくても検査する
+#
+#   python bench.py --output result.json
+#   python bench.py --baseline baseline.json --threshold 0.1
+
+# 合成テキストに使う文字
+CJK_CHARS = ("あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+             "森村宝地図遺跡小屋道宿屋食事光石赤緑古銀冒険始入口前方不気味伝説成功神秘的中央箱置")
+
+
+# 合成シーンを作る関数
+def generate_scenes(count, text_length=200, choices=3, items=3, seed=0):
+    rng = random.Random(seed)
+    ids = ["start"] + [f"scene_{i}" for i in range(1, count)]
+    scenes = {}
+    for scene_id in ids:
+        text = "".join(rng.choice(CJK_CHARS) for _ in range(text_length))
+        scene_choices = [{"text": "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(3, 8))),
+                          "next": rng.choice(ids)} for _ in range(choices)]
+        scene_items = [{"name": "".join(rng.choice(CJK_CHARS) for _ in range(3)),
+                        "color": [rng.randrange(256) for _ in range(3)],
+                        "x": rng.randrange(0, 700), "y": rng.randrange(120, 450),
+                        "width": rng.randrange(30, 80), "height": rng.randrange(20, 60)}
+                       for _ in range(items)]
+        scenes[scene_id] = {"text": text, "choices": scene_choices, "background": None,
+                            "items": scene_items}
+    return scenes
+
+
+def write_scenes(path, scenes):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(scenes, file, ensure_ascii=False, indent=4)
+    return path
+
+
+# fn を repeats 回実行して最短の秒数を返す
+def best_of(repeats, fn):
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# fn を実行したときのメモリ使用量のピーク（バイト）
+def peak_memory(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+# 結果の1項目: (値, 単位, 大きいほど良いか)
+# limit を指定すると、基準との比較とは別に、値がそれを超えたら失敗にする（定常状態で Surface を作らない、など）
+def metric(value, unit, higher_is_better, limit=None):
+    result = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+    if limit is not None:
+        result["limit"] = limit
+    return result
+
+
+BENCHMARKS = {}
+
+# 定常状態の描画で残ってよいメモリの合計（フレーム数によらない揺れの分）
+RETAINED_BYTES_LIMIT = 4096
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__.replace("bench_", "")] = fn
+    return fn
+
+
+@benchmark
+def bench_startup(ctx):
+    # 別プロセスで main を読み込む時間（pygame の初期化・フォント・画面の用意を含む）
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1")
+    command = [sys.executable, "-c", "import main; main.text_font.get_height()"]
+    seconds = best_of(ctx.repeats, lambda: subprocess.run(command, cwd=here, env=env, check=True,
+                                                          stdout=subprocess.DEVNULL))
+    return {"startup_seconds": metric(seconds, "s", False)}
+
+
+@benchmark
+def bench_load_scenes(ctx):
+    from scene_graph import load_scene_graph
+    from scene_store import SceneStore, build_index
+
+    results = {}
+    for size in ctx.sizes:
+        path = ctx.scene_file(size)
+        seconds = best_of(ctx.repeats, lambda: load_scene_graph(path))
+        results[f"load_scenes_{size}_seconds"] = metric(seconds, "s", False)
+        results[f"load_scenes_{size}_peak_bytes"] = metric(peak_memory(lambda: load_scene_graph(path)),
+                                                           "B", False)
+
+        results[f"scene_index_build_{size}_seconds"] = metric(
+            best_of(ctx.repeats, lambda: build_index(path)), "s", False)
+
+        def open_store():
+            store = SceneStore(path)
+            store[store.start]
+            return store
+        results[f"scene_store_open_{size}_seconds"] = metric(best_of(ctx.repeats, lambda: open_store().close()),
+                                                             "s", False)
+        results[f"scene_store_open_{size}_peak_bytes"] = metric(peak_memory(open_store), "B", False)
+    return results
+
+
+@benchmark
+def bench_draw_text(ctx):
+    import main
+    from text_layout import TextLayoutCache
+
+    rng = random.Random(1)
+    texts = ["".join(rng.choice(CJK_CHARS) for _ in range(2000)) for _ in range(20)]
+    chars = sum(len(text) for text in texts)
+    width = main.WIDTH - 100
+
+    # main と同じく、行はフォントの共有キャッシュを通さずにレンダリングする
+    def render(font, line, color):
+        return main.fonts.render_direct(font, line, True, color)
+
+    cache = TextLayoutCache(render=render)
+    cache.wrap(texts[0], main.text_font, width)  # 文字幅を計測済みにしておく
+
+    def wrap_all():
+        for text in texts:
+            cache.wrap(text, main.text_font, width)
+    wrap_seconds = best_of(ctx.repeats, wrap_all)
+
+    def layout_cold():
+        cold = TextLayoutCache(render=render)
+        for text in texts:
+            cold.get(text, main.text_font, main.BLACK, width)
+    cold_seconds = best_of(ctx.repeats, layout_cold)
+
+    def layout_cached():
+        for _ in range(50):
+            for text in texts:
+                cache.get(text, main.text_font, main.BLACK, width)
+    cached_seconds = best_of(ctx.repeats, layout_cached)
+
+    return {
+        "draw_text_wrap_chars_per_second": metric(chars / wrap_seconds, "chars/s", True),
+        "draw_text_cold_layouts_per_second": metric(len(texts) / cold_seconds, "layouts/s", True),
+        "draw_text_cached_layouts_per_second": metric(50 * len(texts) / cached_seconds, "layouts/s", True),
+    }
+
+
+# game_loop の定常状態のフレームを測る入力元
+# 毎フレーム選択肢のボタンにマウスを乗せたり外したりして必ず描き直させ、
+# 2フレーム目の開始から終了までの時間を同じ実行の中で測る（起動の時間を含まない）
+# settle は計測を始める前に呼ぶ関数（先読みのスレッドが終わるのを待つなど）
+class SteadyInput:
+    replaying = True
+
+    def __init__(self, hover, settle=None):
+        self.hover = hover  # ボタンの上の位置（論理座標）
+        self.settle = settle
+        self.frames = 0
+        self.started = None
+        self.seconds = None
+
+    def start(self):
+        return 0
+
+    def begin_frame(self):
+        self.frames += 1
+        if self.frames == 2:
+            if self.settle is not None:
+                self.settle()
+            self.started = time.perf_counter()
+        # 時刻はクールダウンが切れた後にしておく
+        return 10 ** 9 + self.frames, self.hover if self.frames % 2 else (0, 0)
+
+    def wait(self, timeout=None):
+        return 10 ** 9 + self.frames, []
+
+    def tick(self, clock, fps):
+        pass
+
+    def close(self, summary=None):
+        self.seconds = time.perf_counter() - self.started
+
+
+@benchmark
+def bench_game_loop(ctx):
+    import main
+
+    results = {}
+    frames = ctx.frames
+    for size in ctx.sizes:
+        path = ctx.scene_file(size)
+        startup = best_of(ctx.repeats, lambda: main.game_loop(event_driven=False, fps=0,
+                                                              max_frames=1, scene_file=path))
+        scenes = main.open_scenes(path)
+        hover = main.get_choice_rects(scenes[scenes.start])[0][0].center
+        best = None
+        for _ in range(ctx.repeats):
+            source = SteadyInput(hover, settle=main.warmup.wait)
+            gc.collect()
+            main.game_loop(event_driven=False, fps=0, max_frames=frames, scene_file=path, input_source=source)
+            best = source.seconds if best is None else min(best, source.seconds)
+        results[f"game_loop_{size}_startup_seconds"] = metric(startup, "s", False)
+        results[f"game_loop_{size}_fps"] = metric((frames - 1) / best, "frames/s", True)
+
+    # シーンごとの描き直し（静的レイヤーを作り直すフレーム）の速さ
+    scenes = main.open_scenes(ctx.scene_file(ctx.sizes[0]))
+    sample = [scenes[i] for i in range(min(len(scenes), 200))]
+
+    def redraw_all():
+        for scene in sample:
+            main.current_scene = scene.index
+            main.scene_items.load_scene_items(scene.index, scene)
+            main.compositor.invalidate()
+            main.draw_frame(scene, (0, 0), 10 ** 9)
+    seconds = best_of(ctx.repeats, redraw_all)
+    results["full_redraw_fps"] = metric(len(sample) / seconds, "frames/s", True)
+    return results
+
+
+@benchmark
+def bench_buttons(ctx):
+    import pygame
+    import main
+
+    scenes = main.open_scenes(ctx.scene_file(ctx.sizes[0]))
+    scene = scenes[scenes.start]
+    main.new_game(scenes)
+    main.ui_timers.reset()
+    main.scene_items.load_scene_items(scene.index, scene)
+    main.compositor.invalidate()
+    on = main.get_choice_rects(scene)[0][0].center
+    # ホバー・クールダウンを毎フレーム切り替えて、選択肢のボタンを必ず描き直させる
+    inputs = [(on, 10 ** 9), ((0, 0), 10 ** 9), (on, 0), ((0, 0), 0)]
+
+    def draw(frames):
+        for i in range(frames):
+            mouse, current_time = inputs[i % len(inputs)]
+            main.draw_frame(scene, mouse, current_time)
+
+    draw(len(inputs) * 2)  # 各状態の画像を作っておく
+    frames = ctx.frames
+    seconds = best_of(ctx.repeats, lambda: draw(frames))
+
+    # 定常状態で新しく作られる Surface を数える（テキストのレンダリングも含む）
+    created = [0]
+    surface_class, render_direct = pygame.Surface, main.fonts.render_direct
+
+    class CountingSurface(surface_class):
+        def __init__(self, *args, **kwargs):
+            created[0] += 1
+            super().__init__(*args, **kwargs)
+
+    def counting_render(*args, **kwargs):
+        created[0] += 1
+        return render_direct(*args, **kwargs)
+
+    pygame.Surface, main.fonts.render_direct = CountingSurface, counting_render
+    tracemalloc.start()
+    try:
+        # 追跡を始めた直後はアロケーターや辞書の領域の確保が混ざるので、一度描いてから測る
+        draw(frames)
+        created[0] = 0
+        gc.collect()
+        before, _ = tracemalloc.get_traced_memory()
+        draw(frames)
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pygame.Surface = surface_class
+        del main.fonts.render_direct
+    # SDL のピクセルバッファは tracemalloc からは見えないので、Surface の数は別に数えている
+    # 残ったメモリはフレーム数によらない小さな揺れ（数百バイト）があるので、合計が上限を超えたら増え続けているとみなす
+    # （1フレームに小さなオブジェクトを1つ残すだけでも、300フレームで 9KB 以上になる）
+    return {
+        "button_frame_us": metric(seconds / frames * 1e6, "us", False),
+        "button_surfaces_per_frame": metric(created[0] / frames, "surfaces", False, limit=0),
+        "button_retained_bytes": metric(max(after - before, 0), "B", False, limit=RETAINED_BYTES_LIMIT),
+    }
+
+
+@benchmark
+def bench_viewport(ctx):
+    import pygame
+    import main
+
+    scenes = main.open_scenes(ctx.scene_file(ctx.sizes[0]))
+    scene = scenes[scenes.start]
+    main.new_game(scenes)
+    main.ui_timers.reset()
+    main.scene_items.load_scene_items(scene.index, scene)
+    on = main.get_choice_rects(scene)[0][0].center
+    inputs = [(on, 10 ** 9), ((0, 0), 10 ** 9), (on, 0), ((0, 0), 0)]
+
+    def draw(frames):
+        for i in range(frames):
+            mouse, current_time = inputs[i % len(inputs)]
+            main.draw_frame(scene, mouse, current_time)
+
+    # 出力の大きさごとの定常状態のフレーム時間（拡大した出力でも固定サイズと同じになるはず）
+    results = {}
+    frames = ctx.frames
+    try:
+        for width, height in [(main.WIDTH, main.HEIGHT), (1920, 1080)]:
+            main.set_display_mode((width, height), resizable=True)
+            main.compositor.invalidate()
+            draw(len(inputs) * 2)
+            seconds = best_of(ctx.repeats, lambda: draw(frames))
+            results[f"viewport_{width}x{height}_frame_us"] = metric(seconds / frames * 1e6, "us", False)
+
+        # 大きさが変わってから、静的レイヤーを作り直して先のシーンの準備が終わるまで
+        def resize(size):
+            pygame.display.set_mode(size, pygame.RESIZABLE)
+            started = time.perf_counter()
+            main.resize_display(scenes)
+            main.draw_frame(scene, (0, 0), 10 ** 9)
+            first = time.perf_counter() - started
+            main.warmup.wait()
+            return first, time.perf_counter() - started
+        first, total = min(resize(size) for size in [(1280, 720), (1600, 900), (1280, 720)][:ctx.repeats])
+    finally:
+        main.set_display_mode()
+    results["viewport_resize_first_frame_ms"] = metric(first * 1000, "ms", False)
+    results["viewport_resize_rebuild_ms"] = metric(total * 1000, "ms", False)
+    return results
+
+
+@benchmark
+def bench_first_visit(ctx):
+    import main
+
+    # 数百シーンのストーリー（先読みですべて収まる大きさ）
+    scenes = main.open_scenes(ctx.scene_file(300))
+    sample = list(scenes)
+
+    # 各シーンを初めて表示するフレームの時間（ミリ秒）
+    def visit_all():
+        times = []
+        for scene in sample:
+            started = time.perf_counter()
+            main.current_scene = scene.index
+            main.scene_items.load_scene_items(scene.index, scene)
+            main.compositor.invalidate()
+            main.draw_frame(scene, (0, 0), 10 ** 9)
+            times.append((time.perf_counter() - started) * 1000)
+        return times
+
+    main.text_layouts.clear()
+    main.fonts.clear()
+    cold = visit_all()
+
+    main.text_layouts.clear()
+    main.fonts.clear()
+    main.warmup.start(scenes, scenes.start)
+    main.warmup.wait()
+    warm = visit_all()
+
+    return {
+        "first_visit_cold_max_ms": metric(max(cold), "ms", False),
+        "first_visit_cold_mean_ms": metric(sum(cold) / len(cold), "ms", False),
+        "first_visit_warm_max_ms": metric(max(warm), "ms", False),
+        "first_visit_warm_mean_ms": metric(sum(warm) / len(warm), "ms", False),
+    }
+
+
+@benchmark
+def bench_bundle(ctx):
+    import pygame
+    import main
+    from assets import AssetManager
+    from bundle import AssetBundle, build_bundle
+    from scene_graph import load_scene_graph
+
+    # 背景画像つきのストーリー（画像は表示する大きさより大きい PNG）
+    rng = random.Random(4)
+    names = []
+    for i in range(20):
+        image = pygame.Surface((1024, 768))
+        image.fill([rng.randrange(256) for _ in range(3)])
+        for _ in range(50):
+            pygame.draw.circle(image, [rng.randrange(256) for _ in range(3)],
+                               (rng.randrange(1024), rng.randrange(768)), rng.randrange(10, 200))
+        names.append(f"bg_{i}.png")
+        pygame.image.save(image, os.path.join(ctx.tmpdir, names[-1]))
+    scenes = generate_scenes(1000, seed=4)
+    for i, scene in enumerate(scenes.values()):
+        scene["background"] = names[i % len(names)]
+    scene_file = write_scenes(os.path.join(ctx.tmpdir, "bundle_scenes.json"), scenes)
+    bundle_file = build_bundle(scene_file, os.path.join(ctx.tmpdir, "story.advpak"))
+    size = (main.WIDTH, main.GAME_HEIGHT)
+
+    # 起動してすべての背景を1回ずつ画面に貼るまで
+    def from_files():
+        load_scene_graph(scene_file)
+        loader = AssetManager(base_dir=ctx.tmpdir)
+        for name in names:
+            main.screen.blit(loader.load_now(name, size), (0, 0))
+        loader.shutdown()
+
+    def from_bundle():
+        bundle = AssetBundle(bundle_file)
+        bundle.scenes()
+        for name in names:
+            main.screen.blit(bundle.image(name, size), (0, 0))
+        bundle.close()
+
+    return {
+        "startup_files_seconds": metric(best_of(ctx.repeats, from_files), "s", False),
+        "startup_bundle_seconds": metric(best_of(ctx.repeats, from_bundle), "s", False),
+    }
+
+
+@benchmark
+def bench_hot_reload(ctx):
+    from hot_reload import SceneReloader
+
+    size = ctx.sizes[-1]
+    path = os.path.join(ctx.tmpdir, f"reload_{size}.json")
+    shutil.copyfile(ctx.scene_file(size), path)
+    reloader = SceneReloader(path)
+    with open(path, "r", encoding="utf-8") as file:
+        text = file.read()
+    # 真ん中あたりのシーンの本文を1行だけ書き換えて再読み込みする
+    scene_id = f"scene_{size // 2}"
+    position = text.index('"text": "', text.index(f'"{scene_id}": {{')) + len('"text": "')
+
+    times = []
+    for i in range(ctx.repeats):
+        text = text[:position] + str(i) + text[position:]
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.utime(path, ns=(i + 1, i + 1))  # 同じ時刻に書いた場合も変更として扱われるように
+        result = reloader.poll()
+        assert result and len(result.changed) == 1
+        times.append(result.seconds)
+    return {f"hot_reload_{size}_seconds": metric(min(times), "s", False)}
+
+
+@benchmark
+def bench_analyze(ctx):
+    from analyze import analyze
+
+    size = ctx.analyze_size
+    scenes = generate_scenes(size, text_length=0, items=1, seed=5)
+    seconds = best_of(ctx.repeats, lambda: analyze(scenes, end_scenes=["scene_1"]))
+    return {f"analyze_{size}_scenes_per_second": metric(size / seconds, "scenes/s", True)}
+
+
+@benchmark
+def bench_handle_click(ctx):
+    from game_state import GameState
+    from items import SceneItems
+    from scene_graph import compile_scene
+
+    data = generate_scenes(1, items=200, seed=2)["start"]
+    data["choices"] = []
+    scene = compile_scene(0, "start", data, {"start": 0}, None)
+    rng = random.Random(3)
+    positions = [(rng.randrange(0, 800), rng.randrange(100, 500)) for _ in range(ctx.clicks)]
+
+    def click_all():
+        scene_items = SceneItems()
+        scene_items.load_scene_items(0, scene)
+        game_state = GameState()
+        for pos in positions:
+            scene_items.handle_click(0, pos, game_state)
+    seconds = best_of(ctx.repeats, click_all)
+    return {"handle_click_ns": metric(seconds / len(positions) * 1e9, "ns", False)}
+
+
+@benchmark
+def bench_save_load(ctx):
+    from game_state import GameState
+    from game_utils import load_game, save_game
+    from save_journal import SaveJournal
+
+    game_state = GameState()
+    game_state.add_item("古い地図")
+    for i in range(100):
+        game_state.set_flag(f"flag_{i}", i)
+    path = os.path.join(ctx.tmpdir, "bench_save.json")
+    count = 50
+
+    def save_all():
+        for i in range(count):
+            save_game(f"scene_{i}", game_state, path)
+    save_seconds = best_of(ctx.repeats, save_all)
+
+    def load_all():
+        for _ in range(count):
+            load_game(path)
+    load_seconds = best_of(ctx.repeats, load_all)
+
+    prefix = os.path.join(ctx.tmpdir, "bench_journal")
+    records = 2000
+
+    def journal_all():
+        journal = SaveJournal(prefix, resume=False)
+        for i in range(records):
+            journal.record_scene(f"scene_{i}")
+            journal.record_flag("gold", i)
+        journal.flush()
+        journal.close()
+    journal_seconds = best_of(ctx.repeats, journal_all)
+
+    return {
+        "save_game_per_second": metric(count / save_seconds, "saves/s", True),
+        "load_game_per_second": metric(count / load_seconds, "loads/s", True),
+        "save_journal_records_per_second": metric(2 * records / journal_seconds, "records/s", True),
+    }
+
+
+# 条件の検査に使う名前・値
+CONDITION_FLAGS = ("gold", "talked", "level", "name", "unused")
+CONDITION_ITEMS = ("古い地図", "光る石", "赤キノコ")
+FLAG_VALUES = (None, True, False, 0, 1, 3, 10, 2.5, -1, "abc")
+
+
+def random_condition(rng, depth=0):
+    kind = rng.choice(("has_item", "has_flag", "compare", "compare", "not", "and", "or")
+                      if depth < 3 else ("has_item", "has_flag", "compare"))
+    if kind == "has_item":
+        return {"type": kind, "item": rng.choice(CONDITION_ITEMS)}
+    if kind == "has_flag":
+        return {"type": kind, "flag": rng.choice(CONDITION_FLAGS)}
+    if kind == "compare":
+        return {"type": kind, "flag": rng.choice(CONDITION_FLAGS), "op": rng.choice(("==", "!=", "<", "<=", ">", ">=")),
+                "value": rng.choice((0, 1, 3, 10, 2.5, -1, True))}
+    if kind == "not":
+        return {"type": kind, "condition": random_condition(rng, depth + 1)}
+    return {"type": kind, "conditions": [random_condition(rng, depth + 1) for _ in range(rng.randrange(4))]}
+
+
+# 比較できない値（文字列と数値の大小比較）は check_condition と同じく TypeError を返す
+def evaluate_or_error(fn):
+    try:
+        return bool(fn())
+    except TypeError:
+        return TypeError
+
+
+@benchmark
+def bench_conditions(ctx):
+    from conditions import BatchEvaluator, BatchStates, Symbols, batch_supported, compile_condition
+    from engine import random_playthroughs
+    from game_state import GameState
+    from game_utils import check_condition
+    from scene_graph import Choice, compile_scenes
+
+    # コンパイル済みの判定関数・一括評価が、check_condition と同じ結果になるかを乱数の状態で調べる
+    rng = random.Random(11)
+    symbols = Symbols()
+    conditions = [random_condition(rng) for _ in range(200)]
+    tests = [compile_condition(condition, symbols) for condition in conditions]
+    states = []
+    for _ in range(ctx.condition_states):
+        # フラグは条件のコンパイル後に設定する（比較で使われていない名前や型も混ぜる）
+        state = GameState(symbols, capacity=None)
+        for name in rng.sample(CONDITION_ITEMS, rng.randrange(len(CONDITION_ITEMS) + 1)):
+            state.add_item(name)
+        for name in CONDITION_FLAGS + (f"extra_{rng.randrange(5)}",):
+            for _ in range(rng.randrange(3)):
+                state.set_flag(name, rng.choice(FLAG_VALUES))
+        states.append(state)
+
+    mismatches = 0
+    expected = []
+    for condition, test in zip(conditions, tests):
+        row = [evaluate_or_error(lambda: check_condition(condition, state)) for state in states]
+        mismatches += sum(evaluate_or_error(lambda: test(state)) != want for state, want in zip(states, row))
+        expected.append(row)
+
+    results = {}
+    if batch_supported():
+        choices = [Choice("", 0, condition) for condition in conditions]
+        evaluated = BatchEvaluator(symbols).evaluate(choices, BatchStates.from_states(states, symbols))
+        # 比較できない組み合わせ（TypeError）は、一括評価では偽になるので比べない
+        mismatches += sum(want is not TypeError and bool(got) != want
+                          for row, got_row in zip(expected, evaluated) for want, got in zip(row, got_row))
+
+        # シミュレーションで一括評価を使っても、使わない場合と同じプレイになるか
+        scenes = generate_scenes(30, text_length=0, items=1, seed=12)
+        scene_rng = random.Random(13)
+        for scene in scenes.values():
+            for choice in scene["choices"]:
+                if scene_rng.random() < 0.5:
+                    choice["condition"] = {"type": "has_item", "item": scene_rng.choice(
+                        [item["name"] for data in scenes.values() for item in data["items"]])}
+        graph = compile_scenes(scenes)
+        paths = [[session.path for session in random_playthroughs(
+                     graph, random.Random(14), 500, max_steps=50, end_scenes=["scene_1"],
+                     evaluator=evaluator, min_batch=1)]
+                 for evaluator in (None, BatchEvaluator(graph.symbols))]
+        mismatches += sum(a != b for a, b in zip(*paths))
+
+    results["condition_mismatches"] = metric(mismatches, "count", False, limit=0)
+
+    state = states[0]
+    seconds = best_of(ctx.repeats, lambda: [test(state) for test in tests])
+    results["compiled_condition_ns"] = metric(seconds / len(tests) * 1e9, "ns", False)
+    return results
+
+
+# ベンチマークの実行条件
+class Context:
+    def __init__(self, tmpdir, quick=False, repeats=3):
+        self.tmpdir = tmpdir
+        self.quick = quick
+        self.repeats = repeats
+        self.sizes = (100, 1000) if quick else (100, 1000, 10000)
+        self.frames = 300 if quick else 2000
+        self.clicks = 2000 if quick else 20000
+        self.analyze_size = 100000 if quick else 1000000
+        self.condition_states = 200 if quick else 2000
+        self._scene_files = {}
+
+    def scene_file(self, size):
+        path = self._scene_files.get(size)
+        if path is None:
+            path = os.path.join(self.tmpdir, f"scenes_{size}.json")
+            write_scenes(path, generate_scenes(size, seed=size))
+            self._scene_files[size] = path
+        return path
+
+
+def run_benchmarks(names, quick=False, repeats=3):
+    tmpdir = tempfile.mkdtemp(prefix="adv_bench_")
+    try:
+        ctx = Context(tmpdir, quick, repeats)
+        results = {}
+        for name in names:
+            print(f"[{name}]", file=sys.stderr)
+            results.update(BENCHMARKS[name](ctx))
+        return results
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+# 基準と比べて、しきい値を超えて悪くなった項目を返す関数
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if not base["value"]:
+            # 基準が 0 の項目（1フレームあたりの Surface の数など）は、少しでも増えたら悪化とする
+            if not current["higher_is_better"] and current["value"] > 0:
+                regressions.append((name, base["value"], current["value"], float("inf")))
+            continue
+        if current["higher_is_better"]:
+            change = (base["value"] - current["value"]) / base["value"]
+        else:
+            change = (current["value"] - base["value"]) / base["value"]
+        if change > threshold:
+            regressions.append((name, base["value"], current["value"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="描画・ロジックのベンチマーク")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="実行するベンチマーク")
+    parser.add_argument("--quick", action="store_true", help="小さい条件で手早く実行する")
+    parser.add_argument("--repeats", type=int, default=3, help="各計測の繰り返し回数（最良値を使う）")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--baseline", help="比較する基準の結果ファイル")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="基準よりこの割合を超えて悪くなったら失敗にする（既定は 0.10）")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    results = run_benchmarks(names, args.quick, args.repeats)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+    for name, result in results.items():
+        print(f"{name:<45} {result['value']:>16.4f} {result['unit']}")
+
+    failed = False
+    for name, result in results.items():
+        if "limit" in result and result["value"] > result["limit"]:
+            print(f"上限超過: {name} {result['value']:.4f} > {result['limit']}")
+            failed = True
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, current, change in regressions:
+            print(f"悪化: {name} {base:.4f} → {current:.4f}（{change:+.1%}）")
+        if regressions:
+            failed = True
+        else:
+            print(f"基準からの悪化はありません（しきい値 {args.threshold:.0%}）")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
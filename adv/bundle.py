@@ -0,0 +1,279 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+# 画面を使わずにパックするため、pygame を読み込む前にダミーのドライバを指定する
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from scene_graph import SceneGraphError, compile_scenes
+from scene_store import SceneStore, encode_index
+
+# アセットバンドル
+# シーンデータと画像を1つのファイルにまとめる。画像は表示する大きさに拡大縮小したうえで、
+# 画面と同じバイト順（BGRA）の生のピクセルとして保存しておき、実行時はファイルをメモリマップして
+# pygame.image.frombuffer でそのまま Surface にする（デコード・コピーなし、ページは使われたときに読まれる）
+# 画像の名前はシーンファイルに書かれたとおり（相対パス）で引くので、フォルダごと移動しても動く
+#
+#   python bundle.py scenes.json -o story.advpak --image bird_fukurou_run.png=150x150
+#   python main.py --bundle story.advpak
+#
+# ファイルの形式
+#   ヘッダー: マジック, バージョン, エントリー数, 文字列表の位置, 文字列表の長さ
+#   エントリー: 種類, フラグ, 名前の位置, 名前の長さ, データの位置, データの長さ, 幅, 高さ
+#   文字列表: エントリーの名前を UTF-8 で並べたもの
+#   データ: エントリーごとにページ境界にそろえて並べる
+# シーンは scenes.json と同じ JSON と、scene_store.py と同じ形式の索引を入れておき、
+# 実行時はメモリマップの上で必要なシーンだけをデコードする（起動時にストーリー全体をデコードしない）
+
+BUNDLE_MAGIC = b"ADVP"
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct("<4sBIQQ")
+BUNDLE_ENTRY = struct.Struct("<BBIIQQII")
+BUNDLE_EXTENSION = ".advpak"
+
+# エントリーの種類
+SCENES = 1
+IMAGE = 2
+SCENE_INDEX = 3  # SCENES の索引（ない古いバンドルは起動時にすべてデコードする）
+
+# エントリーのフラグ
+HAS_ALPHA = 1
+
+PIXEL_FORMAT = "BGRA"  # 32ビットの画面（XRGB8888 / ARGB8888）と同じバイト順
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+
+# 背景画像の既定の大きさ（main.py の WIDTH × GAME_HEIGHT）
+BACKGROUND_SIZE = (800, 520)
+
+
+class BundleError(ValueError):
+    pass
+
+
+# ---- パック ----
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# 画像を読み込んで size に拡大縮小し、(生のピクセル, 大きさ, アルファがあるか) を返す
+# 拡大縮小は AssetManager と同じ pygame.transform.scale なので、ファイルから読んだ場合と同じ見た目になる
+def encode_image(path, size):
+    image = pygame.image.load(path)
+    if size is not None and image.get_size() != tuple(size):
+        image = pygame.transform.scale(image, size)
+    return (pygame.image.tobytes(image, PIXEL_FORMAT), image.get_size(),
+            bool(image.get_flags() & pygame.SRCALPHA))
+
+
+# バンドルを書き出す関数
+# images は (名前, 画像ファイルのパス, 大きさ) の並び
+def write_bundle(output_path, scene_data, images):
+    entries = []  # (種類, フラグ, 名前, データ, 幅, 高さ)
+    scenes_json = json.dumps(scene_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    entries.append((SCENES, 0, "scenes", scenes_json, 0, 0))
+    entries.append((SCENE_INDEX, 0, "scenes.idx", encode_index(scenes_json), 0, 0))
+    for name, path, size in images:
+        pixels, (width, height), has_alpha = encode_image(path, size)
+        entries.append((IMAGE, HAS_ALPHA if has_alpha else 0, name, pixels, width, height))
+
+    names = [entry[2].encode("utf-8") for entry in entries]
+    strings_offset = BUNDLE_HEADER.size + BUNDLE_ENTRY.size * len(entries)
+    strings_size = sum(len(name) for name in names)
+    records = []
+    name_offset = 0
+    data_offset = _align(strings_offset + strings_size)
+    for (kind, flags, _, data, width, height), name in zip(entries, names):
+        records.append(BUNDLE_ENTRY.pack(kind, flags, name_offset, len(name), data_offset, len(data),
+                                         width, height))
+        name_offset += len(name)
+        data_offset = _align(data_offset + len(data))
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries), strings_offset, strings_size))
+        file.write(b"".join(records))
+        file.write(b"".join(names))
+        for entry in entries:
+            file.seek(_align(file.tell()))
+            file.write(entry[3])
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+# "幅x高さ" を (幅, 高さ) にする
+def parse_size(text):
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"大きさは 幅x高さ で指定してください: {text}")
+    return width, height
+
+
+# "名前=幅x高さ" を (名前, (幅, 高さ)) にする（大きさを省略した場合は元の大きさ）
+def parse_image(text):
+    name, _, size = text.partition("=")
+    return name, parse_size(size) if size else None
+
+
+# シーンファイルと追加の画像からバンドルを作る関数
+# 画像の名前は base_dir（既定はシーンファイルのフォルダ）からの相対パスとして探す
+def build_bundle(scene_file, output_path, images=(), background_size=BACKGROUND_SIZE, base_dir=None):
+    with open(scene_file, "r", encoding="utf-8") as file:
+        scene_data = json.load(file)
+    compile_scenes(scene_data)  # 遷移先の誤りなどはパックする前に見つける
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.abspath(scene_file))
+
+    wanted = {}  # (名前, 大きさ): None（順番を保つため辞書を使う）
+    for scene in scene_data.values():
+        if scene.get("background"):
+            wanted[(scene["background"], background_size)] = None
+    for name, size in images:
+        wanted[(name, size)] = None
+
+    resolved = []
+    for name, size in wanted:
+        path = os.path.join(base_dir, name)
+        if not os.path.exists(path):
+            raise BundleError(f"画像がありません: {name}（{path}）")
+        resolved.append((name, path, size))
+    return write_bundle(output_path, scene_data, resolved)
+
+
+# ---- 実行時の読み込み ----
+
+# メモリマップしたバンドル
+class AssetBundle:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < BUNDLE_HEADER.size:
+            raise BundleError(f"バンドルではありません: {path}")
+        magic, version, count, strings_offset, _ = BUNDLE_HEADER.unpack_from(self._data, 0)
+        if magic != BUNDLE_MAGIC:
+            raise BundleError(f"バンドルではありません: {path}")
+        if version != BUNDLE_VERSION:
+            raise BundleError(f"対応していないバンドルのバージョンです: {version}")
+
+        self._scenes = None  # (データの位置, 長さ)
+        self._scene_index = None  # (データの位置, 長さ)
+        self._images = {}  # (名前, (幅, 高さ)): (フラグ, データの位置, 長さ)
+        self._sizes = {}  # 名前: 最初に見つかった大きさ（大きさを指定しない取得用）
+        for i in range(count):
+            kind, flags, name_offset, name_length, offset, length, width, height = BUNDLE_ENTRY.unpack_from(
+                self._data, BUNDLE_HEADER.size + i * BUNDLE_ENTRY.size)
+            if offset + length > len(self._data):
+                raise BundleError(f"バンドルが途中で切れています: {path}")
+            if kind == SCENES:
+                self._scenes = (offset, length)
+            elif kind == SCENE_INDEX:
+                self._scene_index = (offset, length)
+            elif kind == IMAGE:
+                start = strings_offset + name_offset
+                name = self._data[start:start + name_length].decode("utf-8")
+                self._images[(name, (width, height))] = (flags, offset, length)
+                self._sizes.setdefault(name, (width, height))
+        self._surfaces = {}  # (名前, 大きさ): Surface（中身はメモリマップを直接指す）
+
+    def __contains__(self, name):
+        return name in self._sizes
+
+    def __len__(self):
+        return len(self._images)
+
+    def has_image(self, name, size=None):
+        return self._image_key(name, size) in self._images
+
+    def _image_key(self, name, size):
+        return name, tuple(size) if size is not None else self._sizes.get(name)
+
+    # 画像を Surface として返す（ない場合は None）
+    def image(self, name, size=None):
+        key = self._image_key(name, size)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            return surface
+        entry = self._images.get(key)
+        if entry is None:
+            return None
+        flags, offset, length = entry
+        surface = pygame.image.frombuffer(memoryview(self._data)[offset:offset + length], key[1], PIXEL_FORMAT)
+        if not flags & HAS_ALPHA:
+            surface.set_alpha(None)  # 不透明な画像はアルファなしで貼り付ける（convert() したものと同じ速さ）
+        self._surfaces[key] = surface
+        return surface
+
+    # 入っている中でいちばん大きい画像（別の大きさに拡大縮小する元にする、ない場合は None）
+    def largest_image(self, name):
+        sizes = [size for image_name, size in self._images if image_name == name]
+        if not sizes:
+            return None
+        return self.image(name, max(sizes, key=lambda size: size[0] * size[1]))
+
+    # シーンデータ（辞書）
+    def scene_data(self):
+        if self._scenes is None:
+            raise BundleError(f"バンドルにシーンがありません: {self.path}")
+        offset, length = self._scenes
+        return json.loads(self._data[offset:offset + length])
+
+    # シーン（索引がある場合はメモリマップの上で遅延読み込みする scene_store.SceneStore）
+    def scenes(self, start="start"):
+        if self._scenes is None or self._scene_index is None:
+            return compile_scenes(self.scene_data(), start)
+        offset, length = self._scenes
+        index_offset, index_length = self._scene_index
+        view = memoryview(self._data)
+        return SceneStore.from_buffers(view[offset:offset + length],
+                                       view[index_offset:index_offset + index_length], start, name=self.path)
+
+    def stats(self):
+        return {
+            "images": len(self._images),
+            "surfaces": len(self._surfaces),
+            "bytes": len(self._data),
+        }
+
+    def close(self):
+        self._surfaces.clear()
+        try:
+            self._data.close()
+        except BufferError:
+            return  # まだ使われている Surface がある場合は、参照がなくなったときに閉じられる
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シーンと画像を1つのバンドルにまとめる")
+    parser.add_argument("scenes", help="シーンファイル")
+    parser.add_argument("-o", "--output", help=f"出力するバンドル（既定はシーンファイルの拡張子を {BUNDLE_EXTENSION} にしたもの）")
+    parser.add_argument("--image", action="append", type=parse_image, default=[], metavar="NAME[=WxH]",
+                        help="シーン以外で使う画像（例: bird_fukurou_run.png=150x150）")
+    parser.add_argument("--background-size", type=parse_size, default=BACKGROUND_SIZE, metavar="WxH",
+                        help="背景画像の大きさ（既定は 800x520）")
+    parser.add_argument("--base", help="画像を探すフォルダ（既定はシーンファイルのフォルダ）")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.scenes)[0] + BUNDLE_EXTENSION
+    pygame.init()
+    try:
+        build_bundle(args.scenes, output, args.image, args.background_size, args.base)
+    except (BundleError, SceneGraphError, OSError, pygame.error) as e:
+        print(f"バンドルを作れませんでした: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    bundle = AssetBundle(output)
+    print(f"{output}: シーン {len(bundle.scene_data())}、画像 {len(bundle)}、{os.path.getsize(output)} バイト")
+    bundle.close()
+
+
+if __name__ == "__main__":
+    main()
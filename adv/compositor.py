@@ -0,0 +1,73 @@
+import pygame
+
+# ダーティ矩形方式の画面合成
+# シーンごとに変わらない内容（背景・タイトル・本文・アイテム）は静的レイヤーに一度だけ描いておき、
+# ボタンなどの動的な要素は状態が変わったときだけ描き直して、変わった矩形だけを画面に送る
+
+
+class Compositor:
+    def __init__(self, screen):
+        self.static_builds = 0
+        self.resize(screen)
+
+    # 画面の大きさが変わったときに呼ぶ（静的レイヤーを作り直し、次のフレームですべて描き直す）
+    def resize(self, screen):
+        self.screen = screen
+        self.static_layer = pygame.Surface(screen.get_size()).convert()
+        self._static_key = None
+        self._widgets = {}  # 名前: (矩形, 状態)
+        self._dirty = []
+
+    # 静的レイヤーを用意する（key が変わったときだけ build(surface) で描き直す）
+    def set_static(self, key, build):
+        if key == self._static_key:
+            return
+        self._static_key = key
+        self.static_builds += 1
+        build(self.static_layer)
+        self.screen.blit(self.static_layer, (0, 0))
+        # 静的レイヤーを描き直したので動的な要素もすべて描き直す
+        self._widgets.clear()
+        self._dirty = [self.screen.get_rect()]
+
+    # 動的な要素を更新する（前回と状態が同じなら何もしない）
+    def update_widget(self, name, rect, state, draw):
+        rect = pygame.Rect(rect)
+        previous = self._widgets.get(name)
+        if previous is not None and previous == (rect, state):
+            return False
+
+        # 前回の描画範囲を静的レイヤーで元に戻してから描き直す
+        if previous is not None and previous[0] != rect:
+            self._restore(previous[0])
+        self._restore(rect)
+        draw(self.screen)
+        self._widgets[name] = (rect, state)
+        return True
+
+    # 動的な要素を消す
+    def remove_widget(self, name):
+        previous = self._widgets.pop(name, None)
+        if previous is not None:
+            self._restore(previous[0])
+
+    # names に含まれない動的な要素を消す（シーンに存在しなくなった要素の後片付け）
+    def retain_widgets(self, names):
+        for name in [n for n in self._widgets if n not in names]:
+            self.remove_widget(name)
+
+    def _restore(self, rect):
+        rect = rect.clip(self.screen.get_rect())
+        if rect.width and rect.height:
+            self.screen.blit(self.static_layer, rect, rect)
+            self._dirty.append(rect)
+
+    # 静的レイヤーを破棄する（次の set_static で必ず描き直す）
+    def invalidate(self):
+        self._static_key = None
+
+    # 変わった矩形だけを画面に送る
+    def present(self):
+        if self._dirty:
+            pygame.display.update(self._dirty)
+            self._dirty = []
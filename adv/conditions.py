@@ -0,0 +1,251 @@
+import operator
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # 一括評価を使わなければ NumPy は不要
+    np = None
+
+# 条件のコンパイル
+# 選択肢の条件（辞書）を、コンパクトな状態（フラグ・アイテムはビット、数値は配列）に対する
+# 判定関数に前もって変換しておく。判定のたびに "type" の文字列で分岐しなくてよい
+#
+# 条件の例:
+#   {"type": "has_item", "item": "古い地図"}
+#   {"type": "has_flag", "flag": "talked_to_villager"}
+#   {"type": "not", "condition": {...}}
+#   {"type": "and", "conditions": [{...}, {...}]}
+#   {"type": "or", "conditions": [{...}, {...}]}
+#   {"type": "compare", "flag": "gold", "op": ">=", "value": 10}
+
+COMPARE_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class ConditionError(ValueError):
+    pass
+
+
+# 新しい名前の割り当てを直列にするロック
+# シーンの遅延読み込みでは、先読みのスレッドとメインスレッドが同時にシーンをコンパイルすることがあり、
+# 同じ番号を2つの名前に割り当ててしまわないようにする（Symbols を pickle できるようにモジュールで1つ持つ）
+_assign_lock = threading.Lock()
+
+
+def _assign(table, name, make):
+    with _assign_lock:
+        value = table.get(name)
+        if value is None:
+            value = table[name] = make(len(table))
+    return value
+
+
+# フラグ名・アイテム名・数値フラグ名をビット位置や番号に割り当てる表
+class Symbols:
+    def __init__(self):
+        self.flags = {}  # フラグ名: ビット
+        self.items = {}  # アイテム名: ビット
+        self.values = {}  # 数値フラグ名: 番号
+
+    def flag_bit(self, name):
+        bit = self.flags.get(name)
+        if bit is None:
+            bit = _assign(self.flags, name, lambda count: 1 << count)
+        return bit
+
+    def item_bit(self, name):
+        bit = self.items.get(name)
+        if bit is None:
+            bit = _assign(self.items, name, lambda count: 1 << count)
+        return bit
+
+    def value_slot(self, name):
+        slot = self.values.get(name)
+        if slot is None:
+            slot = _assign(self.values, name, lambda count: count)
+        return slot
+
+
+# 条件判定用のコンパクトな状態（ゲームでは game_state.GameState がこれを継承して使う）
+class ConditionState:
+    __slots__ = ("flags", "items", "values")
+
+    def __init__(self, flags=0, items=0, values=None):
+        self.flags = flags  # 立っているフラグのビット
+        self.items = items  # 持っているアイテムのビット
+        self.values = values if values is not None else []  # 比較に使うフラグの値（番号順）
+
+    def value(self, slot):
+        return self.values[slot] if slot < len(self.values) else 0
+
+    def set_flag(self, symbols, name, value=True):
+        bit = symbols.flag_bit(name)
+        if value:
+            self.flags |= bit
+        else:
+            self.flags &= ~bit
+        # 比較用の番号は値の型によらず割り当て、check_condition と同じく値をそのまま持つ
+        # （True/False は 1/0 として比べられ、文字列などは == / != だけが意味を持つ）
+        slot = symbols.value_slot(name)
+        if slot >= len(self.values):
+            self.values.extend([0] * (slot + 1 - len(self.values)))
+        self.values[slot] = value
+
+    # インベントリを置き換える（names はアイテム名の並び）
+    def set_items(self, symbols, names):
+        items = 0
+        for name in names:
+            items |= symbols.item_bit(name)
+        self.items = items
+
+
+# 条件を判定関数にコンパイルする関数
+def compile_condition(condition, symbols):
+    kind = condition.get("type")
+
+    if kind == "has_item":
+        bit = symbols.item_bit(condition["item"])
+        return lambda state: state.items & bit != 0
+
+    if kind == "has_flag":
+        bit = symbols.flag_bit(condition["flag"])
+        return lambda state: state.flags & bit != 0
+
+    if kind == "not":
+        inner = compile_condition(condition["condition"], symbols)
+        return lambda state: not inner(state)
+
+    if kind == "and":
+        parts = tuple(compile_condition(c, symbols) for c in condition["conditions"])
+        return lambda state: all(part(state) for part in parts)
+
+    if kind == "or":
+        parts = tuple(compile_condition(c, symbols) for c in condition["conditions"])
+        return lambda state: any(part(state) for part in parts)
+
+    if kind == "compare":
+        op = _compare_op(condition)
+        slot = symbols.value_slot(condition["flag"])
+        value = condition["value"]
+        return lambda state: op(state.value(slot), value)
+
+    raise ConditionError(f"不明な条件タイプです: {kind}")
+
+
+def _compare_op(condition):
+    op = COMPARE_OPS.get(condition.get("op", "=="))
+    if op is None:
+        raise ConditionError(f"不明な比較演算子です: {condition.get('op')}")
+    return op
+
+
+# 条件を満たす選択肢だけを返す関数（scene_graph でコンパイル済みの選択肢用）
+def available_choices(choices, state):
+    return [choice for choice in choices if choice.test is None or choice.test(state)]
+
+
+# 多数の状態をまとめて持つ配列（一括評価用、フラグ・アイテムはそれぞれ64個まで）
+class BatchStates:
+    def __init__(self, flags, items, values):
+        self.flags = flags  # uint64 配列 (N,)
+        self.items = items  # uint64 配列 (N,)
+        self.values = values  # float64 配列 (N, 数値フラグ数)
+
+    def __len__(self):
+        return len(self.flags)
+
+    @classmethod
+    def from_states(cls, states, symbols):
+        _require_numpy()
+        if len(symbols.flags) > 64 or len(symbols.items) > 64:
+            raise ConditionError("一括評価で扱えるフラグ・アイテムはそれぞれ64個までです")
+        values = np.zeros((len(states), len(symbols.values)), dtype=np.float64)
+        for i, state in enumerate(states):
+            if state.values:
+                values[i, :len(state.values)] = [_as_number(value) for value in state.values]
+        return cls(np.fromiter((s.flags for s in states), dtype=np.uint64, count=len(states)),
+                   np.fromiter((s.items for s in states), dtype=np.uint64, count=len(states)),
+                   values)
+
+
+# 一括評価では数値フラグを float64 で持つので、数値以外（文字列など）は NaN にする
+# NaN は == では常に偽、!= では常に真になり、数値と比べた場合の check_condition の結果と同じになる
+def _as_number(value):
+    return value if isinstance(value, (int, float)) else float("nan")
+
+
+def _numeric_value(condition):
+    value = condition["value"]
+    if not isinstance(value, (int, float)):
+        raise ConditionError(f"一括評価では数値以外との比較はできません: {value!r}")
+    return value
+
+
+# 一括評価を使えるか（NumPy があるか）
+def batch_supported():
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("条件の一括評価には NumPy が必要です（pip install numpy）")
+
+
+# 条件を配列用の判定関数にコンパイルする関数（結果は bool 配列）
+def compile_batch_condition(condition, symbols):
+    _require_numpy()
+    kind = condition.get("type")
+
+    if kind == "has_item":
+        bit = np.uint64(symbols.item_bit(condition["item"]))
+        return lambda batch: (batch.items & bit) != 0
+
+    if kind == "has_flag":
+        bit = np.uint64(symbols.flag_bit(condition["flag"]))
+        return lambda batch: (batch.flags & bit) != 0
+
+    if kind == "not":
+        inner = compile_batch_condition(condition["condition"], symbols)
+        return lambda batch: ~inner(batch)
+
+    if kind in ("and", "or"):
+        parts = tuple(compile_batch_condition(c, symbols) for c in condition["conditions"])
+        reduce = np.logical_and.reduce if kind == "and" else np.logical_or.reduce
+        empty = kind == "and"
+        return lambda batch: (reduce([part(batch) for part in parts]) if parts
+                              else np.full(len(batch), empty))
+
+    if kind == "compare":
+        op = _compare_op(condition)
+        slot = symbols.value_slot(condition["flag"])
+        value = _numeric_value(condition)
+        return lambda batch: (op(batch.values[:, slot], value) if slot < batch.values.shape[1]
+                              else np.full(len(batch), op(0, value)))
+
+    raise ConditionError(f"不明な条件タイプです: {kind}")
+
+
+# 1つのシーンの選択肢を多数の状態に対してまとめて評価するクラス
+class BatchEvaluator:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self._compiled = {}  # 選択肢: 配列用の判定関数
+
+    # 結果は (選択肢の数, 状態の数) の bool 配列
+    def evaluate(self, choices, batch):
+        _require_numpy()
+        result = np.ones((len(choices), len(batch)), dtype=bool)
+        for i, choice in enumerate(choices):
+            if choice.condition is None:
+                continue
+            test = self._compiled.get(choice)
+            if test is None:
+                test = self._compiled[choice] = compile_batch_condition(choice.condition, self.symbols)
+            result[i] = test(batch)
+        return result
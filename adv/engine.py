@@ -0,0 +1,239 @@
+from collections import Counter
+
+from conditions import BatchStates, ConditionError, available_choices
+from game_state import GameState
+from history import History
+from items import SceneItems
+
+# 画面を使わないゲームエンジン
+# 選択肢の選択・アイテムのクリックといった操作を明示的に与えてセッションを進める
+# （大量の自動プレイでストーリーを検証するため）
+
+# 操作の種類
+PICK_CHOICE = "choice"
+CLICK_ITEM = "item"
+
+
+# 1人分のプレイ状態（scenes はコンパイル済みのシーングラフ）
+# history_depth を指定すると、その数までシーン遷移を巻き戻せる
+class GameSession:
+    def __init__(self, scenes, start_scene=None, history_depth=None):
+        self.scenes = scenes
+        self.state = GameState(scenes.symbols)  # インベントリ・フラグ（条件判定にもそのまま使う）
+        self.scene_items = SceneItems()
+        self.history = None
+        if history_depth is not None:
+            self.history = History(max_depth=history_depth)
+            self.state.history = self.history
+            self.scene_items.history = self.history
+        self.current_scene = None
+        self.path = []  # 訪れたシーン番号（順番どおり）
+        self.pickups = []  # 拾ったアイテム名
+        self.steps = 0
+        self.enter(scenes.start if start_scene is None else scenes.index[start_scene])
+
+    # 現在のシーン
+    def scene(self):
+        return self.scenes[self.current_scene]
+
+    def enter(self, scene_index):
+        self.current_scene = scene_index
+        self.path.append(scene_index)
+        self.scene_items.load_scene_items(scene_index, self.scenes[scene_index])
+        if self.history is not None:
+            self.history.begin_step(scene_index)
+
+    # steps 回前のシーン遷移の時点に戻る（戻ったシーン番号、戻れない場合は None）
+    def rewind(self, steps=1):
+        if self.history is None:
+            return None
+        result = self.history.rewind(self.state, self.scene_items, steps)
+        if result is None:
+            return None
+        self.current_scene = result[0]
+        return self.current_scene
+
+    # 現在選べる選択肢
+    def choices(self):
+        return available_choices(self.scene().choices, self.state)
+
+    def set_flag(self, flag, value=True):
+        self.state.set_flag(flag, value)
+
+    # 現在クリックできるアイテム
+    def items(self):
+        return self.scene_items.available_items(self.current_scene)
+
+    # 現在とれる操作の一覧
+    def actions(self):
+        return ([(PICK_CHOICE, i) for i in range(len(self.choices()))] +
+                [(CLICK_ITEM, i) for i in range(len(self.items()))])
+
+    def pick_choice(self, index):
+        return self.follow(self.choices()[index])
+
+    # 選択肢を選ぶ（選べるかどうかは呼び出し側で判定済みのもの）
+    def follow(self, choice):
+        self.steps += 1
+        self.enter(choice.next)
+        return choice.next
+
+    def click_item(self, index):
+        return self._take(self.items()[index])
+
+    def _take(self, clickable_item):
+        # 交換すると同じ枠に手放したアイテムが入るので、先に取り出しておく
+        item = clickable_item.item
+        self.steps += 1
+        self.scene_items.take(self.current_scene, clickable_item, self.state)
+        self.pickups.append(item.name)
+        return item
+
+    # 座標でアイテムをクリックする（画面上のクリックと同じ判定）
+    def click_at(self, pos):
+        clickable_item = self.scene_items.hit(self.current_scene, pos)
+        if clickable_item is None:
+            return None
+        return self._take(clickable_item)
+
+    def step(self, action):
+        kind, index = action
+        if kind == PICK_CHOICE:
+            return self.pick_choice(index)
+        if kind == CLICK_ITEM:
+            return self.click_item(index)
+        raise ValueError(f"不明な操作です: {kind}")
+
+
+# 終了シーンIDの集合をシーン番号の集合に変換する関数
+def end_indices(scenes, end_scenes):
+    return frozenset(scenes.index[scene_id] for scene_id in end_scenes if scene_id in scenes.index)
+
+
+# ランダムに操作を選んで1回プレイする関数
+def random_playthrough(scenes, rng, max_steps=200, end_scenes=("ending",), start_scene=None):
+    session = GameSession(scenes, start_scene)
+    end = end_indices(scenes, end_scenes)
+    while session.steps < max_steps and session.current_scene not in end:
+        actions = session.actions()
+        if not actions:
+            break
+        session.step(rng.choice(actions))
+    return session
+
+
+# 多数のプレイを同時に1手ずつ進める関数（戻り値は runs 個のセッション）
+# evaluator（conditions.BatchEvaluator）を渡すと、同じシーンにいるプレイが min_batch 以上あるときに
+# そのシーンの選択肢の条件を NumPy でまとめて評価する。判定の結果は選択肢ごとの評価と同じなので、
+# evaluator の有無で乱数の使い方もプレイ結果も変わらない
+def random_playthroughs(scenes, rng, runs, max_steps=200, end_scenes=("ending",), start_scene=None,
+                        evaluator=None, min_batch=32):
+    sessions = [GameSession(scenes, start_scene) for _ in range(runs)]
+    end = end_indices(scenes, end_scenes)
+    unbatchable = set()  # 一括評価できない条件（数値以外との比較など）を含むシーン番号
+    active = [session for session in sessions if session.current_scene not in end]
+    while active:
+        choices = _active_choices(scenes, active, evaluator, min_batch, unbatchable)
+        still_active = []
+        for session, session_choices in zip(active, choices):
+            if session.steps >= max_steps:
+                continue
+            items = session.items()
+            count = len(session_choices) + len(items)
+            if not count:
+                continue
+            pick = rng.randrange(count)
+            if pick < len(session_choices):
+                session.follow(session_choices[pick])
+            else:
+                session._take(items[pick - len(session_choices)])
+            if session.current_scene not in end:
+                still_active.append(session)
+        active = still_active
+    return sessions
+
+
+# 各セッションで選べる選択肢を求める（条件のあるシーンにいるセッションはシーンごとにまとめて評価する）
+def _active_choices(scenes, sessions, evaluator, min_batch, unbatchable):
+    result = [None] * len(sessions)
+    groups = {}  # シーン番号: そのシーンにいるセッションの位置
+    for position, session in enumerate(sessions):
+        scene = scenes[session.current_scene]
+        if (evaluator is None or scene.index in unbatchable
+                or all(choice.test is None for choice in scene.choices)):
+            result[position] = available_choices(scene.choices, session.state)
+        else:
+            groups.setdefault(scene.index, []).append(position)
+
+    for scene_index, positions in groups.items():
+        scene = scenes[scene_index]
+        if len(positions) >= min_batch:
+            try:
+                batch = BatchStates.from_states([sessions[p].state for p in positions], scenes.symbols)
+                mask = evaluator.evaluate(scene.choices, batch)
+            except ConditionError:
+                unbatchable.add(scene_index)
+            else:
+                # 判定結果が同じセッションは、同じ選択肢のリストを共有する
+                lists = {}
+                for row, position in zip(map(tuple, mask.T.tolist()), positions):
+                    found = lists.get(row)
+                    if found is None:
+                        found = lists[row] = [choice for choice, ok in zip(scene.choices, row) if ok]
+                    result[position] = found
+                continue
+        for position in positions:
+            result[position] = available_choices(scene.choices, sessions[position].state)
+    return result
+
+
+# 決められた操作の列で1回プレイする関数
+def scripted_playthrough(scenes, actions, start_scene=None):
+    session = GameSession(scenes, start_scene)
+    for action in actions:
+        session.step(action)
+    return session
+
+
+# 複数回のプレイ結果の集計
+class PlaythroughStats:
+    def __init__(self):
+        self.runs = 0
+        self.finished = 0  # 終了シーンにたどり着いた回数
+        self.scene_reach = Counter()  # シーンID: そのシーンに到達したプレイ数
+        self.path_lengths = Counter()  # 手数: プレイ数
+        self.item_pickups = Counter()  # アイテム名: 拾われた回数
+
+    def add(self, session, end_scenes=("ending",)):
+        self.runs += 1
+        if session.current_scene in end_indices(session.scenes, end_scenes):
+            self.finished += 1
+        ids = session.scenes.ids
+        self.scene_reach.update(ids[i] for i in set(session.path))
+        self.path_lengths[session.steps] += 1
+        self.item_pickups.update(session.pickups)
+
+    def merge(self, other):
+        self.runs += other.runs
+        self.finished += other.finished
+        self.scene_reach.update(other.scene_reach)
+        self.path_lengths.update(other.path_lengths)
+        self.item_pickups.update(other.item_pickups)
+        return self
+
+    def mean_path_length(self):
+        if not self.runs:
+            return 0.0
+        return sum(length * count for length, count in self.path_lengths.items()) / self.runs
+
+    def to_dict(self):
+        return {
+            "runs": self.runs,
+            "finished": self.finished,
+            "mean_path_length": self.mean_path_length(),
+            "min_path_length": min(self.path_lengths, default=0),
+            "max_path_length": max(self.path_lengths, default=0),
+            "scene_reach": dict(self.scene_reach.most_common()),
+            "path_lengths": dict(sorted(self.path_lengths.items())),
+            "item_pickups": dict(self.item_pickups.most_common()),
+        }
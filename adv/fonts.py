@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pygame
+
+# フォントの管理
+# 日本語フォントのパスは一度だけ探して結果をキャッシュファイルに保存し、次回からは探さずに使う（見つからなかった場合は毎回探す）
+# 各サイズのフォントは最初に使われたときに開き、描画した文字列のサーフェスはすべてのサイズで
+# 共有する LRU キャッシュに保持する（同じラベルを毎フレーム描画し直さない）
+# SDL_ttf のフォントはスレッドセーフではないので、フォントを使う処理はすべて registry.lock の中で行う
+#
+# フォントは次の順で決める: configure() で指定したパス → 環境変数 ADV_FONT → キャッシュ → 候補を順に確認
+
+# 日本語フォントの候補（macOS, Windows, Linux）
+CJK_FONT_CANDIDATES = (
+    "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc",
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",
+    "C:/Windows/Fonts/msgothic.ttc",
+    "C:/Windows/Fonts/meiryo.ttc",
+    "C:/Windows/Fonts/YuGothM.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+    "/usr/share/fonts/truetype/takao-gothic/TakaoGothic.ttf",
+    "/usr/share/fonts/truetype/ipafont-gothic/ipag.ttf",
+)
+
+
+def default_cache_file():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "adv", "font.json")
+
+
+def _surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+# 日本語フォントのパスを探す関数（見つからない場合は None）
+def find_cjk_font(candidates=CJK_FONT_CANDIDATES):
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+# 最初に使われたときに開くフォント（pygame.font.Font と同じように使える）
+class LazyFont:
+    def __init__(self, registry, size):
+        self.registry = registry
+        self.size_px = size
+        self._font = None
+
+    @property
+    def font(self):
+        if self._font is None:
+            with self.registry.lock:
+                if self._font is None:
+                    self._font = self.registry.open(self.size_px)
+        return self._font
+
+    # 描画結果は共有キャッシュから返す（返したサーフェスは書き換えないこと）
+    def render(self, text, antialias, color, background=None):
+        return self.registry.render(self, text, antialias, color, background)
+
+    def size(self, text):
+        font = self.font
+        with self.registry.lock:
+            return font.size(text)
+
+    def get_height(self):
+        return self.font.get_height()
+
+    def get_linesize(self):
+        return self.font.get_linesize()
+
+    def __getattr__(self, name):
+        return getattr(self.font, name)
+
+
+class FontRegistry:
+    def __init__(self, cache_file=None, max_surfaces=8192, max_bytes=64 * 1024 * 1024):
+        self.cache_file = cache_file or default_cache_file()
+        self.max_surfaces = max_surfaces
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.lock = threading.RLock()
+        self._path = None
+        self._resolved = False
+        self._configured = None
+        self._fonts = {}  # サイズ: LazyFont
+        self._surfaces = OrderedDict()  # (サイズ, 文字列, アンチエイリアス, 色, 背景色): Surface
+        self.hits = 0
+        self.misses = 0
+
+    # フォントのパスを指定する（フォントを開く前に呼ぶ）
+    def configure(self, path):
+        self._configured = path
+        self._resolved = False
+
+    # サイズごとのフォント（開くのは最初に使われたとき）
+    def get(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts[size] = LazyFont(self, size)
+        return font
+
+    @property
+    def path(self):
+        if not self._resolved:
+            self._path = self._resolve()
+            self._resolved = True
+            if self._path is None:
+                print("日本語フォントが見つかりませんでした。デフォルトフォントを使用します。")
+        return self._path
+
+    def _resolve(self):
+        path = self._configured or os.environ.get("ADV_FONT")
+        if path:
+            return path if os.path.isfile(path) else None
+
+        cached = self._read_cache()
+        if cached is not None and cached.get("candidates") == list(CJK_FONT_CANDIDATES):
+            path = cached.get("path")
+            if path is not None and os.path.isfile(path):
+                return path
+
+        # 見つからなかったことは記録しない（後からフォントを入れた場合に次の起動で使えるように、毎回探し直す）
+        path = find_cjk_font()
+        if path is not None:
+            self._write_cache(path)
+        return path
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, path):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_path = self.cache_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"path": path, "candidates": list(CJK_FONT_CANDIDATES)}, file, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except OSError:
+            pass  # キャッシュできなくても次回探し直すだけ
+
+    # フォントを開く（開けない場合はデフォルトのフォント）
+    def open(self, size):
+        path = self.path
+        if path is not None:
+            try:
+                return pygame.font.Font(path, size)
+            except (OSError, pygame.error):
+                print(f"フォントを開けませんでした: {path}")
+        return pygame.font.Font(None, size)
+
+    def render(self, font, text, antialias, color, background=None):
+        key = (font.size_px, text, antialias, tuple(color),
+               tuple(background) if background is not None else None)
+        with self.lock:
+            surface = self._surfaces.get(key)
+            if surface is not None:
+                self._surfaces.move_to_end(key)
+                self.hits += 1
+                return surface
+            self.misses += 1
+            surface = self.render_direct(font, text, antialias, color, background)
+            self._surfaces[key] = surface
+            self.nbytes += _surface_bytes(surface)
+            while len(self._surfaces) > 1 and (len(self._surfaces) > self.max_surfaces or
+                                               self.nbytes > self.max_bytes):
+                _, evicted = self._surfaces.popitem(last=False)
+                self.nbytes -= _surface_bytes(evicted)
+            return surface
+
+    # キャッシュを通さずに描画する（別のキャッシュで保持する長いテキストの行など）
+    def render_direct(self, font, text, antialias, color, background=None):
+        real_font = font.font
+        with self.lock:
+            if background is None:
+                return real_font.render(text, antialias, color)
+            return real_font.render(text, antialias, color, background)
+
+    # キャッシュ済みかどうか（LRUの順番は変えない）
+    def is_cached(self, font, text, antialias, color, background=None):
+        return (font.size_px, text, antialias, tuple(color),
+                tuple(background) if background is not None else None) in self._surfaces
+
+    # sizes 以外の大きさのフォントと、その大きさで描画したサーフェスを手放す
+    # （ウィンドウの大きさを変えるたびに新しい大きさのフォントが開かれたままにならないようにする）
+    def retain(self, sizes):
+        sizes = set(sizes)
+        with self.lock:
+            for size in [size for size in self._fonts if size not in sizes]:
+                del self._fonts[size]
+            for key in [key for key in self._surfaces if key[0] not in sizes]:
+                self.nbytes -= _surface_bytes(self._surfaces.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self._surfaces.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "path": self._path,
+            "opened": sorted(size for size, font in self._fonts.items() if font._font is not None),
+            "surfaces": len(self._surfaces),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
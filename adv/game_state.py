@@ -0,0 +1,184 @@
+import sys
+
+from conditions import ConditionState, Symbols
+from items import Item
+
+# ゲームの状態
+# インベントリ・フラグを1つの型で持ち、画面・シーン内アイテム・条件判定・セーブで共有する
+# 条件判定用のビット（conditions.ConditionState の flags/items/values）も同時に更新するので、
+# コンパイル済みの条件はこの状態に対してそのまま評価できる
+# クリックのクールダウンなど画面の操作に関するタイミングは UITimers に分けてあり、セーブしない
+# history（history.History）を設定すると、インベントリ・フラグを変える前に記録する
+
+# アイテム名だけで追加した場合の色
+DEFAULT_ITEM_COLOR = (200, 200, 200)
+
+
+# インベントリの容量を超えて追加しようとした場合のエラー
+class InventoryFull(Exception):
+    pass
+
+
+class GameState(ConditionState):
+    __slots__ = ("symbols", "capacity", "inventory", "flag_values", "history")
+
+    def __init__(self, symbols=None, capacity=1):
+        super().__init__()
+        self.symbols = symbols if symbols is not None else Symbols()
+        self.capacity = capacity  # 持てるアイテムの数（None は無制限）
+        self.inventory = {}  # アイテム名: Item（拾った順）
+        self.flag_values = {}  # フラグ名: 値
+        self.history = None  # 巻き戻し用の履歴
+
+    # インベントリ・フラグを空にする（symbols を指定するとその表に切り替える）
+    def reset(self, symbols=None):
+        if symbols is not None:
+            self.symbols = symbols
+        self.inventory.clear()
+        self.flag_values.clear()
+        self.flags = 0
+        self.items = 0
+        self.values = []
+
+    # 別の表（読み込み直したシーンの symbols など）に合わせてビットを作り直す
+    def bind(self, symbols):
+        self.symbols = symbols
+        self.items = 0
+        for name in self.inventory:
+            self.items |= symbols.item_bit(name)
+        self.flags = 0
+        self.values = []
+        for name, value in self.flag_values.items():
+            ConditionState.set_flag(self, symbols, name, value)
+
+    # ---- インベントリ ----
+
+    def has_item(self, name):
+        return name in self.inventory
+
+    def is_full(self):
+        return self.capacity is not None and len(self.inventory) >= self.capacity
+
+    # 最後に拾ったアイテム（なければ None）
+    @property
+    def current_item(self):
+        return next(reversed(self.inventory.values()), None)
+
+    # アイテムを追加する（既に持っている場合は何もしない、容量を超える場合は InventoryFull）
+    def add_item(self, item):
+        if isinstance(item, str):
+            item = Item(item, DEFAULT_ITEM_COLOR)
+        if item.name in self.inventory:
+            return False
+        if self.is_full():
+            raise InventoryFull(f"インベントリがいっぱいです（{self.capacity}個まで）")
+        if self.history is not None:
+            self.history.record_inventory(self)
+        self.inventory[sys.intern(item.name)] = item
+        self.items |= self.symbols.item_bit(item.name)
+        return True
+
+    def remove_item(self, name):
+        if self.history is not None and name in self.inventory:
+            self.history.record_inventory(self)
+        item = self.inventory.pop(name, None)
+        if item is not None:
+            self.items &= ~self.symbols.item_bit(name)
+        return item
+
+    # アイテムを拾う（いっぱいの場合は最初に拾ったアイテムと入れ替えて、手放したアイテムを返す）
+    # 同じ名前のアイテムを持っている場合はそれと入れ替える
+    def collect(self, item):
+        if self.history is not None:
+            self.history.record_inventory(self)
+        dropped = self.inventory.pop(item.name, None)
+        if dropped is None and self.is_full() and self.inventory:
+            dropped = self.remove_item(next(iter(self.inventory)))
+        self.inventory[sys.intern(item.name)] = item
+        self.items |= self.symbols.item_bit(item.name)
+        return dropped
+
+    # インベントリを items（Item の並び）に置き換える
+    def set_inventory(self, items):
+        if self.history is not None:
+            self.history.record_inventory(self)
+        self.inventory.clear()
+        self.items = 0
+        for item in items:
+            self.inventory[sys.intern(item.name)] = item
+            self.items |= self.symbols.item_bit(item.name)
+
+    # ---- フラグ ----
+
+    def flag(self, name, default=False):
+        return self.flag_values.get(name, default)
+
+    # フラグを設定する（None は削除）
+    def set_flag(self, name, value=True):
+        name = sys.intern(name)
+        if self.history is not None:
+            self.history.record_flag(self, name)
+        if value is None:
+            self.flag_values.pop(name, None)
+            self.flags &= ~self.symbols.flag_bit(name)
+            slot = self.symbols.values.get(name)
+            if slot is not None and slot < len(self.values):
+                self.values[slot] = 0
+            return
+        self.flag_values[name] = value
+        ConditionState.set_flag(self, self.symbols, name, value)
+
+    # ---- セーブ用 ----
+
+    # JSON にできるコンパクトな形にする（アイテムは [名前, 色] の並び）
+    def to_data(self):
+        return {
+            "capacity": self.capacity,
+            "inventory": [[item.name, list(item.color)] for item in self.inventory.values()],
+            "flags": dict(self.flag_values),
+        }
+
+    # to_data の形から作る（inventory がアイテム名や名前のリストだった以前のセーブも読める）
+    @classmethod
+    def from_data(cls, data, symbols=None, capacity=None):
+        state = cls(symbols)
+        inventory = data.get("inventory") or []
+        if isinstance(inventory, str):
+            inventory = [inventory]
+        if capacity is None:
+            capacity = data.get("capacity", max(len(inventory), 1))
+        state.capacity = capacity
+        for entry in inventory:
+            if isinstance(entry, str):
+                state.add_item(entry)
+            else:
+                name, color = entry
+                state.add_item(Item(name, tuple(color)))
+        for name, value in (data.get("flags") or {}).items():
+            state.set_flag(name, value)
+        return state
+
+
+# 画面の操作に関するタイミング（ミリ秒、セーブしない）
+class UITimers:
+    __slots__ = ("last_click_time", "scene_transition_time", "click_cooldown", "scene_cooldown")
+
+    def __init__(self, click_cooldown=300, scene_cooldown=500):
+        self.last_click_time = 0  # 最後のクリック時間
+        self.scene_transition_time = 0  # シーン遷移時間
+        self.click_cooldown = click_cooldown  # クリック間隔
+        self.scene_cooldown = scene_cooldown  # シーン遷移後の待機時間
+
+    def reset(self):
+        self.last_click_time = 0
+        self.scene_transition_time = 0
+
+    # クールダウン中でないか
+    def is_clickable(self, current_time):
+        return (current_time - self.last_click_time > self.click_cooldown and
+                current_time - self.scene_transition_time > self.scene_cooldown)
+
+    # クールダウンが切れる時刻
+    def cooldown_end_time(self):
+        return max(self.last_click_time + self.click_cooldown,
+                   self.scene_transition_time + self.scene_cooldown)
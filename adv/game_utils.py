@@ -1,20 +1,160 @@
+import copy
 import json
 import os
 
-# ゲームの状態を保存する関数
+from conditions import COMPARE_OPS
+from game_state import GameState
+
+# デフォルトのシーン（scenes.json が見つからない場合に使う、アイテム付き）
+DEFAULT_SCENES = {
+    "start": {
+        "text": "冒険の始まり。あなたは森の入り口に立っています。地面に光る石が落ちています。どうしますか？",
+        "choices": [
+            {"text": "森に入る", "next": "forest"},
+            {"text": "村に戻る", "next": "village"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "光る石", "color": [100, 150, 255], "x": 100, "y": 200, "width": 60, "height": 30}
+        ]
+    },
+    "forest": {
+        "text": "深い森の中に入りました。木々が密集していて、少し不気味です。前方に小道が見えます。木の根元に赤いキノコが生えています。",
+        "choices": [
+            {"text": "小道を進む", "next": "path"},
+            {"text": "森の入り口に戻る", "next": "start"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "赤キノコ", "color": [255, 100, 100], "x": 150, "y": 250, "width": 50, "height": 40}
+        ]
+    },
+    "village": {
+        "text": "村に戻ってきました。村人たちが日常の生活を送っています。井戸の近くに古いコインが落ちています。",
+        "choices": [
+            {"text": "宿屋に行く", "next": "inn"},
+            {"text": "森に向かう", "next": "start"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "古いコイン", "color": [255, 255, 100], "x": 200, "y": 180, "width": 40, "height": 40}
+        ]
+    },
+    "path": {
+        "text": "小道を進むと、古い小屋が見えてきました。道端に緑の宝石が輝いています。",
+        "choices": [
+            {"text": "小屋に入る", "next": "cabin"},
+            {"text": "森に戻る", "next": "forest"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "緑の宝石", "color": [100, 255, 100], "x": 300, "y": 220, "width": 45, "height": 35}
+        ]
+    },
+    "inn": {
+        "text": "宿屋に入りました。暖かい暖炉と美味しそうな食事の匂いがします。テーブルの上に銀のスプーンがあります。",
+        "choices": [
+            {"text": "食事をする", "next": "eat"},
+            {"text": "村に戻る", "next": "village"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "銀スプーン", "color": [200, 200, 200], "x": 250, "y": 190, "width": 55, "height": 25}
+        ]
+    },
+    "cabin": {
+        "text": "小屋の中は埃っぽく、長い間誰も住んでいないようです。テーブルの上に古い地図があります。",
+        "choices": [
+            {"text": "地図を調べる", "next": "map"},
+            {"text": "小屋を出る", "next": "path"}
+        ],
+        "background": None,
+        "items": [
+            {"name": "古い地図", "color": [139, 69, 19], "x": 180, "y": 160, "width": 70, "height": 50}
+        ]
+    },
+    "eat": {
+        "text": "美味しい食事を取りました。体力が回復した気がします。",
+        "choices": [
+            {"text": "宿屋を出る", "next": "village"}
+        ],
+        "background": None,
+        "items": []
+    },
+    "map": {
+        "text": "地図には宝の在り処が記されているようです！冒険の新たな目標ができました。",
+        "choices": [
+            {"text": "地図を持って小屋を出る", "next": "path_with_map"}
+        ],
+        "background": None,
+        "items": []
+    },
+    "path_with_map": {
+        "text": "地図を手に入れて森の小道に戻りました。これからどこへ向かいますか？",
+        "choices": [
+            {"text": "地図に従って進む", "next": "treasure"},
+            {"text": "森に戻る", "next": "forest"}
+        ],
+        "background": None,
+        "items": []
+    },
+    "treasure": {
+        "text": "地図に従って進むと、古代の遺跡にたどり着きました。入り口には謎めいた文字が刻まれています。",
+        "choices": [
+            {"text": "遺跡に入る", "next": "ruins"},
+            {"text": "森に戻る", "next": "forest"}
+        ],
+        "background": None,
+        "items": []
+    },
+    "ruins": {
+        "text": "遺跡の中は神秘的な光に満ちています。中央には宝箱が置かれています。",
+        "choices": [
+            {"text": "宝箱を開ける", "next": "ending"},
+            {"text": "遺跡を出る", "next": "treasure"}
+        ],
+        "background": None,
+        "items": []
+    },
+    "ending": {
+        "text": "宝箱を開けると、まばゆい光が溢れ出しました。あなたは伝説の宝を手に入れました！冒険は成功です！",
+        "choices": [
+            {"text": "もう一度プレイする", "next": "start"}
+        ],
+        "background": None,
+        "items": []
+    }
+}
+
+# シーンデータの読み込み
+def load_scenes(file_path="scenes.json"):
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        # デフォルトのシーンを返す（アイテム付き）
+        return copy.deepcopy(DEFAULT_SCENES)
+
+
+# ゲームの状態（game_state.GameState）を保存する関数（画面操作のタイミングは保存しない）
 def save_game(current_scene, game_state, save_file="save.json"):
     save_data = {
         "current_scene": current_scene,
-        "game_state": game_state
+        "game_state": game_state.to_data()
     }
     
-    with open(save_file, "w", encoding="utf-8") as file:
-        json.dump(save_data, file, ensure_ascii=False, indent=4)
+    # 一時ファイルに書いてから置き換える（書き込み中に落ちても元のセーブは壊れない）
+    tmp_file = save_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as file:
+        json.dump(save_data, file, ensure_ascii=False, separators=(",", ":"))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, save_file)
     
     return True
 
-# ゲームの状態を読み込む関数
-def load_game(save_file="save.json"):
+# ゲームの状態を読み込む関数（symbols はシーンの条件で使う表、戻り値は (シーン, GameState)）
+def load_game(save_file="save.json", symbols=None):
     if not os.path.exists(save_file):
         return None, None
     
@@ -22,8 +162,9 @@ def load_game(save_file="save.json"):
         with open(save_file, "r", encoding="utf-8") as file:
             save_data = json.load(file)
         
-        return save_data.get("current_scene"), save_data.get("game_state")
-    except:
+        return save_data.get("current_scene"), GameState.from_data(save_data.get("game_state") or {}, symbols)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"セーブデータを読み込めませんでした: {save_file} ({e})")
         return None, None
 
 # シーンエディタ - 新しいシーンを追加/編集する関数
@@ -37,8 +178,11 @@ def edit_scene(scenes, scene_id, text, choices, background=None):
 
 # シーンをファイルに保存する関数
 def save_scenes(scenes, file_path="scenes.json"):
-    with open(file_path, "w", encoding="utf-8") as file:
+    # 一時ファイルに書いてから置き換える（ホットリロード中のゲームが書きかけのファイルを読まないように）
+    tmp_file = file_path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as file:
         json.dump(scenes, file, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, file_path)
     
     return True
 
@@ -47,8 +191,10 @@ def process_conditional_choices(choices, game_state):
     valid_choices = []
     
     for choice in choices:
+        # シーンデータの辞書、またはコンパイル済みの選択肢（scene_graph.Choice）
+        condition = choice.get("condition") if isinstance(choice, dict) else choice.condition
         # 条件がない場合、または条件が満たされている場合
-        if "condition" not in choice or check_condition(choice["condition"], game_state):
+        if condition is None or check_condition(condition, game_state):
             valid_choices.append(choice)
     
     return valid_choices
@@ -59,30 +205,36 @@ def check_condition(condition, game_state):
     # または {"type": "has_flag", "flag": "talked_to_villager"}
     
     if condition["type"] == "has_item":
-        return condition["item"] in game_state.get("inventory", [])
+        return game_state.has_item(condition["item"])
     
     elif condition["type"] == "has_flag":
-        return game_state.get("flags", {}).get(condition["flag"], False)
+        return game_state.flag(condition["flag"])
+    
+    # 複合条件: {"type": "not", "condition": {...}}、{"type": "and"/"or", "conditions": [...]}
+    elif condition["type"] == "not":
+        return not check_condition(condition["condition"], game_state)
     
-    # その他の条件タイプを追加可能
+    elif condition["type"] == "and":
+        return all(check_condition(c, game_state) for c in condition["conditions"])
+    
+    elif condition["type"] == "or":
+        return any(check_condition(c, game_state) for c in condition["conditions"])
+    
+    # 数値の比較: {"type": "compare", "flag": "gold", "op": ">=", "value": 10}
+    elif condition["type"] == "compare":
+        value = game_state.flag(condition["flag"], 0)
+        return COMPARE_OPS[condition.get("op", "==")](value, condition["value"])
+    
+    # その他の条件タイプを追加可能（conditions.py のコンパイラにも追加すること）
     
     return False
 
-# アイテムを追加する関数
+# アイテムを追加する関数（item は Item またはアイテム名、容量を超える場合は game_state.InventoryFull）
 def add_item(game_state, item):
-    if "inventory" not in game_state:
-        game_state["inventory"] = []
-    
-    if item not in game_state["inventory"]:
-        game_state["inventory"].append(item)
-    
+    game_state.add_item(item)
     return game_state
 
 # フラグを設定する関数
 def set_flag(game_state, flag, value=True):
-    if "flags" not in game_state:
-        game_state["flags"] = {}
-    
-    game_state["flags"][flag] = value
-    
+    game_state.set_flag(flag, value)
     return game_state
@@ -0,0 +1,108 @@
+from collections import deque
+
+# 巻き戻し（バックログ）用の履歴
+# シーン遷移ごとに1ステップを作り、そのステップ中に初めて変わるものだけ変わる前の値を記録する
+#   インベントリ: ステップ開始時の中身（容量ぶんのアイテムだけなので小さい）
+#   フラグ: 変わる前の値（なかった場合は None）
+#   シーン内アイテムの枠: 変わる前のアイテム（枠ごと取り除かれた場合も戻す）
+# 同じものが何度変わっても記録は最初の1回だけなので、1ステップの大きさは触れたものの数で決まり、
+# ゲームの状態全体をコピーすることはない。ステップは max_depth まで保持し、古いものから捨てる
+#
+# GameState と SceneItems の history に設定すると、変更の前に記録が呼ばれる
+
+_UNSET = object()
+
+
+# 1回のシーン遷移と、その遷移先で起きた変更を元に戻すための記録
+class HistoryStep:
+    __slots__ = ("scene", "inventory", "flags", "slots")
+
+    def __init__(self, scene):
+        self.scene = scene  # 遷移先のシーン番号
+        self.inventory = _UNSET  # ステップ開始時のインベントリ（変わっていなければ _UNSET）
+        self.flags = None  # フラグ名: 変わる前の値
+        self.slots = None  # ClickableItem: (シーン番号, 変わる前のアイテム)
+
+
+class History:
+    def __init__(self, max_depth=1000):
+        self.max_depth = max_depth
+        self._steps = deque(maxlen=max_depth + 1)  # 先頭は戻り先としてだけ使う
+
+    def __len__(self):
+        return len(self._steps)
+
+    # 戻れるステップ数
+    @property
+    def depth(self):
+        return max(len(self._steps) - 1, 0)
+
+    def clear(self):
+        self._steps.clear()
+
+    # 訪れたシーン番号（古い順、保持しているステップの分だけ）
+    def scenes(self):
+        return [step.scene for step in self._steps]
+
+    # ---- 記録（変更の前に呼ばれる） ----
+
+    # シーンに入ったときに呼ぶ
+    def begin_step(self, scene):
+        self._steps.append(HistoryStep(scene))
+
+    def _current(self):
+        return self._steps[-1] if self._steps else None
+
+    def record_inventory(self, game_state):
+        step = self._current()
+        if step is not None and step.inventory is _UNSET:
+            step.inventory = tuple(game_state.inventory.values())
+
+    def record_flag(self, game_state, name):
+        step = self._current()
+        if step is None:
+            return
+        if step.flags is None:
+            step.flags = {}
+        if name not in step.flags:
+            step.flags[name] = game_state.flag_values.get(name)
+
+    def record_slot(self, scene_id, clickable_item):
+        step = self._current()
+        if step is None:
+            return
+        if step.slots is None:
+            step.slots = {}
+        if clickable_item not in step.slots:
+            step.slots[clickable_item] = (scene_id, clickable_item.item)
+
+    # ---- 巻き戻し ----
+
+    # steps ステップ前まで戻す（戻れる分だけ）
+    # 戻り先のシーン番号と、変わったシーン番号・フラグ名を返す（戻れない場合は None）
+    def rewind(self, game_state, scene_items, steps=1):
+        steps = min(steps, self.depth)
+        if steps <= 0:
+            return None
+        touched_scenes = set()
+        touched_flags = set()
+        # 元に戻す変更は記録しない
+        state_history, items_history = game_state.history, scene_items.history
+        game_state.history = scene_items.history = None
+        try:
+            for _ in range(steps):
+                step = self._steps.pop()
+                if step.slots:
+                    for clickable_item, (scene_id, item) in step.slots.items():
+                        scene_items.put_back(scene_id, clickable_item, item)
+                        touched_scenes.add(scene_id)
+                if step.flags:
+                    for name, value in step.flags.items():
+                        game_state.set_flag(name, value)
+                        touched_flags.add(name)
+                if step.inventory is not _UNSET:
+                    game_state.set_inventory(step.inventory)
+        finally:
+            game_state.history = state_history
+            scene_items.history = items_history
+        return self._steps[-1].scene, touched_scenes, touched_flags
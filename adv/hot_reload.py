@@ -0,0 +1,310 @@
+import bisect
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+from game_utils import DEFAULT_SCENES
+from scene_graph import SceneGraphError, compile_scene, compile_scenes
+
+# シーンファイルの再読み込み（ホットリロード）
+# ファイルのサイズと更新時刻を見て、変わったときだけ読み込み直す
+# 前回の内容とバイト列の先頭・末尾から比べて変わった範囲を求め、その範囲にあるシーンだけをデコード・コンパイルして
+# グラフに反映する（1行の編集なら大きなストーリーでも全体を解析し直さない）
+# シーン番号は変わらないので、変わっていないシーンのアイテムの状態やキャッシュはそのまま使える
+# 削除されたシーンは番号を空けたまま残し（シーンIDからは引けなくなる）、どこからも参照されていないことを確認する
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_COMPARE_STEP = 1 << 16
+
+
+# 再読み込みの結果
+class ReloadResult:
+    def __init__(self, changed, added, removed, seconds):
+        self.changed = changed  # [(古い Scene, 新しい Scene), ...]
+        self.added = added  # [Scene, ...]
+        self.removed = removed  # [古い Scene, ...]
+        self.seconds = seconds
+
+    def __bool__(self):
+        return bool(self.changed or self.added or self.removed)
+
+    def __str__(self):
+        return (f"シーンを再読み込みしました: 変更 {len(self.changed)}、追加 {len(self.added)}、"
+                f"削除 {len(self.removed)}（{self.seconds * 1000:.1f} ms）")
+
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+
+# pos にある「"シーンID": 値」を1つデコードして (シーンID, 値, 値の終わり) を返す
+def _decode_entry(text, pos):
+    if text[pos:pos + 1] != '"':
+        raise ValueError(f"シーンIDがありません（{pos} 文字目）")
+    key, pos = _decoder.raw_decode(text, pos)
+    pos = _skip_whitespace(text, pos)
+    if text[pos:pos + 1] != ":":
+        raise ValueError(f"':' がありません（{pos} 文字目）")
+    value, end = _decoder.raw_decode(text, _skip_whitespace(text, pos + 1))
+    return key, value, end
+
+
+# 最上位のオブジェクトのエントリーを pos から順にデコードする
+# 戻り値は [(シーンID, キーの位置, 値, 値の終わり), ...]（stop(end) が真になったエントリーで止める）
+def _decode_entries(text, pos, stop=None):
+    entries = []
+    pos = _skip_whitespace(text, pos)
+    if text[pos:pos + 1] == "}":
+        return entries
+    while True:
+        key, value, end = _decode_entry(text, pos)
+        entries.append((key, pos, value, end))
+        if stop is not None and stop(end):
+            return entries
+        pos = _skip_whitespace(text, end)
+        separator = text[pos:pos + 1]
+        if separator == "}":
+            return entries
+        if separator != ",":
+            raise ValueError(f"',' または '}}' がありません（{pos} 文字目）")
+        pos = _skip_whitespace(text, pos + 1)
+
+
+def _decode_scene_file(text):
+    pos = _skip_whitespace(text, 0)
+    if text[pos:pos + 1] != "{":
+        raise ValueError("シーンファイルの最上位がオブジェクトではありません")
+    return _decode_entries(text, pos + 1)
+
+
+# a と b の先頭から一致する長さ
+def _common_prefix(a, b):
+    limit = min(len(a), len(b))
+    low = 0
+    while low + _COMPARE_STEP <= limit and a[low:low + _COMPARE_STEP] == b[low:low + _COMPARE_STEP]:
+        low += _COMPARE_STEP
+    high = min(low + _COMPARE_STEP, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+# a と b の末尾から一致する長さ（limit 文字まで）
+def _common_suffix(a, b, limit):
+    len_a, len_b = len(a), len(b)
+    low = 0
+    while (low + _COMPARE_STEP <= limit and
+           a[len_a - low - _COMPARE_STEP:len_a - low] == b[len_b - low - _COMPARE_STEP:len_b - low]):
+        low += _COMPARE_STEP
+    high = min(low + _COMPARE_STEP, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len_a - middle:len_a - low] == b[len_b - middle:len_b - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+# デコードしたエントリーの位置（文字単位）をバイト単位に直す（base はテキストの先頭のバイト位置）
+def _byte_offsets(text, decoded, base=0):
+    if len(text) == len(text.encode("utf-8")):
+        return [(key, key_start + base, value, end + base) for key, key_start, value, end in decoded]
+    result = []
+    char_pos = 0
+    byte_pos = base
+    for key, key_start, value, end in decoded:
+        byte_pos += len(text[char_pos:key_start].encode("utf-8"))
+        key_byte = byte_pos
+        byte_pos += len(text[key_start:end].encode("utf-8"))
+        char_pos = end
+        result.append((key, key_byte, value, byte_pos))
+    return result
+
+
+class SceneReloader:
+    def __init__(self, file_path="scenes.json", start="start"):
+        self.file_path = file_path
+        self.start = start
+        self.error = None  # 最後の再読み込みで起きたエラー
+        self._failed_signature = None
+        self._signature = self._stat()
+        if self._signature is None:
+            # ファイルがない場合はデフォルトのシーン（ファイルができたら全体を読み込む）
+            self._raw = None
+            self._set_entries([])
+            self._data = copy.deepcopy(DEFAULT_SCENES)
+        else:
+            self._raw = self._read()
+            self._set_entries(self._decode_all(self._raw))
+        self.graph = compile_scenes(self._data, start)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _read(self):
+        with open(self.file_path, "rb") as file:
+            return file.read()
+
+    @staticmethod
+    def _decode_all(raw):
+        text = raw.decode("utf-8")
+        return _byte_offsets(text, _decode_scene_file(text))
+
+    # エントリーの位置（バイト単位）を記録し、シーンデータを作り直す
+    def _set_entries(self, decoded):
+        self._entries = [(key, key_start, end) for key, key_start, _, end in decoded]
+        self._ends = [end for _, _, end in self._entries]
+        self._data = {key: value for key, _, value, _ in decoded}
+
+    # ファイルが変わっていれば読み込み直して反映する（変わっていない・反映できない場合は None）
+    def poll(self):
+        signature = self._stat()
+        if signature == self._signature or signature is None:
+            return None
+        started = time.perf_counter()
+        try:
+            result = self._reload(self._read())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # 書き込み途中などで読めない場合もあるので、次の確認でまた読み直す（同じ内容のエラーは一度だけ表示）
+            if signature != self._failed_signature:
+                print(f"シーンを再読み込みできませんでした: {e}")
+            self._failed_signature = signature
+            self.error = e
+            return None
+        self._signature = signature
+        self.error = None
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def _reload(self, raw):
+        old_raw = self._raw
+        if old_raw is None or not self._entries:
+            return self._reload_all(raw)
+        if raw == old_raw:
+            return ReloadResult([], [], [], 0.0)
+
+        # 変わった範囲を求める（先頭の prefix バイトと末尾の suffix バイトは前回と同じ）
+        prefix = _common_prefix(old_raw, raw)
+        suffix = _common_suffix(old_raw, raw, min(len(old_raw), len(raw)) - prefix)
+        delta = len(raw) - len(old_raw)
+
+        # 変わった範囲を含むエントリー first 〜 last - 1 を求める（念のため直前のエントリーも含める）
+        entries = self._entries
+        ends = self._ends
+        first = max(bisect.bisect_left(ends, prefix) - 1, 0)
+        if entries[first][1] > prefix:
+            return self._reload_all(raw)  # 最初のシーンより前が変わった
+        last = max(bisect.bisect_left(ends, len(old_raw) - suffix), first) + 1
+        region_start = entries[first][1]
+
+        # その範囲だけをデコードする（範囲の区切りがずれた場合は全体を読み込み直す）
+        try:
+            if last <= len(entries):
+                region_end = ends[last - 1] + delta
+                text = raw[region_start:region_end].decode("utf-8")
+                decoded = _decode_entries(text + "}", 0)
+                if decoded and decoded[-1][3] != len(text):
+                    return self._reload_all(raw)
+            else:
+                text = raw[region_start:].decode("utf-8")
+                decoded = _decode_entries(text, 0)
+                pos = _skip_whitespace(text, decoded[-1][3] if decoded else 0)
+                if text[pos:pos + 1] != "}" or _skip_whitespace(text, pos + 1) != len(text):
+                    return self._reload_all(raw)
+        except ValueError:
+            return self._reload_all(raw)
+        decoded = _byte_offsets(text, decoded, region_start)
+        last = min(last, len(entries))
+
+        region_keys = {key for key, _, _ in entries[first:last]}
+        new_values = {}
+        for key, _, value, _ in decoded:
+            if key not in region_keys and key in self._data:
+                # 範囲の外にある同じシーンIDと重なった場合は全体を読み込み直す
+                return self._reload_all(raw)
+            new_values[key] = value
+
+        changed_ids = [key for key in new_values if key in region_keys and new_values[key] != self._data[key]]
+        added_ids = [key for key in new_values if key not in region_keys]
+        removed_ids = [key for key, _, _ in entries[first:last] if key not in new_values]
+        result = self._apply(new_values, changed_ids, added_ids, removed_ids)
+
+        # 範囲より後のエントリーは位置をずらすだけ
+        tail = entries[last:]
+        if delta:
+            tail = [(key, key_start + delta, end + delta) for key, key_start, end in tail]
+        self._entries = entries[:first] + [(key, key_start, end) for key, key_start, _, end in decoded] + tail
+        self._ends = [end for _, _, end in self._entries]
+        for key in removed_ids:
+            del self._data[key]
+        self._data.update(new_values)
+        self._raw = raw
+        return result
+
+    # ファイル全体を読み込み直して前回と比べる
+    def _reload_all(self, raw):
+        decoded = self._decode_all(raw)
+        data = {key: value for key, _, value, _ in decoded}
+        old_data = self._data
+        changed_ids = [key for key in data if key in old_data and data[key] != old_data[key]]
+        added_ids = [key for key in data if key not in old_data]
+        removed_ids = [key for key in old_data if key not in data]
+        result = self._apply(data, changed_ids, added_ids, removed_ids)
+        self._set_entries(decoded)
+        self._raw = raw
+        return result
+
+    # 変わったシーン・追加されたシーンをコンパイルしてグラフに反映する（エラーがあればグラフは変えない）
+    def _apply(self, values, changed_ids, added_ids, removed_ids):
+        graph = self.graph
+        if self.start in removed_ids:
+            raise SceneGraphError(f"開始シーン '{self.start}' がありません")
+
+        # 新しい番号の対応表（追加されたシーンは末尾の番号、削除されたシーンは引けない）
+        scene_index = graph.index
+        if added_ids or removed_ids:
+            scene_index = dict(graph.index)
+            for scene_id in removed_ids:
+                del scene_index[scene_id]
+            for offset, scene_id in enumerate(added_ids):
+                scene_index[sys.intern(scene_id)] = len(graph.ids) + offset
+
+        # 先にすべてコンパイルして検証する
+        compiled = {scene_id: compile_scene(scene_index[scene_id], sys.intern(scene_id), values[scene_id],
+                                            scene_index, graph.symbols)
+                    for scene_id in changed_ids + added_ids}
+        if removed_ids:
+            removed = {graph.index[scene_id] for scene_id in removed_ids}
+            for scene_id in scene_index:
+                scene = compiled.get(scene_id) or graph.by_id(scene_id)
+                for choice in scene.choices:
+                    if choice.next in removed:
+                        raise SceneGraphError(f"シーン '{scene_id}' の選択肢 '{choice.text}' の"
+                                              f"遷移先 '{graph.ids[choice.next]}' が削除されました")
+
+        result = ReloadResult([], [], [], 0.0)
+        for scene_id in changed_ids:
+            index = graph.index[scene_id]
+            result.changed.append((graph.scenes[index], compiled[scene_id]))
+            graph.scenes[index] = compiled[scene_id]
+        for scene_id in added_ids:
+            graph.ids.append(sys.intern(scene_id))
+            graph.scenes.append(compiled[scene_id])
+            result.added.append(compiled[scene_id])
+        for scene_id in removed_ids:
+            result.removed.append(graph.by_id(scene_id))
+        graph.index = scene_index
+        return result
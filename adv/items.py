@@ -0,0 +1,185 @@
+# シーン内のアイテム管理（描画に依存しないので pygame なしでも使える）
+
+
+# アイテムクラス
+class Item:
+    __slots__ = ("name", "color", "description")
+    
+    def __init__(self, name, color, description=""):
+        self.name = name
+        self.color = color
+        self.description = description
+    
+    def __str__(self):
+        return self.name
+
+# クリック可能なアイテムクラス
+class ClickableItem:
+    __slots__ = ("item", "rect", "is_collected", "order")
+    
+    def __init__(self, item, x, y, width, height):
+        self.item = item
+        self.rect = (x, y, width, height)
+        self.is_collected = False
+        self.order = 0  # シーン内での並び順（重なったときは前のものが優先）
+    
+    def is_clicked(self, pos):
+        x, y, width, height = self.rect
+        return (not self.is_collected and
+                x <= pos[0] < x + width and y <= pos[1] < y + height)
+
+# アイテムを収集する関数（game_state は game_state.GameState、いっぱいの場合は手放したアイテムを返す）
+def collect_item(game_state, new_item):
+    return game_state.collect(new_item)
+
+# アイテムの矩形を一定の大きさのマス目に登録し、クリック位置のマスだけを調べる格子
+class ItemGrid:
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}  # (列, 行): [ClickableItem, ...]
+    
+    def _cells(self, rect):
+        x, y, width, height = rect
+        size = self.cell_size
+        for column in range(x // size, (x + max(width, 1) - 1) // size + 1):
+            for row in range(y // size, (y + max(height, 1) - 1) // size + 1):
+                yield column, row
+    
+    def add(self, clickable_item):
+        for cell in self._cells(clickable_item.rect):
+            self.cells.setdefault(cell, []).append(clickable_item)
+    
+    def remove(self, clickable_item):
+        for cell in self._cells(clickable_item.rect):
+            members = self.cells[cell]
+            members.remove(clickable_item)
+            if not members:
+                del self.cells[cell]
+    
+    # pos にあるアイテムのうち、並び順が最も前のものを返す
+    def hit(self, pos):
+        size = self.cell_size
+        found = None
+        for clickable_item in self.cells.get((pos[0] // size, pos[1] // size), ()):
+            if clickable_item.is_clicked(pos) and (found is None or clickable_item.order < found.order):
+                found = clickable_item
+        return found
+
+# これより少ないアイテムのシーンは格子を作らず、一覧を順に調べる
+GRID_MIN_ITEMS = 8
+
+# シーンのアイテムを管理するクラス
+# 交換したアイテムは同じ枠にそのまま入れ、手放すものがない場合は枠ごと取り除くので、
+# 何度交換してもシーンのアイテム数は最初より増えない
+class SceneItems:
+    def __init__(self):
+        self.items = {}  # シーン番号: [ClickableItem, ...]（収集されていないものだけ）
+        self.grids = {}  # シーン番号: ItemGrid（アイテムが GRID_MIN_ITEMS 個以上のシーンだけ）
+        self.revision = 0  # アイテムの配置が変わるたびに増える（静的レイヤーの描き直し判定用）
+        self.history = None  # 巻き戻し用の履歴（history.History、枠を変える前に記録する）
+    
+    def _index(self, scene_id, clickable_items):
+        for order, clickable_item in enumerate(clickable_items):
+            clickable_item.order = order
+        self.items[scene_id] = clickable_items
+        if len(clickable_items) < GRID_MIN_ITEMS:
+            # 少ないアイテムは順に調べたほうが速く、格子の分のメモリも使わない（サーバーでは多数のセッションが持つ）
+            self.grids.pop(scene_id, None)
+            return
+        grid = ItemGrid()
+        for clickable_item in clickable_items:
+            grid.add(clickable_item)
+        self.grids[scene_id] = grid
+    
+    # シーン（scene_graph.Scene）のアイテムを読み込む（初めて訪れたときだけ）
+    def load_scene_items(self, scene_id, scene):
+        if scene_id not in self.items:
+            self._index(scene_id, [
+                ClickableItem(Item(spec.name, spec.color), spec.x, spec.y, spec.width, spec.height)
+                for spec in scene.items
+            ])
+    
+    def get_scene_items(self, scene_id):
+        return self.items.get(scene_id, [])
+    
+    # まだ収集されていないアイテムを返す
+    def available_items(self, scene_id):
+        return list(self.items.get(scene_id, []))
+    
+    # pos にあるアイテムを返す（なければ None）
+    def hit(self, scene_id, pos):
+        grid = self.grids.get(scene_id)
+        if grid is not None:
+            return grid.hit(pos)
+        for clickable_item in self.items.get(scene_id, ()):
+            if clickable_item.is_clicked(pos):
+                return clickable_item  # 一覧は並び順どおりなので最初に見つかったもの
+        return None
+    
+    def handle_click(self, scene_id, pos, game_state):
+        clickable_item = self.hit(scene_id, pos)
+        if clickable_item is None:
+            return False
+        self.take(scene_id, clickable_item, game_state)
+        return True
+    
+    # アイテムを収集し、古いアイテムがあった場合は同じ場所に配置する
+    def take(self, scene_id, clickable_item, game_state):
+        if self.history is not None:
+            self.history.record_slot(scene_id, clickable_item)
+        old_item = collect_item(game_state, clickable_item.item)
+        
+        if old_item:
+            # 同じ枠を使い回す（矩形は変わらないので格子もそのまま）
+            clickable_item.item = old_item
+        else:
+            clickable_item.is_collected = True
+            self.items[scene_id].remove(clickable_item)
+            grid = self.grids.get(scene_id)
+            if grid is not None:
+                grid.remove(clickable_item)
+        
+        self.revision += 1
+        return old_item
+    
+    # 枠に item を戻す（取り除かれていた場合は元の並び順の位置に戻す、巻き戻し用）
+    def put_back(self, scene_id, clickable_item, item):
+        clickable_item.item = item
+        if clickable_item.is_collected:
+            items = self.items.get(scene_id)
+            if items is None:
+                return  # シーンのアイテムを読み込み直した後なので戻す先がない
+            clickable_item.is_collected = False
+            position = 0
+            while position < len(items) and items[position].order < clickable_item.order:
+                position += 1
+            items.insert(position, clickable_item)
+            grid = self.grids.get(scene_id)
+            if grid is not None:
+                grid.add(clickable_item)
+        self.revision += 1
+    
+    # セーブ用に、シーンのアイテムを (アイテム, x, y, 幅, 高さ, 収集済み) の並びで返す
+    def entries(self, scene_id):
+        return [((c.item.name, tuple(c.item.color)),) + tuple(c.rect) + (c.is_collected,)
+                for c in self.items.get(scene_id, [])]
+    
+    # セーブから、シーンのアイテムを復元する（収集済みのものは読み飛ばす）
+    def restore(self, scene_id, entries):
+        restored = []
+        for (name, color), x, y, width, height, collected in entries:
+            if not collected:
+                restored.append(ClickableItem(Item(name, color), x, y, width, height))
+        self._index(scene_id, restored)
+        self.revision += 1
+    
+    # シーンのアイテムの状態を捨てる（次に訪れたときにシーンの定義から読み込み直す）
+    def forget(self, scene_id):
+        self.items.pop(scene_id, None)
+        self.grids.pop(scene_id, None)
+        self.revision += 1
+    
+    def clear(self):
+        self.items.clear()
+        self.grids.clear()
+        self.revision += 1
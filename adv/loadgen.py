@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from server import raise_file_limit
+
+# server.py の負荷テスト用クライアント
+# 多数の接続を開き、それぞれがセッションを始めてランダムに選択肢・アイテムを選び続ける
+# 1コマンドを送ってから応答が届くまでの時間を集計し、最後にサーバーの統計（STATS）も表示する
+#
+#   python loadgen.py --sessions 10000 --actions 20
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+
+async def _command(reader, writer, line):
+    writer.write(line.encode("utf-8") + b"\n")
+    started = time.perf_counter()
+    reply = await reader.readline()
+    elapsed = time.perf_counter() - started
+    if not reply:
+        raise ConnectionError("サーバーが切断しました")
+    return json.loads(reply), elapsed
+
+
+# 1人分のプレイ（応答時間を latencies に追加する）
+async def play(host, port, actions, rng, latencies, think):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        view, elapsed = await _command(reader, writer, "NEW")
+        latencies.append(elapsed)
+        for _ in range(actions):
+            if think:
+                await asyncio.sleep(rng.uniform(0, 2 * think))
+            if view.get("items") and rng.random() < 0.3:
+                line = f"TAKE {rng.randrange(len(view['items']))}"
+            elif view.get("choices"):
+                line = f"CHOOSE {rng.randrange(len(view['choices']))}"
+            else:
+                line = "LOOK"
+            view, elapsed = await _command(reader, writer, line)
+            latencies.append(elapsed)
+            if "error" in view:
+                raise RuntimeError(f"{line}: {view['error']}")
+        writer.write(b"QUIT\n")
+    finally:
+        writer.close()
+
+
+async def run(host, port, sessions, actions, seed, think, ramp):
+    rng = random.Random(seed)
+    latencies = []
+    tasks = []
+    started = time.perf_counter()
+    for i in range(sessions):
+        tasks.append(asyncio.create_task(
+            play(host, port, actions, random.Random(rng.random()), latencies, think)))
+        if ramp and (i + 1) % ramp == 0:
+            await asyncio.sleep(0)  # 接続を少しずつ開く（待ち受けのキューがあふれないように）
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    errors = [r for r in results if isinstance(r, BaseException)]
+
+    reader, writer = await asyncio.open_connection(host, port)
+    server_stats, _ = await _command(reader, writer, "STATS")
+    writer.close()
+
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "errors": len(errors),
+        "first_error": repr(errors[0]) if errors else None,
+        "commands": len(latencies),
+        "seconds": elapsed,
+        "commands_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "server": server_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テキストサーバーの負荷テスト")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, default=1000, help="同時に接続するセッション数")
+    parser.add_argument("--actions", type=int, default=20, help="1セッションあたりのコマンド数")
+    parser.add_argument("--think", type=float, default=0.0, help="コマンドの間の平均待ち時間（秒）")
+    parser.add_argument("--ramp", type=int, default=500, help="この数の接続ごとに他の処理に譲る")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果を JSON で書き出すファイル")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    result = asyncio.run(run(args.host, args.port, args.sessions, args.actions, args.seed,
+                             args.think, args.ramp))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if result["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
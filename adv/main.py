@@ -1,26 +1,60 @@
+import argparse
 import pygame
 import sys
-import json
 import os
+from collections import OrderedDict
+
+from assets import AssetManager
+from bundle import AssetBundle, parse_size
+from compositor import Compositor
+from conditions import available_choices
+from fonts import FontRegistry
+from game_state import GameState, UITimers
+from history import History
+from hot_reload import SceneReloader
+from scene_store import open_scenes
+from items import Item, SceneItems
+from profiler import FrameProfiler, NullProfiler
+from replay import DEFAULT_SCENE_FILE, InputRecorder, LiveInput
+from save_journal import SaveJournal
+from text_layout import TextLayoutCache
+from viewport import Viewport
+from warmup import SceneWarmup
+from widgets import ButtonCache, ButtonStyle, button_state
 
 # ゲームの初期化
 pygame.init()
+# 配置・クリック判定は論理座標（WIDTH × HEIGHT）で行い、描画するときに出力の大きさに合わせて変換する
+# （scenes.json のアイテムの座標もこの座標系）
 WIDTH, HEIGHT = 800, 600
 INVENTORY_HEIGHT = 80  # インベントリエリアの高さ
 GAME_HEIGHT = HEIGHT - INVENTORY_HEIGHT  # ゲーム画面の高さ
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("フクロウの冒険")
+viewport = Viewport((WIDTH, HEIGHT), screen.get_size())  # 論理座標 → 出力の座標
+
+# 画像やシーンファイルの相対パスは、このファイルのあるフォルダを基準にする（フォルダごと移動しても動くように）
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 主人公の画像を読み込む
-PROTAGONIST_IMAGE_PATH = "/Users/yumaspr/Desktop/MakeGame/AmazonQChallenge250618/adv/bird_fukurou_run.png"
+# 画像アセットのキャッシュ（背景・主人公画像などを変換・拡大縮小済みで保持）
+ASSET_READY = pygame.event.custom_type()  # 画像の読み込み完了を知らせるイベント
+RELOAD_CHECK = pygame.event.custom_type()  # シーンファイルの変更を確認するイベント
+RELOAD_INTERVAL = 500  # シーンファイルの変更を確認する間隔（ミリ秒）
+RESIZE_SETTLED = pygame.event.custom_type()  # ウィンドウの大きさの変更が落ち着いたことを知らせるイベント
+RESIZE_DELAY = 150  # 最後の大きさの変更からこの時間（ミリ秒）たったら作り直す（ドラッグ中に何度も作り直さない）
+assets = AssetManager(budget_bytes=64 * 1024 * 1024, notify_event=ASSET_READY, base_dir=BASE_DIR)
+
+# 主人公の画像（BASE_DIR からの相対パス、バンドルにも同じ名前で入れる）
+PROTAGONIST_IMAGE_PATH = "bird_fukurou_run.png"
+PROTAGONIST_SIZE = (150, 150)
 protagonist_image = None
-try:
-    if os.path.exists(PROTAGONIST_IMAGE_PATH):
-        protagonist_image = pygame.image.load(PROTAGONIST_IMAGE_PATH)
+
+# 主人公の画像を読み込む関数（バンドルを開いた後に呼ぶ）
+def load_protagonist_image():
+    global protagonist_image
+    if assets.exists(PROTAGONIST_IMAGE_PATH):
         # 適切なサイズに調整（必要に応じて調整）
-        protagonist_image = pygame.transform.scale(protagonist_image, (150, 150))
-except Exception as e:
-    print(f"主人公の画像を読み込めませんでした: {e}")
+        protagonist_image = assets.load_now(PROTAGONIST_IMAGE_PATH, PROTAGONIST_SIZE)
 
 # 色の定義
 WHITE = (255, 255, 255)
@@ -34,467 +68,642 @@ RED = (255, 100, 100)
 YELLOW = (255, 255, 100)
 
 # フォントの設定
-# 日本語フォントを使用
-try:
-    # macOSの場合
-    title_font = pygame.font.Font("/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc", 48)
-    text_font = pygame.font.Font("/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc", 28)
-    choice_font = pygame.font.Font("/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc", 32)
-    inventory_font = pygame.font.Font("/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc", 20)
-except:
-    try:
-        # Windowsの場合
-        title_font = pygame.font.Font("C:/Windows/Fonts/msgothic.ttc", 48)
-        text_font = pygame.font.Font("C:/Windows/Fonts/msgothic.ttc", 28)
-        choice_font = pygame.font.Font("C:/Windows/Fonts/msgothic.ttc", 32)
-        inventory_font = pygame.font.Font("C:/Windows/Fonts/msgothic.ttc", 20)
-    except:
-        # フォントが見つからない場合はデフォルトのフォントを使用
-        print("日本語フォントが見つかりませんでした。デフォルトフォントを使用します。")
-        title_font = pygame.font.SysFont(None, 48)
-        text_font = pygame.font.SysFont(None, 28)
-        choice_font = pygame.font.SysFont(None, 32)
-        inventory_font = pygame.font.SysFont(None, 20)
+# 日本語フォントは一度だけ探して結果をキャッシュし、各サイズは最初に使われたときに開く
+fonts = FontRegistry()
+title_font = fonts.get(48)
+text_font = fonts.get(28)
+choice_font = fonts.get(32)
+inventory_font = fonts.get(20)
+
+SCALED_FONTS = (title_font, text_font, choice_font, inventory_font)  # 出力の解像度に合わせて描画するフォント
+
+# 論理サイズのフォントに対応する、出力の解像度で描画するためのフォント
+def scaled_font(font):
+    return fonts.get(viewport.font_size(font.size_px))
+
+# 論理座標の線の太さ → 出力の線の太さ
+def line_width(width):
+    return max(1, viewport.length(width))
 
 # ゲームの状態
-current_scene = "start"
-game_state = {
-    "inventory": None,  # 1つのアイテムのみ保持
-    "flags": {},
-    "last_click_time": 0,  # 最後のクリック時間
-    "scene_transition_time": 0,  # シーン遷移時間
-    "click_cooldown": 300,  # クリック間隔（ミリ秒）
-    "scene_cooldown": 500   # シーン遷移後の待機時間（ミリ秒）
-}
-
-# アイテムクラス
-class Item:
-    def __init__(self, name, color, description=""):
-        self.name = name
-        self.color = color
-        self.description = description
-    
-    def __str__(self):
-        return self.name
-
-# クリック可能なアイテムクラス
-class ClickableItem:
-    def __init__(self, item, x, y, width, height):
-        self.item = item
-        self.rect = pygame.Rect(x, y, width, height)
-        self.is_collected = False
-    
-    def draw(self, surface):
-        if not self.is_collected:
-            pygame.draw.rect(surface, self.item.color, self.rect)
-            pygame.draw.rect(surface, BLACK, self.rect, 2)
-            # アイテム名を描画
-            text_surf = inventory_font.render(self.item.name, True, BLACK)
-            text_rect = text_surf.get_rect(center=self.rect.center)
-            surface.blit(text_surf, text_rect)
-    
-    def is_clicked(self, pos):
-        return self.rect.collidepoint(pos) and not self.is_collected
-
-# シーンデータの読み込み
-def load_scenes():
-    try:
-        with open("scenes.json", "r", encoding="utf-8") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        # デフォルトのシーンを返す（アイテム付き）
-        return {
-            "start": {
-                "text": "冒険の始まり。あなたは森の入り口に立っています。地面に光る石が落ちています。どうしますか？",
-                "choices": [
-                    {"text": "森に入る", "next": "forest"},
-                    {"text": "村に戻る", "next": "village"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "光る石", "color": [100, 150, 255], "x": 100, "y": 200, "width": 60, "height": 30}
-                ]
-            },
-            "forest": {
-                "text": "深い森の中に入りました。木々が密集していて、少し不気味です。前方に小道が見えます。木の根元に赤いキノコが生えています。",
-                "choices": [
-                    {"text": "小道を進む", "next": "path"},
-                    {"text": "森の入り口に戻る", "next": "start"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "赤キノコ", "color": [255, 100, 100], "x": 150, "y": 250, "width": 50, "height": 40}
-                ]
-            },
-            "village": {
-                "text": "村に戻ってきました。村人たちが日常の生活を送っています。井戸の近くに古いコインが落ちています。",
-                "choices": [
-                    {"text": "宿屋に行く", "next": "inn"},
-                    {"text": "森に向かう", "next": "start"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "古いコイン", "color": [255, 255, 100], "x": 200, "y": 180, "width": 40, "height": 40}
-                ]
-            },
-            "path": {
-                "text": "小道を進むと、古い小屋が見えてきました。道端に緑の宝石が輝いています。",
-                "choices": [
-                    {"text": "小屋に入る", "next": "cabin"},
-                    {"text": "森に戻る", "next": "forest"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "緑の宝石", "color": [100, 255, 100], "x": 300, "y": 220, "width": 45, "height": 35}
-                ]
-            },
-            "inn": {
-                "text": "宿屋に入りました。暖かい暖炉と美味しそうな食事の匂いがします。テーブルの上に銀のスプーンがあります。",
-                "choices": [
-                    {"text": "食事をする", "next": "eat"},
-                    {"text": "村に戻る", "next": "village"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "銀スプーン", "color": [200, 200, 200], "x": 250, "y": 190, "width": 55, "height": 25}
-                ]
-            },
-            "cabin": {
-                "text": "小屋の中は埃っぽく、長い間誰も住んでいないようです。テーブルの上に古い地図があります。",
-                "choices": [
-                    {"text": "地図を調べる", "next": "map"},
-                    {"text": "小屋を出る", "next": "path"}
-                ],
-                "background": None,
-                "items": [
-                    {"name": "古い地図", "color": [139, 69, 19], "x": 180, "y": 160, "width": 70, "height": 50}
-                ]
-            },
-            "eat": {
-                "text": "美味しい食事を取りました。体力が回復した気がします。",
-                "choices": [
-                    {"text": "宿屋を出る", "next": "village"}
-                ],
-                "background": None,
-                "items": []
-            },
-            "map": {
-                "text": "地図には宝の在り処が記されているようです！冒険の新たな目標ができました。",
-                "choices": [
-                    {"text": "地図を持って小屋を出る", "next": "path_with_map"}
-                ],
-                "background": None,
-                "items": []
-            },
-            "path_with_map": {
-                "text": "地図を手に入れて森の小道に戻りました。これからどこへ向かいますか？",
-                "choices": [
-                    {"text": "地図に従って進む", "next": "treasure"},
-                    {"text": "森に戻る", "next": "forest"}
-                ],
-                "background": None,
-                "items": []
-            },
-            "treasure": {
-                "text": "地図に従って進むと、古代の遺跡にたどり着きました。入り口には謎めいた文字が刻まれています。",
-                "choices": [
-                    {"text": "遺跡に入る", "next": "ruins"},
-                    {"text": "森に戻る", "next": "forest"}
-                ],
-                "background": None,
-                "items": []
-            },
-            "ruins": {
-                "text": "遺跡の中は神秘的な光に満ちています。中央には宝箱が置かれています。",
-                "choices": [
-                    {"text": "宝箱を開ける", "next": "ending"},
-                    {"text": "遺跡を出る", "next": "treasure"}
-                ],
-                "background": None,
-                "items": []
-            },
-            "ending": {
-                "text": "宝箱を開けると、まばゆい光が溢れ出しました。あなたは伝説の宝を手に入れました！冒険は成功です！",
-                "choices": [
-                    {"text": "もう一度プレイする", "next": "start"}
-                ],
-                "background": None,
-                "items": []
-            }
-        }
+current_scene = None  # 現在のシーン番号（scene_graph の番号）
+game_state = GameState(capacity=1)  # インベントリ（1つのアイテムのみ保持）・フラグ
+ui_timers = UITimers(click_cooldown=300, scene_cooldown=500)  # クリック・シーン遷移のクールダウン（ミリ秒）
+
+# シーンのアイテムを描画する関数（収集済みのものは描画しない）
+def draw_clickable_item(surface, clickable_item):
+    if not clickable_item.is_collected:
+        rect = viewport.rect(clickable_item.rect)
+        pygame.draw.rect(surface, clickable_item.item.color, rect)
+        pygame.draw.rect(surface, BLACK, rect, line_width(2))
+        # アイテム名を描画
+        text_surf = scaled_font(inventory_font).render(clickable_item.item.name, True, BLACK)
+        text_rect = text_surf.get_rect(center=rect.center)
+        surface.blit(text_surf, text_rect)
 
 # インベントリを描画する関数
-def draw_inventory():
+def draw_inventory(surface=None):
+    surface = surface or screen
+    draw_inventory_panel(surface)
+    draw_inventory_slot(surface)
+
+# インベントリの枠とタイトルを描画する関数（内容によらず変わらない部分）
+def draw_inventory_panel(surface):
     # インベントリ背景
-    inventory_rect = pygame.Rect(0, GAME_HEIGHT, WIDTH, INVENTORY_HEIGHT)
-    pygame.draw.rect(screen, LIGHT_GRAY, inventory_rect)
-    pygame.draw.rect(screen, BLACK, inventory_rect, 2)
+    inventory_rect = viewport.rect((0, GAME_HEIGHT, WIDTH, INVENTORY_HEIGHT))
+    pygame.draw.rect(surface, LIGHT_GRAY, inventory_rect)
+    pygame.draw.rect(surface, BLACK, inventory_rect, line_width(2))
     
     # インベントリタイトル
-    title_text = inventory_font.render("インベントリ", True, BLACK)
-    screen.blit(title_text, (10, GAME_HEIGHT + 5))
-    
+    title_text = scaled_font(inventory_font).render("インベントリ", True, BLACK)
+    surface.blit(title_text, viewport.point((10, GAME_HEIGHT + 5)))
+
+# インベントリのスロットとアイテム名を描画する関数
+INVENTORY_SLOT_AREA = pygame.Rect(10, GAME_HEIGHT + 25, WIDTH - 20, 50)
+def draw_inventory_slot(surface):
     # アイテムスロット
-    slot_rect = pygame.Rect(10, GAME_HEIGHT + 25, 50, 50)
-    pygame.draw.rect(screen, WHITE, slot_rect)
-    pygame.draw.rect(screen, BLACK, slot_rect, 2)
+    slot_rect = viewport.rect((10, GAME_HEIGHT + 25, 50, 50))
+    pygame.draw.rect(surface, WHITE, slot_rect)
+    pygame.draw.rect(surface, BLACK, slot_rect, line_width(2))
     
     # アイテムがある場合は描画
-    if game_state["inventory"]:
-        pygame.draw.rect(screen, game_state["inventory"].color, slot_rect)
-        pygame.draw.rect(screen, BLACK, slot_rect, 2)
+    item = game_state.current_item
+    font = scaled_font(inventory_font)
+    if item:
+        pygame.draw.rect(surface, item.color, slot_rect)
+        pygame.draw.rect(surface, BLACK, slot_rect, line_width(2))
         # アイテム名を表示
-        item_text = inventory_font.render(game_state["inventory"].name, True, BLACK)
-        screen.blit(item_text, (70, GAME_HEIGHT + 35))
+        item_text = font.render(item.name, True, BLACK)
+        surface.blit(item_text, viewport.point((70, GAME_HEIGHT + 35)))
     else:
         # 空のスロット表示
-        empty_text = inventory_font.render("空", True, GRAY)
+        empty_text = font.render("空", True, GRAY)
         text_rect = empty_text.get_rect(center=slot_rect.center)
-        screen.blit(empty_text, text_rect)
-
-# アイテムを収集する関数
-def collect_item(new_item):
-    old_item = game_state["inventory"]
-    game_state["inventory"] = new_item
-    return old_item
-
-# シーンのアイテムを管理するクラス
-class SceneItems:
-    def __init__(self):
-        self.items = {}  # scene_id: [ClickableItem, ...]
-    
-    def load_scene_items(self, scene_id, scene_data):
-        if scene_id not in self.items:
-            self.items[scene_id] = []
-            if "items" in scene_data:
-                for item_data in scene_data["items"]:
-                    item = Item(item_data["name"], item_data["color"])
-                    clickable_item = ClickableItem(
-                        item, 
-                        item_data["x"], 
-                        item_data["y"], 
-                        item_data["width"], 
-                        item_data["height"]
-                    )
-                    self.items[scene_id].append(clickable_item)
-    
-    def get_scene_items(self, scene_id):
-        return self.items.get(scene_id, [])
-    
-    def handle_click(self, scene_id, pos):
-        if scene_id in self.items:
-            for clickable_item in self.items[scene_id]:
-                if clickable_item.is_clicked(pos):
-                    # アイテムを収集
-                    old_item = collect_item(clickable_item.item)
-                    clickable_item.is_collected = True
-                    
-                    # 古いアイテムがあった場合は同じ場所に配置
-                    if old_item:
-                        new_clickable = ClickableItem(
-                            old_item,
-                            clickable_item.rect.x,
-                            clickable_item.rect.y,
-                            clickable_item.rect.width,
-                            clickable_item.rect.height
-                        )
-                        self.items[scene_id].append(new_clickable)
-                    
-                    return True
-        return False
+        surface.blit(empty_text, text_rect)
 
 # グローバルなシーンアイテム管理
 scene_items = SceneItems()
+# 巻き戻し用の履歴（Backspace キーで1つ前のシーンに戻る、インベントリ・フラグ・アイテムも元に戻す）
+HISTORY_DEPTH = 1000  # 戻れるシーン遷移の数
+history = History(max_depth=HISTORY_DEPTH)
+game_state.history = history
+scene_items.history = history
+# テキストレイアウトのキャッシュ（折り返し結果と行サーフェスをフレーム間で再利用）
+# 行のサーフェスはこのキャッシュで保持するので、フォントの共有キャッシュは通さない
+text_layouts = TextLayoutCache(max_entries=1024, max_bytes=128 * 1024 * 1024,
+                               render=lambda font, line, color: fonts.render_direct(font, line, True, color))
+
 # テキストを複数行に分割して描画する関数（日本語対応版）
 def draw_text(text, font, color, surface, x, y, max_width):
-    # 日本語テキストは単語で分割できないので、1文字ずつ処理
-    lines = []
-    current_line = ""
-    
-    for char in text:
-        test_line = current_line + char
-        # テキストの幅を計算
-        test_width = font.size(test_line)[0]
-        if test_width < max_width:
-            current_line = test_line
-        else:
-            lines.append(current_line)
-            current_line = char
-    
-    if current_line:  # 最後の行を追加
-        lines.append(current_line)
-    
-    for i, line in enumerate(lines):
-        text_surface = font.render(line, True, color)
-        surface.blit(text_surface, (x, y + i * font.get_height()))
-    
-    return y + len(lines) * font.get_height()
+    # 日本語テキストは単語で分割できないので、1文字ずつ折り返す（結果はキャッシュされる）
+    layout = text_layouts.get(text, font, color, max_width)
+    return layout.draw(surface, x, y)
 
-# 選択肢ボタンを描画する関数（改良版）
-def draw_choice_button(text, x, y, width, height, inactive_color, active_color, action=None):
-    mouse = pygame.mouse.get_pos()
-    current_time = pygame.time.get_ticks()
-    
+# クリック可能かどうかを判定する関数（シーン遷移直後やクールダウン中はクリックを無効にする）
+def is_clickable(current_time):
+    return ui_timers.is_clickable(current_time)
+
+# クールダウンが切れる時刻を返す関数
+def cooldown_end_time():
+    return ui_timers.cooldown_end_time()
+
+# 選択肢ボタン（通常・ホバー・無効の見た目をラベルと大きさごとに一度だけ作っておく）
+# 出力の大きさごとに別のキャッシュを持ち、直前の大きさの分も残しておく（フルスクリーンの切り替えで作り直さない）
+BUTTON_CACHE_SIZES = 2
+button_caches = OrderedDict()  # 出力の大きさ: ButtonCache
+
+# 現在の出力の大きさのボタンのキャッシュを返す関数
+def current_buttons():
+    buttons = button_caches.get(viewport.output_size)
+    if buttons is None:
+        style = ButtonStyle(scaled_font(choice_font), GRAY, DARK_GRAY, border_color=BLACK,
+                            text_color=BLACK, disabled_text_color=GRAY,
+                            border_width=line_width(2), hover_border_width=line_width(3))
+        buttons = button_caches[viewport.output_size] = ButtonCache(style)
+        while len(button_caches) > BUTTON_CACHE_SIZES:
+            button_caches.popitem(last=False)
+    return buttons
+
+# 選択肢ボタンを描画する関数（rect・mouse は論理座標、mouse と current_time はフレームの開始時に取得した値）
+def draw_choice_button(surface, text, rect, mouse, current_time, action=None):
     # シーン遷移直後やクールダウン中はクリックを無効にする
-    can_click = (current_time - game_state["last_click_time"] > game_state["click_cooldown"] and
-                current_time - game_state["scene_transition_time"] > game_state["scene_cooldown"])
+    can_click = is_clickable(current_time)
     
     # マウスがボタンの上にあるかチェック
-    is_hovering = x < mouse[0] < x + width and y < mouse[1] < y + height
-    
-    if is_hovering and can_click:
-        pygame.draw.rect(screen, active_color, (x, y, width, height))
-        # ホバー時の追加効果
-        pygame.draw.rect(screen, BLACK, (x, y, width, height), 3)
-    else:
-        pygame.draw.rect(screen, inactive_color, (x, y, width, height))
-        pygame.draw.rect(screen, BLACK, (x, y, width, height), 2)
-        
-        # クールダウン中は薄く表示
-        if not can_click:
-            overlay = pygame.Surface((width, height))
-            overlay.set_alpha(128)
-            overlay.fill(WHITE)
-            screen.blit(overlay, (x, y))
-    
-    # 日本語テキストのレンダリング
-    text_color = BLACK if can_click else GRAY
-    text_surf = choice_font.render(text, True, text_color)
-    text_rect = text_surf.get_rect(center=(x + width/2, y + height/2))
-    screen.blit(text_surf, text_rect)
+    is_hovering = rect.x < mouse[0] < rect.right and rect.y < mouse[1] < rect.bottom
     
+    output_rect = viewport.rect(rect)
+    current_buttons().get(text, output_rect.size).draw(surface, output_rect.topleft,
+                                                       button_state(is_hovering, can_click))
     return action if is_hovering and can_click else None
 
 # クリック処理を管理する関数
-def handle_click_event(event):
+def handle_click_event(event, current_time=None):
     """マウスクリックイベントを処理し、適切なタイミングでのみアクションを実行"""
-    current_time = pygame.time.get_ticks()
+    if current_time is None:
+        current_time = pygame.time.get_ticks()
     
     # クールダウン中またはシーン遷移直後はクリックを無視
-    if (current_time - game_state["last_click_time"] < game_state["click_cooldown"] or
-        current_time - game_state["scene_transition_time"] < game_state["scene_cooldown"]):
+    if not is_clickable(current_time):
         return False
     
     # クリック時間を更新
-    game_state["last_click_time"] = current_time
+    ui_timers.last_click_time = current_time
     return True
 
 # シーン遷移を管理する関数
-def transition_to_scene(new_scene):
-    """シーン遷移時の処理"""
+def transition_to_scene(new_scene, current_time=None):
+    """シーン遷移時の処理（new_scene はコンパイル済みのシーン）"""
     global current_scene
-    current_scene = new_scene
-    game_state["scene_transition_time"] = pygame.time.get_ticks()
-    print(f"シーン遷移: {new_scene}")  # デバッグ用
+    current_scene = new_scene.index
+    ui_timers.scene_transition_time = pygame.time.get_ticks() if current_time is None else current_time
+    print(f"シーン遷移: {new_scene.id}")  # デバッグ用
+    history.begin_step(current_scene)
+    if save_journal:
+        save_journal.record_scene(new_scene.id)
 
-# メインゲームループ
-def game_loop():
+# 履歴をさかのぼって steps 回前のシーン遷移の時点に戻る関数（戻れない場合は False）
+def rewind(scenes, steps=1, current_time=None):
+    global current_scene
+    result = history.rewind(game_state, scene_items, steps)
+    if result is None:
+        return False
+    current_scene, touched_scenes, touched_flags = result
+    ui_timers.scene_transition_time = pygame.time.get_ticks() if current_time is None else current_time
+    compositor.invalidate()
+    print(f"巻き戻し: {scenes[current_scene].id}")  # デバッグ用
+    if save_journal:
+        save_journal.record_scene(scenes[current_scene].id)
+        save_journal.record_inventory(inventory_entries())
+        for scene_index in touched_scenes:
+            save_journal.record_scene_items(scenes[scene_index].id, scene_items.entries(scene_index))
+        for name in touched_flags:
+            save_journal.record_flag(name, game_state.flag(name, None))
+    return True
+
+# 差分セーブ（None の場合は自動セーブしない）
+save_journal = None
+
+# ゲームの状態を初期化する関数（シーンは開始シーンから、インベントリ・フラグ・アイテムは空に戻す）
+def new_game(scenes):
+    global current_scene, save_journal
+    current_scene = scenes.start
+    save_journal = None
+    game_state.reset(scenes.symbols)  # 条件判定のビットはシーンの表に合わせる
+    ui_timers.last_click_time = 0
+    scene_items.clear()
+    history.clear()
+    compositor.invalidate()
+
+# 自動セーブを始める関数（resume=True の場合はセーブから状態を復元する）
+def start_autosave(scenes, prefix, resume=False):
+    global save_journal
+    save_journal = SaveJournal(prefix, resume=resume)
+    if resume:
+        print(save_journal.report)
+        restore_saved_state(scenes, save_journal.recovered)
+        save_journal.record_scene(scenes[current_scene].id)
+    elif save_journal.report.generation:
+        # 新しいゲームのセーブは最初の操作を記録するときに書くので、それまでは前回のセーブが残る
+        print(f"前回のセーブがあります（--continue で続きから遊べます）。最初の操作で上書きされます: {prefix}")
+
+# セーブから復元した状態をゲームに反映する関数
+def restore_saved_state(scenes, saved):
     global current_scene
-    scenes = load_scenes()
+    if saved["scene"] in scenes:
+        current_scene = scenes.index[saved["scene"]]
+    for name, color in saved["inventory"]:
+        game_state.collect(Item(name, color))
+    for name, value in saved["flags"].items():
+        game_state.set_flag(name, value)
+    for scene_id, entries in saved["scene_items"].items():
+        if scene_id in scenes:
+            scene_items.restore(scenes.index[scene_id], entries)
+
+# 差分セーブに書くインベントリ（(名前, 色) の並び、拾った順）
+def inventory_entries():
+    return [(item.name, tuple(item.color)) for item in game_state.inventory.values()]
+
+# アイテムの入れ替えを自動セーブする関数
+def autosave_items(scene):
+    if save_journal:
+        save_journal.record_inventory(inventory_entries())
+        save_journal.record_scene_items(scene.id, scene_items.entries(scene.index))
+
+# 遷移先になりうるシーンを先読みし、その背景も先読みする関数
+def prefetch_neighbor_backgrounds(scenes, scene_index):
+    paths = [scenes[scene_index].background]
+    for next_scene in scenes.warm_neighbors(scene_index):
+        paths.append(next_scene.background)
+    assets.prefetch(paths, background_size())
+
+# 背景画像の大きさ（出力の座標）
+def background_size():
+    return viewport.rect((0, 0, WIDTH, GAME_HEIGHT)).size
+
+# シーンの本文・選択肢・アイテム名を先にレンダリングしておく関数（ウォームアップのスレッドから呼ばれる）
+# 出力の解像度に合わせたフォントで作るので、ウィンドウの大きさが変わったときもこれで作り直す
+def warm_scene(scene):
+    text_layouts.measure(scene.text, text_font, WIDTH - 100)  # 論理座標での配置用
+    text_layouts.get(scene.text, scaled_font(text_font), BLACK, viewport.length(WIDTH - 100))
+    font = scaled_font(choice_font)
+    for choice in scene.choices:
+        # 選択肢は通常時とクールダウン中で色が違う
+        font.render(choice.text, True, BLACK)
+        font.render(choice.text, True, GRAY)
+    font = scaled_font(inventory_font)
+    for spec in scene.items:
+        font.render(spec.name, True, BLACK)
+
+# シーンの先読み（現在のシーンから幅優先で、キャッシュの上限に近づいたら止める）
+warmup = SceneWarmup(warm_scene, memory_used=lambda: text_layouts.nbytes + fonts.nbytes,
+                     memory_cap=96 * 1024 * 1024, max_scenes=512)
+
+# 再読み込みしたシーンに合わせてキャッシュと状態を更新する関数（変わったシーンの分だけ捨てる）
+def apply_reload(scenes, result):
+    print(result)
+    affected = set()
+    for old, new in result.changed:
+        affected.add(old.index)
+        if old.text != new.text:
+            text_layouts.invalidate_text(old.text)
+        # 背景は、別の画像に変わったか、同じパスのファイルが書き換えられた場合だけ読み直す
+        if old.background and (old.background != new.background or assets.modified(old.background)):
+            assets.invalidate(old.background)
+        if old.items != new.items:
+            scene_items.forget(old.index)
+    for old in result.removed:
+        affected.add(old.index)
+        text_layouts.invalidate_text(old.text)
+        scene_items.forget(old.index)
+    
+    if current_scene in affected:
+        compositor.invalidate()
+    if any(old.index == current_scene for old in result.removed):
+        # 表示中のシーンが削除された場合は開始シーンに戻る
+        transition_to_scene(scenes[scenes.start])
+    if result.removed or any(old.items != new.items for old, new in result.changed):
+        # 削除されたシーンや読み込み直したアイテムには戻れないので、履歴を捨てる
+        history.clear()
+        history.begin_step(current_scene)
+    prefetch_neighbor_backgrounds(scenes, current_scene)
+    warmup.start(scenes, current_scene)
+
+# 終了時の状態（入力の記録・再生で結果を比べるために使う）
+def session_summary(scenes):
+    inventory = game_state.current_item
+    return {
+        "scene": scenes.ids[current_scene],
+        "inventory": inventory.name if inventory else None,
+        "flags": dict(game_state.flag_values),
+    }
+
+CHOICE_HEIGHT = 50
+# 選択肢ボタンの画面部品としての名前（毎フレーム作らない）
+CHOICE_WIDGETS = [("choice", i) for i in range(GAME_HEIGHT // (CHOICE_HEIGHT + 20) + 1)]
+
+# 選択肢ボタンの配置を計算する関数（条件を満たし、ゲームエリア内に収まる選択肢のみ、論理座標）
+def get_choice_rects(scene):
+    y_offset = 80 + text_layouts.measure(scene.text, text_font, WIDTH - 100) + 30
+    max_choices_in_game_area = (GAME_HEIGHT - y_offset - 20) // (CHOICE_HEIGHT + 20)
+    rects = []
+    choices = available_choices(scene.choices, game_state)
+    for i, choice in enumerate(choices[:max(max_choices_in_game_area, 0)]):
+        choice_y = y_offset + i * (CHOICE_HEIGHT + 20)
+        rects.append((pygame.Rect(WIDTH // 4, choice_y, WIDTH // 2, CHOICE_HEIGHT), choice))
+    return rects
+
+# マウス位置にある選択肢の番号を返す関数（なければ None）
+def choice_at(choice_rects, pos):
+    for i, (rect, _) in enumerate(choice_rects):
+        if rect.x < pos[0] < rect.right and rect.y < pos[1] < rect.bottom:
+            return i
+    return None
+
+# 画面合成（静的レイヤーと動的な要素のダーティ矩形を管理）
+compositor = Compositor(screen)
+
+# 表示モードを変える関数（fullscreen=True の場合はモニターの解像度、resizable=True の場合は大きさを変えられるウィンドウ）
+def set_display_mode(size=(WIDTH, HEIGHT), resizable=False, fullscreen=False):
+    global screen
+    if fullscreen:
+        screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    else:
+        screen = pygame.display.set_mode(size, pygame.RESIZABLE if resizable else 0)
+    viewport.resize(screen.get_size())
+    compositor.resize(screen)
+    release_unused_fonts()
+
+# 使わなくなった大きさのフォントと、そのフォントで作った文字・レイアウトを手放す関数
+# （論理サイズと、いまの出力の大きさ・ボタンのキャッシュに残している大きさの分だけ残す）
+def release_unused_fonts():
+    sizes = {font.size_px for font in SCALED_FONTS}
+    for output_size in set(button_caches) | {viewport.output_size}:
+        output = Viewport((WIDTH, HEIGHT), output_size)
+        sizes.update(output.font_size(font.size_px) for font in SCALED_FONTS)
+    fonts.retain(sizes)
+    text_layouts.retain_fonts(fonts.get(size) for size in sizes)
+
+# ウィンドウの大きさが変わったときに呼ぶ関数（変わっていなければ False）
+# ドラッグ中は VIDEORESIZE が続けて届くので、game_loop は RESIZE_DELAY だけ落ち着いてから呼ぶ
+# 画面合成の静的レイヤーだけはすぐに作り直し、先のシーンの本文・背景は新しい大きさでバックグラウンドで用意する
+def resize_display(scenes):
+    global screen
+    screen = pygame.display.get_surface()
+    if not viewport.resize(screen.get_size()):
+        return False
+    compositor.resize(screen)
+    warmup.cancel()  # 前の大きさの先読みを止めてから、その大きさのフォントを手放す
+    release_unused_fonts()
+    prefetch_neighbor_backgrounds(scenes, current_scene)
+    warmup.start(scenes, current_scene)
+    return True
+
+# シーンの静的レイヤーを描画する関数（背景・タイトル・本文・未収集のアイテム・インベントリ枠）
+def draw_static_layer(surface, scene, bg):
+    # ゲーム画面をクリア（表示範囲の外は黒い帯）
+    if not viewport.identity:
+        surface.fill(BLACK)
+    surface.fill(WHITE, viewport.area())
+    
+    # 背景画像があれば描画
+    if bg:
+        surface.blit(bg, viewport.offset)
+    
+    # タイトルを描画
+    title_text = "アドベンチャーブック"
+    title_surf = scaled_font(title_font).render(title_text, True, BLACK)
+    title_rect = title_surf.get_rect(center=viewport.point((WIDTH/2, 30)))
+    surface.blit(title_surf, title_rect)
+    
+    # シーンのテキストを描画
+    x, y = viewport.point((50, 80))
+    draw_text(scene.text, scaled_font(text_font), BLACK, surface, x, y, viewport.length(WIDTH - 100))
+    
+    # シーンのアイテムを描画
+    current_scene_items = scene_items.get_scene_items(current_scene)
+    for clickable_item in current_scene_items:
+        draw_clickable_item(surface, clickable_item)
+    
+    # インベントリの枠を描画
+    draw_inventory_panel(surface)
+
+# 1フレーム分の画面を合成する関数（変わった部分だけを描き直して画面に送る）
+def draw_frame(scene, mouse, current_time):
+    # 背景画像（読み込み中・読み込み失敗の場合は None）
+    bg = assets.get(scene.background, background_size()) if scene.background else None
+    profiler.lap("background")
+    
+    static_key = (current_scene, bg is not None, scene_items.revision, viewport.revision)
+    compositor.set_static(static_key, lambda surface: draw_static_layer(surface, scene, bg))
+    profiler.lap("static_layer")
+    
+    # 選択肢を描画（ホバーの判定は論理座標、画面部品の矩形は出力の座標）
+    can_click = is_clickable(current_time)
+    widget_names = set()
+    for i, (rect, choice) in enumerate(get_choice_rects(scene)):
+        is_hovering = rect.x < mouse[0] < rect.right and rect.y < mouse[1] < rect.bottom
+        state = (choice.text, button_state(is_hovering, can_click))
+        name = CHOICE_WIDGETS[i]
+        widget_names.add(name)
+        compositor.update_widget(name, viewport.rect(rect), state, lambda surface, rect=rect, choice=choice: draw_choice_button(
+            surface, choice.text, rect, mouse, current_time, choice.next))
+    profiler.lap("buttons")
+    
+    # インベントリのスロットを描画
+    widget_names.add("inventory")
+    compositor.update_widget("inventory", viewport.rect(INVENTORY_SLOT_AREA), game_state.current_item,
+                             draw_inventory_slot)
+    profiler.lap("inventory")
+    
+    # クールダウン状態の表示（デバッグ用）
+    if not can_click:
+        cooldown_surf = scaled_font(inventory_font).render("待機中...", True, RED)  # 描画結果はフォントのキャッシュから返る
+        cooldown_rect = cooldown_surf.get_rect(topleft=viewport.point((WIDTH - 100, 10)))
+        widget_names.add("cooldown")
+        compositor.update_widget("cooldown", cooldown_rect, True,
+                                 lambda surface: surface.blit(cooldown_surf, cooldown_rect))
+    
+    # 処理時間のオーバーレイ（F3で切り替え）
+    if profiler.show_overlay:
+        lines = profiler.overlay_lines()
+        widget_names.add("profiler")
+        compositor.update_widget("profiler", profiler_overlay_rect(lines), lines,
+                                 lambda surface: draw_profiler_overlay(surface, lines))
+    
+    compositor.retain_widgets(widget_names)
+    profiler.lap("overlay")
+    compositor.present()
+    profiler.lap("present")
+
+# 処理時間の計測（--profile を指定したときだけ FrameProfiler になる）
+profiler = NullProfiler()
+profiler_font = None
+
+# 処理時間のオーバーレイの範囲を返す関数（文字は拡大しない、ゲームの表示範囲の右上に置く）
+def profiler_overlay_rect(lines):
+    line_height = profiler_font.get_linesize()
+    width = max(profiler_font.size(line)[0] for line in lines) + 10
+    right, top = viewport.point((WIDTH, 40))
+    return pygame.Rect(right - width - 5, top, width, line_height * len(lines) + 10)
+
+# 処理時間のオーバーレイを描画する関数
+def draw_profiler_overlay(surface, lines):
+    rect = profiler_overlay_rect(lines)
+    surface.fill(BLACK, rect)
+    for i, line in enumerate(lines):
+        text_surf = profiler_font.render(line, True, GREEN)
+        surface.blit(text_surf, (rect.x + 5, rect.y + 5 + i * profiler_font.get_linesize()))
+
+# メインゲームループ
+# event_driven=True の場合は入力やクールダウン終了まで待機し、状態が変わったときだけ再描画する
+# event_driven=False の場合は従来どおり毎フレーム（60 FPS）再描画する
+# autosave にファイル名の接頭辞を指定すると差分セーブを行い、resume=True ならその続きから始める
+# profile=True の場合は各段階の処理時間を計測し（F3でオーバーレイ表示）、trace にファイル名を指定すると記録を書き出す
+# fps=0 の場合は固定フレームレートでもフレーム数を制限しない、max_frames を指定するとそのフレーム数で終了する
+# watch=True の場合はシーンファイルの変更を確認し、変わったシーンだけを読み込み直す
+# input_source を指定するとそこから入力（時刻・マウス位置・イベント）を受け取る（replay.py の記録・再生用）
+# bundle を指定するとシーンと画像をそのバンドル（bundle.py で作ったもの）から読む
+# 戻り値は実行したフレーム数
+def game_loop(event_driven=True, autosave=None, resume=False, scene_file="scenes.json",
+              profile=False, trace=None, trace_format="jsonl", fps=60, max_frames=None, watch=False,
+              input_source=None, bundle=None):
+    global profiler, profiler_font
+    source = input_source or LiveInput()
+    source.viewport = viewport  # マウス位置・クリック位置を論理座標で受け取る
+    profiler = NullProfiler()
+    if profile or trace:
+        profiler = FrameProfiler(trace_path=trace, trace_format=trace_format)
+        profiler_font = pygame.font.Font(None, 18)
+    reloader = None
+    if bundle:
+        if assets.bundle is None or assets.bundle.path != bundle:
+            assets.bundle = AssetBundle(bundle)
+        scenes = assets.bundle.scenes()
+    elif watch:
+        # 差分を反映できるように、遅延読み込みではなくすべて読み込む
+        reloader = SceneReloader(scene_file)
+        scenes = reloader.graph
+        pygame.time.set_timer(RELOAD_CHECK, RELOAD_INTERVAL)
+    else:
+        scenes = open_scenes(scene_file)
+    load_protagonist_image()
+    new_game(scenes)
+    if autosave:
+        start_autosave(scenes, autosave, resume)
     clock = pygame.time.Clock()
     
     # 初期化時にシーン遷移時間を設定
-    game_state["scene_transition_time"] = pygame.time.get_ticks()
+    ui_timers.scene_transition_time = source.start()
+    prefetch_neighbor_backgrounds(scenes, current_scene)
+    warmup.start(scenes, current_scene)
+    
+    history.begin_step(current_scene)
     
     running = True
-    clicked_choice = None  # 現在フレームでクリックされた選択肢
+    needs_redraw = True
+    last_view = None  # 前回描画時の (ホバー中の選択肢, クリック可能か)
+    frames = 0
     
-    while running:
-        current_time = pygame.time.get_ticks()
-        
-        # ゲーム画面をクリア（インベントリエリアを除く）
-        game_area = pygame.Rect(0, 0, WIDTH, GAME_HEIGHT)
-        pygame.draw.rect(screen, WHITE, game_area)
+    while running and (max_frames is None or frames < max_frames):
+        frames += 1
+        profiler.begin_frame()
+        current_time, mouse = source.begin_frame()
         
         # 現在のシーンを取得
-        scene = scenes.get(current_scene, scenes["start"])
+        scene = scenes[current_scene]
         
         # シーンのアイテムを読み込み
         scene_items.load_scene_items(current_scene, scene)
         
-        # 背景画像があれば描画
-        if scene.get("background"):
-            try:
-                bg = pygame.image.load(scene["background"])
-                bg = pygame.transform.scale(bg, (WIDTH, GAME_HEIGHT))
-                screen.blit(bg, (0, 0))
-            except:
-                # 背景画像が読み込めない場合は何もしない
-                pass
+        # ホバー状態やクールダウン表示が変わったら再描画する
+        can_click = is_clickable(current_time)
+        choice_rects = get_choice_rects(scene)
+        view = (choice_at(choice_rects, mouse) if can_click else None, can_click)
+        if view != last_view or not event_driven or profiler.show_overlay:
+            needs_redraw = True
+        profiler.lap("scene")
         
-        # タイトルを描画
-        title_text = "アドベンチャーブック"
-        title_surf = title_font.render(title_text, True, BLACK)
-        title_rect = title_surf.get_rect(center=(WIDTH/2, 30))
-        screen.blit(title_surf, title_rect)
+        if needs_redraw:
+            draw_frame(scene, mouse, current_time)
+            needs_redraw = False
+            last_view = view
         
-        # シーンのテキストを描画
-        y_offset = 80
-        y_offset = draw_text(scene["text"], text_font, BLACK, screen, 50, y_offset, WIDTH - 100) + 30
-        
-        # シーンのアイテムを描画
-        current_scene_items = scene_items.get_scene_items(current_scene)
-        for clickable_item in current_scene_items:
-            clickable_item.draw(screen)
-        
-        # 選択肢を描画
-        choice_height = 50
-        max_choices_in_game_area = (GAME_HEIGHT - y_offset - 20) // (choice_height + 20)
-        
-        for i, choice in enumerate(scene["choices"]):
-            if i < max_choices_in_game_area:  # ゲームエリア内に収まる選択肢のみ表示
-                choice_y = y_offset + i * (choice_height + 20)
-                action = draw_choice_button(
-                    choice["text"], 
-                    WIDTH // 4, 
-                    choice_y, 
-                    WIDTH // 2, 
-                    choice_height, 
-                    GRAY, 
-                    DARK_GRAY, 
-                    choice["next"]
-                )
-                if action and not clicked_choice:
-                    clicked_choice = action
-        
-        # インベントリを描画
-        draw_inventory()
-        
-        # クールダウン状態の表示（デバッグ用）
-        can_click = (current_time - game_state["last_click_time"] > game_state["click_cooldown"] and
-                    current_time - game_state["scene_transition_time"] > game_state["scene_cooldown"])
-        
-        if not can_click:
-            cooldown_text = "待機中..."
-            cooldown_surf = inventory_font.render(cooldown_text, True, RED)
-            screen.blit(cooldown_surf, (WIDTH - 100, 10))
+        # イベントを待つ
+        if event_driven:
+            if can_click:
+                event_time, events = source.wait()
+            else:
+                # クールダウンが切れたら「待機中...」表示を消すために起きる
+                event_time, events = source.wait(max(cooldown_end_time() - current_time + 1, 1))
+        else:
+            source.tick(clock, fps)  # 既定は 60 FPS（0 の場合は制限しない）
+            event_time, events = source.wait(0)
+        profiler.lap("wait")
         
         # イベント処理
-        for event in pygame.event.get():
+        clicked_choice = None  # 現在フレームでクリックされた選択肢の遷移先（シーン番号）
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     running = False
+                elif event.key == pygame.K_BACKSPACE:
+                    if rewind(scenes, 1, event_time):
+                        prefetch_neighbor_backgrounds(scenes, current_scene)
+                        needs_redraw = True
+                elif event.key == pygame.K_F3 and profiler.enabled:
+                    profiler.show_overlay = not profiler.show_overlay
+                    needs_redraw = True
+            elif event.type == pygame.VIDEORESIZE:
+                pygame.time.set_timer(RESIZE_SETTLED, RESIZE_DELAY, loops=1)  # 届くたびに待ち時間を延ばす
+            elif event.type == RESIZE_SETTLED:
+                if resize_display(scenes):
+                    needs_redraw = True
+            elif event.type == ASSET_READY:
+                # 背景画像の読み込みが終わったので描き直す
+                needs_redraw = True
+            elif event.type == RELOAD_CHECK and reloader:
+                result = reloader.poll()
+                if result:
+                    apply_reload(scenes, result)
+                    needs_redraw = True
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # 左クリック
-                    if handle_click_event(event):
+                    if handle_click_event(event, event_time):
+                        needs_redraw = True
                         # アイテムクリックの処理
-                        if not scene_items.handle_click(current_scene, event.pos):
+                        if scene_items.handle_click(current_scene, event.pos, game_state):
+                            autosave_items(scenes[current_scene])
+                        else:
                             # アイテムがクリックされなかった場合のみ選択肢処理
-                            pass
+                            index = choice_at(choice_rects, event.pos)
+                            if index is not None and clicked_choice is None:
+                                clicked_choice = choice_rects[index][1].next
         
         # 選択肢がクリックされた場合のシーン遷移処理
-        if clicked_choice:
-            transition_to_scene(clicked_choice)
-            clicked_choice = None
-        
-        pygame.display.update()
-        clock.tick(60)  # 60 FPS
+        if clicked_choice is not None:
+            transition_to_scene(scenes[clicked_choice], event_time)
+            prefetch_neighbor_backgrounds(scenes, current_scene)
+            needs_redraw = True
+        profiler.lap("events")
+        profiler.end_frame()
     
-    pygame.quit()
-    sys.exit()
+    warmup.cancel()
+    source.close(session_summary(scenes))
+    if reloader:
+        pygame.time.set_timer(RELOAD_CHECK, 0)
+    profiler.close()
+    if save_journal:
+        save_journal.close()
+    return frames
 
 # ゲーム開始
 if __name__ == "__main__":
-    game_loop()
+    parser = argparse.ArgumentParser(description="フクロウの冒険")
+    parser.add_argument("--fixed-fps", action="store_true",
+                        help="入力がなくても毎フレーム（60 FPS）再描画する")
+    parser.add_argument("--autosave", default="save", metavar="PREFIX",
+                        help="自動セーブのファイル名（PREFIX.snap / PREFIX.journal）")
+    parser.add_argument("--no-autosave", action="store_true", help="自動セーブしない")
+    parser.add_argument("--continue", dest="resume", action="store_true",
+                        help="自動セーブの続きから始める")
+    parser.add_argument("--scenes", default=DEFAULT_SCENE_FILE, help="シーンファイルのパス")
+    parser.add_argument("--bundle", help="bundle.py で作ったバンドル（シーンと画像をここから読む）")
+    parser.add_argument("--profile", action="store_true",
+                        help="各段階の処理時間を計測する（F3でオーバーレイを表示）")
+    parser.add_argument("--trace", metavar="FILE", help="フレームごとの処理時間をファイルに書き出す")
+    parser.add_argument("--trace-format", choices=["jsonl", "chrome"], default="jsonl",
+                        help="書き出す形式（chrome は chrome://tracing や Perfetto で開ける）")
+    parser.add_argument("--watch", action="store_true",
+                        help="シーンファイルの変更を確認し、変わったシーンを再起動せずに反映する")
+    parser.add_argument("--record", metavar="FILE",
+                        help="入力を記録する（replay.py で再生できる）")
+    parser.add_argument("--font", help="日本語フォントのパス（指定しない場合は自動で探して結果をキャッシュする）")
+    parser.add_argument("--window", type=parse_size, default=(WIDTH, HEIGHT), metavar="WxH",
+                        help="ウィンドウの大きさ（既定は 800x600、表示は縦横比を保って拡大する）")
+    parser.add_argument("--resizable", action="store_true", help="ウィンドウの大きさを変えられるようにする")
+    parser.add_argument("--fullscreen", action="store_true", help="モニターの解像度のフルスクリーンで表示する")
+    args = parser.parse_args()
+    if args.font:
+        fonts.configure(args.font)
+    if args.window != (WIDTH, HEIGHT) or args.resizable or args.fullscreen:
+        set_display_mode(args.window, args.resizable, args.fullscreen)
+    if args.record and args.resume:
+        parser.error("--record は新しいゲームでのみ使えます（--continue とは併用できません）")
+    if args.bundle and args.watch:
+        parser.error("--watch はシーンファイルにのみ使えます（--bundle とは併用できません）")
+    game_loop(scene_file=args.scenes,
+              profile=args.profile,
+              trace=args.trace,
+              trace_format=args.trace_format,
+              event_driven=not args.fixed_fps,
+              autosave=None if args.no_autosave else args.autosave,
+              resume=args.resume,
+              watch=args.watch,
+              input_source=InputRecorder(args.record) if args.record else None,
+              bundle=args.bundle)
+    assets.shutdown()
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,126 @@
+import json
+import time
+from collections import deque
+
+# フレームごとの処理時間の計測
+# ゲームループの各段階（イベント処理・静的レイヤー・ボタン・インベントリなど）の時間を perf_counter_ns で測り、
+# 直近のフレームから p50/p95/p99 を求める。フレームごとの記録は JSONL か Chrome のトレース形式で書き出せる
+# 計測しない場合は NullProfiler を使う（何もしないのでほとんどコストがかからない）
+
+PERCENTILES = (0.50, 0.95, 0.99)
+IDLE_STAGES = ("wait",)  # 入力待ちなど、処理時間に数えない段階
+
+
+# 計測しない場合のプロファイラ
+class NullProfiler:
+    enabled = False
+    show_overlay = False
+
+    def begin_frame(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FrameProfiler:
+    enabled = True
+
+    # trace_path を指定するとフレームごとの記録を書き出す（trace_format は "jsonl" か "chrome"）
+    def __init__(self, window=600, trace_path=None, trace_format="jsonl"):
+        self.window = window
+        self.samples = {}  # 段階名: 直近の時間(ns)
+        self.frame_times = deque(maxlen=window)
+        self.frames = 0
+        self.show_overlay = False
+        self.overlay_interval = 30  # オーバーレイの数値を更新する間隔（フレーム数）
+        self._overlay_lines = []
+        self._overlay_frame = None
+        self._frame_start = 0
+        self._last = 0
+        self._laps = []
+        self._trace = None
+        self._trace_format = trace_format
+        self._trace_first = True
+        if trace_path:
+            if trace_format not in ("jsonl", "chrome"):
+                raise ValueError(f"不明なトレース形式です: {trace_format}")
+            self._trace = open(trace_path, "w", encoding="utf-8")
+            if trace_format == "chrome":
+                self._trace.write("[\n")
+
+    def begin_frame(self):
+        self._frame_start = self._last = time.perf_counter_ns()
+        self._laps = []
+
+    # 前回の区切りからここまでの時間を stage の時間として記録する
+    def lap(self, stage):
+        now = time.perf_counter_ns()
+        self._laps.append((stage, self._last, now - self._last))
+        self._last = now
+
+    def end_frame(self):
+        # 待機時間はフレームの処理時間に含めない
+        total = sum(duration for stage, _, duration in self._laps if stage not in IDLE_STAGES)
+        self.frames += 1
+        self.frame_times.append(total)
+        for stage, _, duration in self._laps:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append(duration)
+        if self._trace:
+            self._write_trace()
+
+    def _write_trace(self):
+        if self._trace_format == "jsonl":
+            record = {"frame": self.frames, "start_ns": self._frame_start,
+                      "stages": {stage: duration for stage, _, duration in self._laps}}
+            self._trace.write(json.dumps(record) + "\n")
+            return
+        # Chrome のトレース形式（chrome://tracing や Perfetto で開ける）
+        events = [{"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                   "ts": self._frame_start / 1000, "dur": (self._last - self._frame_start) / 1000}]
+        for stage, start, duration in self._laps:
+            events.append({"name": stage, "ph": "X", "pid": 1, "tid": 1,
+                           "ts": start / 1000, "dur": duration / 1000})
+        for event in events:
+            if not self._trace_first:
+                self._trace.write(",\n")
+            self._trace_first = False
+            self._trace.write(json.dumps(event))
+
+    # 段階ごとの p50/p95/p99（ミリ秒）を返す
+    def percentiles(self):
+        result = {}
+        for stage, samples in list(self.samples.items()) + [("frame", self.frame_times)]:
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[stage] = tuple(ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1e6
+                                  for p in PERCENTILES)
+        return result
+
+    # オーバーレイに表示する行（overlay_interval フレームごとに計算し直す）
+    def overlay_lines(self):
+        if self._overlay_frame is not None and self.frames - self._overlay_frame < self.overlay_interval:
+            return self._overlay_lines
+        lines = [f"{'stage':<12} {'p50':>6} {'p95':>6} {'p99':>6} ms"]
+        for stage, (p50, p95, p99) in self.percentiles().items():
+            lines.append(f"{stage:<12} {p50:6.2f} {p95:6.2f} {p99:6.2f}")
+        self._overlay_lines = tuple(lines)
+        self._overlay_frame = self.frames
+        return self._overlay_lines
+
+    def close(self):
+        if self._trace:
+            if self._trace_format == "chrome":
+                self._trace.write("\n]\n")
+            self._trace.close()
+            self._trace = None
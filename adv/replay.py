@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+# 入力の記録と再生
+# ゲームループは入力（時刻・マウス位置・イベント）をすべて入力元から受け取る
+#   LiveInput     : 実際の pygame の入力
+#   InputRecorder : 実際の入力を使いながら、フレームごとの入力をファイルに記録する
+#   InputReplayer : 記録したファイルの入力を仮想の時計で再生する（待たないので CPU の限り速く進む）
+# 記録の最後には終了時の状態（シーン・インベントリ・フラグ）を書いておき、再生後の状態と比べられる
+# マウス位置・クリック位置は論理座標（viewport.py）で扱うので、ウィンドウの大きさが違っても同じように再生できる
+#
+#   python main.py --record session.rec
+#   python replay.py session.rec
+#
+# ファイルの形式
+#   ヘッダー: マジック, バージョン, 開始時刻(ms)
+#   フレーム: フレーム開始時刻, イベント取得時刻, マウスx, マウスy, イベント数（255 は終了時の状態）
+#   イベント: 種類, コード（ボタン・キー）, x, y
+#   終了時の状態: JSON の長さ, JSON
+
+MAGIC = b"ADVR"
+VERSION = 2  # 2: キーコードを32ビットで記録（pygame 2 のファンクションキー・矢印キーは 2^30 を超える）
+HEADER = struct.Struct("<4sBI")
+FRAME = struct.Struct("<IIhhB")
+EVENT = struct.Struct("<BIhh")
+LENGTH = struct.Struct("<I")
+SUMMARY_MARK = 255
+
+# main.py・各ツールで共通の既定のシーンファイル（カレントディレクトリではなく main.py のあるフォルダ）
+DEFAULT_SCENE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenes.json")
+
+EVENT_QUIT = 0
+EVENT_KEY = 1
+EVENT_CLICK = 2
+
+
+def _pygame():
+    import pygame
+    return pygame
+
+
+# イベントを (種類, コード, x, y) にする（記録しないイベントは None）
+def encode_event(event):
+    pygame = _pygame()
+    if event.type == pygame.QUIT:
+        return (EVENT_QUIT, 0, 0, 0)
+    if event.type == pygame.KEYDOWN:
+        return (EVENT_KEY, event.key, 0, 0)
+    if event.type == pygame.MOUSEBUTTONDOWN:
+        return (EVENT_CLICK, event.button, event.pos[0], event.pos[1])
+    return None
+
+
+def decode_event(kind, code, x, y):
+    pygame = _pygame()
+    if kind == EVENT_QUIT:
+        return pygame.event.Event(pygame.QUIT)
+    if kind == EVENT_KEY:
+        return pygame.event.Event(pygame.KEYDOWN, key=code, mod=0, unicode="", scancode=0)
+    if kind == EVENT_CLICK:
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=code, pos=(x, y))
+    raise ValueError(f"不明なイベントの種類です: {kind}")
+
+
+# 実際の pygame の入力
+class LiveInput:
+    replaying = False
+    viewport = None  # 設定すると、マウス位置・クリック位置を論理座標に変換して返す
+
+    def start(self):
+        return _pygame().time.get_ticks()
+
+    # フレーム開始時の (時刻, マウス位置)
+    def begin_frame(self):
+        pygame = _pygame()
+        pos = pygame.mouse.get_pos()
+        return pygame.time.get_ticks(), self.viewport.to_logical(pos) if self.viewport else pos
+
+    # マウスのイベントの位置を論理座標にする
+    def _to_logical(self, events):
+        if self.viewport is None or self.viewport.identity:
+            return events
+        pygame = _pygame()
+        return [pygame.event.Event(e.type, dict(e.dict, pos=self.viewport.to_logical(e.pos)))
+                if e.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION) else e
+                for e in events]
+
+    # イベントを待って (時刻, イベント) を返す（timeout=None は入力まで待つ、0 は待たない）
+    def wait(self, timeout=None):
+        pygame = _pygame()
+        if timeout == 0:
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait(timeout) if timeout else pygame.event.wait()]
+            events.extend(pygame.event.get())
+        return pygame.time.get_ticks(), self._to_logical(events)
+
+    def tick(self, clock, fps):
+        clock.tick(fps)
+
+    def close(self, summary=None):
+        pass
+
+
+# 実際の入力を使いながら記録する
+class InputRecorder(LiveInput):
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        self._frame = None
+        self.frames = 0
+
+    def start(self):
+        start_time = super().start()
+        self._file.write(HEADER.pack(MAGIC, VERSION, start_time))
+        return start_time
+
+    def begin_frame(self):
+        self._frame = super().begin_frame()
+        return self._frame
+
+    def wait(self, timeout=None):
+        event_time, events = super().wait(timeout)
+        encoded = [e for e in map(encode_event, events) if e is not None][:SUMMARY_MARK - 1]
+        frame_time, (x, y) = self._frame
+        self._file.write(FRAME.pack(frame_time, event_time, x, y, len(encoded)))
+        for record in encoded:
+            self._file.write(EVENT.pack(*record))
+        self.frames += 1
+        return event_time, events
+
+    def close(self, summary=None):
+        if self._file is None:
+            return
+        if summary is not None:
+            data = json.dumps(summary, ensure_ascii=False).encode("utf-8")
+            self._file.write(FRAME.pack(0, 0, 0, 0, SUMMARY_MARK))
+            self._file.write(LENGTH.pack(len(data)))
+            self._file.write(data)
+        self._file.close()
+        self._file = None
+
+
+# 記録したファイルを読み込んで (開始時刻, フレームの並び, 終了時の状態) を返す
+def read_recording(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError("記録ファイルが短すぎます")
+    magic, version, start_time = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("記録ファイルの形式が違います")
+    pos = HEADER.size
+    frames = []
+    summary = None
+    while pos + FRAME.size <= len(data):
+        frame_time, event_time, x, y, count = FRAME.unpack_from(data, pos)
+        pos += FRAME.size
+        if count == SUMMARY_MARK:
+            (length,) = LENGTH.unpack_from(data, pos)
+            pos += LENGTH.size
+            summary = json.loads(data[pos:pos + length])
+            break
+        if pos + count * EVENT.size > len(data):
+            break  # 記録の途中で終わっている（記録中に強制終了した場合など）
+        events = [EVENT.unpack_from(data, pos + i * EVENT.size) for i in range(count)]
+        pos += count * EVENT.size
+        frames.append((frame_time, event_time, (x, y), events))
+    return start_time, frames, summary
+
+
+# 記録した入力を仮想の時計で再生する（記録が終わったら QUIT を返す）
+class InputReplayer:
+    replaying = True
+
+    def __init__(self, path):
+        self.path = path
+        self.start_time, self.frames, self.expected = read_recording(path)
+        self._position = 0
+        self._current = None
+        self.summary = None
+
+    def start(self):
+        return self.start_time
+
+    def begin_frame(self):
+        if self._position < len(self.frames):
+            self._current = self.frames[self._position]
+            self._position += 1
+            return self._current[0], self._current[2]
+        self._current = None
+        return (self.frames[-1][1] if self.frames else self.start_time), (0, 0)
+
+    def wait(self, timeout=None):
+        pygame = _pygame()
+        pygame.event.pump()
+        pygame.event.clear()  # 実際の入力や非同期のイベントは使わない
+        if self._current is None:
+            return (self.frames[-1][1] if self.frames else self.start_time), [pygame.event.Event(pygame.QUIT)]
+        return self._current[1], [decode_event(*record) for record in self._current[3]]
+
+    def tick(self, clock, fps):
+        pass
+
+    def close(self, summary=None):
+        self.summary = summary
+
+    # 再生後の状態が記録と一致するか（記録に終了時の状態がない場合は None）
+    def matches(self):
+        if self.expected is None:
+            return None
+        return self.summary == self.expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="記録した入力の再生")
+    parser.add_argument("recording", help="main.py --record で記録したファイル")
+    parser.add_argument("--scenes", default=DEFAULT_SCENE_FILE, help="シーンファイルのパス")
+    parser.add_argument("--bundle", help="bundle.py で作ったバンドル（記録時に --bundle を使った場合）")
+    parser.add_argument("--show", action="store_true", help="画面を表示する（既定は画面なしで実行）")
+    parser.add_argument("--profile", action="store_true", help="各段階の処理時間を計測する")
+    parser.add_argument("--trace", metavar="FILE", help="フレームごとの処理時間をファイルに書き出す")
+    args = parser.parse_args()
+
+    if not args.show:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import main as game
+
+    replayer = InputReplayer(args.recording)
+    started = time.perf_counter()
+    frames = game.game_loop(scene_file=args.scenes, input_source=replayer,
+                            profile=args.profile, trace=args.trace, bundle=args.bundle)
+    elapsed = time.perf_counter() - started
+    print(f"{frames} フレームを {elapsed:.3f} 秒で再生しました（{frames / max(elapsed, 1e-9):.0f} フレーム/秒）")
+    print(f"終了時の状態: {json.dumps(replayer.summary, ensure_ascii=False)}")
+
+    matches = replayer.matches()
+    if matches is None:
+        print("記録に終了時の状態がないため、比較できません")
+    elif matches:
+        print("記録と一致しました")
+    else:
+        print(f"記録と一致しません（記録: {json.dumps(replayer.expected, ensure_ascii=False)}）")
+        game.assets.shutdown()
+        sys.exit(1)
+    game.assets.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+import os
+import struct
+import threading
+import zlib
+
+# クラッシュに強い差分セーブ
+# シーン遷移・アイテムの入れ替え・フラグ設定を差分として追記専用のジャーナルに書き込み、
+# 一定数たまったらスナップショットにまとめる（一時ファイルに書いてから rename するので壊れない）
+# 書き込みはバックグラウンドのスレッドがまとめて行い fsync するので、ゲームループは止まらない
+#
+# ファイル形式（どちらもヘッダーの後にレコードが並ぶ）
+#   ヘッダー: マジック(4バイト) バージョン(1バイト) 世代番号(4バイト)
+#   レコード: 長さ(4バイト) CRC32(4バイト) 本体（操作の種類1バイト + 引数）
+# ジャーナルの世代番号がスナップショットと一致する場合だけジャーナルを再生する
+
+SNAPSHOT_MAGIC = b"ADVS"
+JOURNAL_MAGIC = b"ADVJ"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBI")
+FRAME = struct.Struct("<II")
+U16 = struct.Struct("<H")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+ITEM_RECT = struct.Struct("<iiii?")
+
+# 操作の種類
+OP_SCENE = 1  # シーン遷移: シーンID
+OP_INVENTORY = 2  # 旧形式のインベントリ: 最後に拾ったアイテム1つ（なしの場合もある、読み込みだけ対応）
+OP_FLAG = 3  # フラグ設定: フラグ名, 値（None は削除）
+OP_SCENE_ITEMS = 4  # シーン内アイテムの置き換え: シーンID, [アイテム, x, y, 幅, 高さ, 収集済み] の並び
+OP_ITEMS = 5  # インベントリの置き換え: アイテムの並び（拾った順）
+
+
+class SaveError(Exception):
+    pass
+
+
+# 空のセーブ状態
+def empty_state():
+    return {"scene": None, "inventory": [], "flags": {}, "scene_items": {}}
+
+
+# セーブ状態に差分を1つ適用する関数
+def apply_delta(state, op, args):
+    if op == OP_SCENE:
+        state["scene"] = args
+    elif op == OP_INVENTORY:
+        state["inventory"] = [args] if args is not None else []
+    elif op == OP_ITEMS:
+        state["inventory"] = args
+    elif op == OP_FLAG:
+        name, value = args
+        if value is None:
+            state["flags"].pop(name, None)
+        else:
+            state["flags"][name] = value
+    elif op == OP_SCENE_ITEMS:
+        scene_id, entries = args
+        state["scene_items"][scene_id] = entries
+    else:
+        raise SaveError(f"不明な操作です: {op}")
+    return state
+
+
+# ---- エンコード ----
+
+def _pack_str(text):
+    data = text.encode("utf-8")
+    return U16.pack(len(data)) + data
+
+
+def _pack_item(item):
+    # アイテムは (名前, (R, G, B)) または None
+    if item is None:
+        return b"\x00"
+    name, color = item
+    return b"\x01" + _pack_str(name) + bytes(color[:3])
+
+
+def _pack_value(value):
+    if value is None:
+        return b"n"
+    if isinstance(value, bool):
+        return b"b" + (b"\x01" if value else b"\x00")
+    if isinstance(value, int):
+        return b"i" + I64.pack(value)
+    if isinstance(value, float):
+        return b"f" + F64.pack(value)
+    if isinstance(value, str):
+        return b"s" + _pack_str(value)
+    raise SaveError(f"保存できない値です: {value!r}")
+
+
+def encode_delta(op, args):
+    if op == OP_SCENE:
+        body = _pack_str(args)
+    elif op == OP_INVENTORY:
+        body = _pack_item(args)
+    elif op == OP_ITEMS:
+        body = U16.pack(len(args)) + b"".join(_pack_item(item) for item in args)
+    elif op == OP_FLAG:
+        name, value = args
+        body = _pack_str(name) + _pack_value(value)
+    elif op == OP_SCENE_ITEMS:
+        scene_id, entries = args
+        body = _pack_str(scene_id) + U16.pack(len(entries))
+        for item, x, y, width, height, collected in entries:
+            body += _pack_item(item) + ITEM_RECT.pack(x, y, width, height, collected)
+    else:
+        raise SaveError(f"不明な操作です: {op}")
+    payload = bytes((op,)) + body
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+# ---- デコード ----
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size):
+        if self.pos + size > len(self.data):
+            raise SaveError("レコードが途中で切れています")
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def unpack(self, fmt):
+        return fmt.unpack(self.take(fmt.size))
+
+    def str(self):
+        (size,) = self.unpack(U16)
+        return bytes(self.take(size)).decode("utf-8")
+
+    def item(self):
+        if self.take(1) == b"\x00":
+            return None
+        name = self.str()
+        return (name, tuple(self.take(3)))
+
+    def value(self):
+        tag = bytes(self.take(1))
+        if tag == b"n":
+            return None
+        if tag == b"b":
+            return self.take(1) != b"\x00"
+        if tag == b"i":
+            return self.unpack(I64)[0]
+        if tag == b"f":
+            return self.unpack(F64)[0]
+        if tag == b"s":
+            return self.str()
+        raise SaveError(f"不明な値の種類です: {tag!r}")
+
+
+def decode_delta(payload):
+    reader = _Reader(payload)
+    op = reader.take(1)[0]
+    if op == OP_SCENE:
+        args = reader.str()
+    elif op == OP_INVENTORY:
+        args = reader.item()
+    elif op == OP_ITEMS:
+        (count,) = reader.unpack(U16)
+        args = [reader.item() for _ in range(count)]
+    elif op == OP_FLAG:
+        args = (reader.str(), reader.value())
+    elif op == OP_SCENE_ITEMS:
+        scene_id = reader.str()
+        (count,) = reader.unpack(U16)
+        entries = []
+        for _ in range(count):
+            item = reader.item()
+            entries.append((item,) + reader.unpack(ITEM_RECT))
+        args = (scene_id, entries)
+    else:
+        raise SaveError(f"不明な操作です: {op}")
+    return op, args
+
+
+# ヘッダーの後に並ぶレコードを読む（壊れたレコードが見つかったらそこで止める）
+# 戻り値: ([(op, args), ...], 読めたバイト数)
+def read_records(data, start):
+    records = []
+    pos = start
+    while pos + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, pos)
+        payload = data[pos + FRAME.size:pos + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        try:
+            records.append(decode_delta(payload))
+        except (SaveError, UnicodeDecodeError):
+            break
+        pos += FRAME.size + length
+    return records, pos
+
+
+# セーブ状態を、状態を作り直すためのレコード列にする
+def state_records(state):
+    records = []
+    if state["scene"] is not None:
+        records.append(encode_delta(OP_SCENE, state["scene"]))
+    records.append(encode_delta(OP_ITEMS, state["inventory"]))
+    for name, value in state["flags"].items():
+        records.append(encode_delta(OP_FLAG, (name, value)))
+    for scene_id, entries in state["scene_items"].items():
+        records.append(encode_delta(OP_SCENE_ITEMS, (scene_id, entries)))
+    return records
+
+
+# 復元結果の報告
+class RecoveryReport:
+    def __init__(self):
+        self.generation = 0
+        self.snapshot_found = False
+        self.snapshot_records = 0
+        self.journal_records = 0
+        self.discarded_bytes = 0  # 壊れていて捨てたジャーナルの末尾
+        self.stale_journal = False  # スナップショットと世代が合わず使わなかったジャーナル
+
+    def __str__(self):
+        if not self.snapshot_found and not self.journal_records:
+            return "セーブデータはありません"
+        text = (f"セーブデータを復元しました（世代 {self.generation}、"
+                f"スナップショット {self.snapshot_records} 件 + ジャーナル {self.journal_records} 件）")
+        if self.discarded_bytes:
+            text += f"、壊れた末尾 {self.discarded_bytes} バイトを破棄"
+        if self.stale_journal:
+            text += "、古いジャーナルを無視"
+        return text
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def _read_header(data, magic):
+    if data is None or len(data) < HEADER.size:
+        return None
+    file_magic, version, generation = HEADER.unpack_from(data, 0)
+    if file_magic != magic or version != VERSION:
+        return None
+    return generation
+
+
+# スナップショットとジャーナルから状態を復元する関数
+def recover(prefix):
+    state = empty_state()
+    report = RecoveryReport()
+
+    snapshot = _read_file(prefix + ".snap")
+    generation = _read_header(snapshot, SNAPSHOT_MAGIC)
+    if generation is not None:
+        records, _ = read_records(snapshot, HEADER.size)
+        for op, args in records:
+            apply_delta(state, op, args)
+        report.snapshot_found = True
+        report.snapshot_records = len(records)
+        report.generation = generation
+
+    journal = _read_file(prefix + ".journal")
+    journal_generation = _read_header(journal, JOURNAL_MAGIC)
+    if journal_generation is not None:
+        if journal_generation == report.generation:
+            records, end = read_records(journal, HEADER.size)
+            for op, args in records:
+                apply_delta(state, op, args)
+            report.journal_records = len(records)
+            report.discarded_bytes = len(journal) - end
+        else:
+            report.stale_journal = True
+
+    return state, report
+
+
+# 一時ファイルに書いてから置き換える（途中で落ちても元のファイルは壊れない）
+def _atomic_write(path, chunks):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # Windows ではディレクトリを開けない
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# 差分セーブの本体
+class SaveJournal:
+    # resume=False の場合は既存のセーブを読まずに新しく始める
+    # （既存のセーブは最初の差分を書くときまで上書きしないので、何もせずに終了すれば残る）
+    def __init__(self, prefix="save", compact_every=500, batch_delay=0.05, resume=True):
+        self.prefix = prefix
+        self.snapshot_path = prefix + ".snap"
+        self.journal_path = prefix + ".journal"
+        self.compact_every = compact_every  # この件数たまったらスナップショットにまとめる
+        self.batch_delay = batch_delay  # 書き込みをまとめるために待つ秒数
+
+        # 既存のセーブを復元し、すぐにまとめ直す（壊れた末尾もここで消える）
+        # 新しく始める場合は、最初の差分を書くときにまとめ直す
+        if resume:
+            self._mirror, self.report = recover(prefix)  # _mirror は書き込みスレッドが持つ、ファイルと一致した状態
+        else:
+            self._mirror, self.report = empty_state(), RecoveryReport()
+            self.report.generation = _read_header(_read_file(self.snapshot_path), SNAPSHOT_MAGIC) or 0
+        self.recovered = _copy_state(self._mirror)  # 起動時に復元された状態（ゲーム側で使う）
+        self.generation = self.report.generation
+        self._journal = None
+        self._records_since_snapshot = 0
+        if resume:
+            self._compact()
+
+        self._pending = []
+        self._written = 0
+        self._submitted = 0
+        self._closing = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._run, name="save-writer", daemon=True)
+        self._writer.start()
+
+    # ---- 記録（ゲームループから呼ぶ、すぐに戻る） ----
+
+    def record_scene(self, scene_id):
+        self._submit(OP_SCENE, scene_id)
+
+    # items はインベントリ全体（(名前, 色) の並び、拾った順）
+    def record_inventory(self, items):
+        self._submit(OP_ITEMS, [tuple(item) for item in items])
+
+    def record_flag(self, name, value):
+        self._submit(OP_FLAG, (name, value))
+
+    def record_scene_items(self, scene_id, entries):
+        self._submit(OP_SCENE_ITEMS, (scene_id, [tuple(entry) for entry in entries]))
+
+    def _submit(self, op, args):
+        frame = encode_delta(op, args)
+        with self._cond:
+            if self._closing:
+                raise SaveError("セーブはすでに閉じられています")
+            self._pending.append((op, args, frame))
+            self._submitted += 1
+            self._cond.notify()
+
+    # ---- 書き込みスレッド ----
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._closing:
+                    # 少し待って、続けて来る差分をまとめて書く
+                    self._cond.wait(self.batch_delay)
+                batch, self._pending = self._pending, []
+                closing = self._closing
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError as e:
+                    self.error = e
+                    print(f"セーブに失敗しました: {e}")
+                with self._cond:
+                    self._written += len(batch)
+                    self._cond.notify_all()
+            if closing:
+                break
+
+    def _write(self, batch):
+        if self._journal is None:
+            self._compact()  # 新しく始めた場合の最初の書き込み
+        for op, args, frame in batch:
+            apply_delta(self._mirror, op, args)
+        self._journal.write(b"".join(frame for _, _, frame in batch))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._records_since_snapshot += len(batch)
+        if self._records_since_snapshot >= self.compact_every:
+            self._compact()
+
+    # スナップショットを書き、新しい世代のジャーナルを始める
+    def _compact(self):
+        generation = self.generation + 1
+        _atomic_write(self.snapshot_path,
+                      [HEADER.pack(SNAPSHOT_MAGIC, VERSION, generation)] + state_records(self._mirror))
+        _atomic_write(self.journal_path, [HEADER.pack(JOURNAL_MAGIC, VERSION, generation)])
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "ab")
+        self.generation = generation
+        self._records_since_snapshot = 0
+
+    # ここまでに記録した差分がディスクに書かれるまで待つ
+    def flush(self, timeout=None):
+        with self._cond:
+            target = self._submitted
+            self._cond.notify()
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        if self._journal is not None:
+            self._journal.close()
+
+
+def _copy_state(state):
+    return {
+        "scene": state["scene"],
+        "inventory": list(state["inventory"]),
+        "flags": dict(state["flags"]),
+        "scene_items": {scene_id: list(entries) for scene_id, entries in state["scene_items"].items()},
+    }
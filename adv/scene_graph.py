@@ -0,0 +1,131 @@
+import sys
+
+from conditions import Symbols, compile_condition
+from game_utils import load_scenes
+
+# コンパイル済みのシーングラフ
+# scenes.json の入れ子の辞書を、シーンIDを整数の番号に置き換えたコンパクトな形に変換する
+# 選択肢の遷移先は読み込み時に解決・検証するので、実行中に文字列で辞書を引く必要がない
+
+
+class SceneGraphError(ValueError):
+    pass
+
+
+# シーン内のアイテムの定義
+class ItemSpec:
+    __slots__ = ("name", "color", "x", "y", "width", "height")
+
+    def __init__(self, name, color, x, y, width, height):
+        self.name = name
+        self.color = color
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def _key(self):
+        return (self.name, self.color, self.x, self.y, self.width, self.height)
+
+    def __eq__(self, other):
+        return isinstance(other, ItemSpec) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+# 選択肢（next は遷移先シーンの番号、test はコンパイル済みの条件）
+class Choice:
+    __slots__ = ("text", "next", "condition", "test")
+
+    def __init__(self, text, next, condition=None, test=None):
+        self.text = text
+        self.next = next
+        self.condition = condition
+        self.test = test
+
+
+# シーン
+class Scene:
+    __slots__ = ("index", "id", "text", "choices", "background", "items")
+
+    def __init__(self, index, id, text, choices, background, items):
+        self.index = index
+        self.id = id
+        self.text = text
+        self.choices = choices
+        self.background = background
+        self.items = items
+
+
+class SceneGraph:
+    def __init__(self, ids, scenes, symbols, start="start"):
+        self.ids = ids  # 番号: シーンID
+        self.index = {scene_id: i for i, scene_id in enumerate(ids)}  # シーンID: 番号
+        self.scenes = scenes  # 番号: Scene
+        self.symbols = symbols  # 条件で使うフラグ名・アイテム名の表
+        if start not in self.index:
+            raise SceneGraphError(f"開始シーン '{start}' がありません")
+        self.start = self.index[start]
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def __getitem__(self, index):
+        return self.scenes[index]
+
+    def __iter__(self):
+        return iter(self.scenes)
+
+    def __contains__(self, scene_id):
+        return scene_id in self.index
+
+    # シーンIDからシーンを取得する
+    def by_id(self, scene_id):
+        return self.scenes[self.index[scene_id]]
+
+    # scene_store.SceneStore.peek と同じ（すべて読み込み済みなのでそのまま返す）
+    def peek(self, index):
+        return self.scenes[index]
+
+    # 遷移できるシーンを返す（すべて読み込み済みなので、scene_store.SceneStore と違いデコードはしない）
+    def warm_neighbors(self, index):
+        return [self.scenes[choice.next] for choice in self.scenes[index].choices]
+
+
+# シーンデータの辞書を1シーン分コンパイルする
+def compile_scene(index, scene_id, scene_data, scene_index, symbols):
+    choices = []
+    for choice_data in scene_data.get("choices", []):
+        target = choice_data["next"]
+        if target not in scene_index:
+            raise SceneGraphError(f"シーン '{scene_id}' の選択肢 '{choice_data.get('text', '')}' の"
+                                  f"遷移先 '{target}' がありません")
+        condition = choice_data.get("condition")
+        test = compile_condition(condition, symbols) if condition is not None else None
+        choices.append(Choice(sys.intern(choice_data.get("text", "")), scene_index[target],
+                              condition, test))
+
+    items = []
+    for item_data in scene_data.get("items") or []:
+        items.append(ItemSpec(sys.intern(item_data["name"]), tuple(item_data["color"]),
+                              item_data["x"], item_data["y"],
+                              item_data["width"], item_data["height"]))
+
+    return Scene(index, scene_id, scene_data.get("text", ""), tuple(choices),
+                 scene_data.get("background"), tuple(items))
+
+
+# シーンデータの辞書全体をコンパイルする関数
+def compile_scenes(scenes, start="start"):
+    ids = [sys.intern(scene_id) for scene_id in scenes]
+    scene_index = {scene_id: i for i, scene_id in enumerate(ids)}
+    symbols = Symbols()
+    compiled = [compile_scene(i, scene_id, scenes[scene_id], scene_index, symbols)
+                for i, scene_id in enumerate(ids)]
+    return SceneGraph(ids, compiled, symbols, start)
+
+
+# シーンファイルを読み込んでコンパイルする関数
+def load_scene_graph(file_path="scenes.json", start="start"):
+    return compile_scenes(load_scenes(file_path), start)
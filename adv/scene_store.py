@@ -0,0 +1,327 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+from conditions import Symbols
+from scene_graph import SceneGraphError, compile_scene, load_scene_graph
+
+# 巨大なシーンファイル用の遅延読み込みストア
+# 最初に一度だけシーンID → バイト範囲の索引を作ってシーンファイルの隣にキャッシュし、
+# 実行中はファイルをメモリマップして必要なシーンだけをデコードする（小さなLRUキャッシュ付き）
+# 起動時間と常駐メモリがストーリーの大きさに比例しなくなる
+#
+# 索引ファイル（<シーンファイル>.idx）の形式
+#   ヘッダー: マジック, バージョン, 元ファイルのサイズ, 更新時刻(ns), シーン数, キー領域の位置
+#   レコード: キーの位置, キーの長さ, 値の開始位置, 値の終了位置（キーのバイト列順に並ぶ）
+#   キー領域: シーンIDを UTF-8 で並べたもの
+# レコードの並び順がそのままシーン番号になる
+
+INDEX_MAGIC = b"ADVI"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sBQQIQ")
+INDEX_RECORD = struct.Struct("<QIQQ")
+
+# 索引なしで普通に読み込むファイルサイズの上限（これより大きいと遅延読み込みにする）
+LAZY_THRESHOLD = 8 * 1024 * 1024
+
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+_STRING_TAIL = re.compile(rb'(?:[^"\\]|\\.)*"', re.S)
+_STRUCTURE = re.compile(rb'["{}\[\]]')
+_SCALAR_END = re.compile(rb"[,}\]\s]")
+
+
+# ---- 索引の作成 ----
+
+def _skip_whitespace(data, pos):
+    return _WHITESPACE.match(data, pos).end()
+
+
+# pos にある文字列の終わり（閉じ引用符の次）を返す
+def _string_end(data, pos):
+    match = _STRING_TAIL.match(data, pos + 1)
+    if match is None:
+        raise SceneGraphError(f"文字列が閉じられていません（{pos} バイト目）")
+    return match.end()
+
+
+# pos から始まる JSON の値の終わりを返す（中身はデコードしない）
+def _value_end(data, pos):
+    first = data[pos:pos + 1]
+    if first == b'"':
+        return _string_end(data, pos)
+    if first in (b"{", b"["):
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(data, pos)
+            if match is None:
+                raise SceneGraphError("オブジェクトが閉じられていません")
+            token = match.group()
+            if token == b'"':
+                pos = _string_end(data, match.start())
+                continue
+            depth += 1 if token in (b"{", b"[") else -1
+            pos = match.end()
+            if depth == 0:
+                return pos
+    match = _SCALAR_END.search(data, pos)
+    return match.start() if match else len(data)
+
+
+# シーンファイル（最上位がオブジェクト）を走査して (キー, 開始, 終了) の並びを返す
+def scan_top_level(data):
+    pos = _skip_whitespace(data, 0)
+    if data[pos:pos + 1] != b"{":
+        raise SceneGraphError("シーンファイルの最上位がオブジェクトではありません")
+    pos = _skip_whitespace(data, pos + 1)
+    entries = []
+    if data[pos:pos + 1] == b"}":
+        return entries
+    while True:
+        if data[pos:pos + 1] != b'"':
+            raise SceneGraphError(f"シーンIDがありません（{pos} バイト目）")
+        key_end = _string_end(data, pos)
+        key = json.loads(data[pos:key_end])
+        pos = _skip_whitespace(data, key_end)
+        if data[pos:pos + 1] != b":":
+            raise SceneGraphError(f"':' がありません（{pos} バイト目）")
+        start = _skip_whitespace(data, pos + 1)
+        end = _value_end(data, start)
+        entries.append((key.encode("utf-8"), start, end))
+        pos = _skip_whitespace(data, end)
+        separator = data[pos:pos + 1]
+        if separator == b",":
+            pos = _skip_whitespace(data, pos + 1)
+        elif separator == b"}":
+            return entries
+        else:
+            raise SceneGraphError(f"',' または '}}' がありません（{pos} バイト目）")
+
+
+def index_path_for(file_path):
+    return file_path + ".idx"
+
+
+# シーンファイルの中身（バイト列）の索引を作る関数
+# size・mtime_ns は元ファイルと一致しているかの確認用（ファイルでない場合は 0）
+def encode_index(data, size=0, mtime_ns=0):
+    entries = scan_top_level(data)
+    entries.sort()
+
+    records = []
+    keys = []
+    key_offset = 0
+    for key, start, end in entries:
+        records.append(INDEX_RECORD.pack(key_offset, len(key), start, end))
+        keys.append(key)
+        key_offset += len(key)
+
+    keys_offset = INDEX_HEADER.size + INDEX_RECORD.size * len(records)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, size, mtime_ns, len(records), keys_offset)
+    return header + b"".join(records) + b"".join(keys)
+
+
+# 索引を作ってファイルに書き出す関数
+def build_index(file_path):
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            index = encode_index(data, stat.st_size, stat.st_mtime_ns)
+    index_path = index_path_for(file_path)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(index)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+# 索引が元ファイルと一致しているか確認する関数
+def _index_is_fresh(file_path, index_path):
+    try:
+        with open(index_path, "rb") as file:
+            header = file.read(INDEX_HEADER.size)
+    except FileNotFoundError:
+        return False
+    if len(header) < INDEX_HEADER.size:
+        return False
+    magic, version, size, mtime_ns, _, _ = INDEX_HEADER.unpack(header)
+    stat = os.stat(file_path)
+    return (magic == INDEX_MAGIC and version == INDEX_VERSION and
+            size == stat.st_size and mtime_ns == stat.st_mtime_ns)
+
+
+# ---- 実行時の読み込み ----
+
+# 番号 → シーンID の並び（索引から必要なときだけ読む）
+class _SceneIds:
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        return self._store._key(index).decode("utf-8")
+
+
+# シーンID → 番号 の対応（索引を二分探索する）
+class _SceneIndex:
+    def __init__(self, store):
+        self._store = store
+
+    def __contains__(self, scene_id):
+        return self._store._find(scene_id) is not None
+
+    def __getitem__(self, scene_id):
+        index = self._store._find(scene_id)
+        if index is None:
+            raise KeyError(scene_id)
+        return index
+
+    def get(self, scene_id, default=None):
+        index = self._store._find(scene_id)
+        return default if index is None else index
+
+    def __len__(self):
+        return len(self._store)
+
+
+# scene_graph.SceneGraph と同じように使える、遅延読み込みのシーンストア
+class SceneStore:
+    def __init__(self, file_path, start="start", cache_size=256):
+        self.file_path = file_path
+        index_path = index_path_for(file_path)
+        if not _index_is_fresh(file_path, index_path):
+            build_index(file_path)
+
+        self._source_file = open(file_path, "rb")
+        self._index_file = open(index_path, "rb")
+        self._setup(mmap.mmap(self._source_file.fileno(), 0, access=mmap.ACCESS_READ),
+                    mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ), start, cache_size)
+
+    # メモリ上のシーンファイルの中身と索引から作る（bundle.AssetBundle のメモリマップの一部など）
+    @classmethod
+    def from_buffers(cls, source, index, start="start", cache_size=256, name="<memory>"):
+        store = cls.__new__(cls)
+        store.file_path = name
+        store._source_file = store._index_file = None
+        store._setup(source, index, start, cache_size)
+        return store
+
+    def _setup(self, source, index, start, cache_size):
+        self._source = source
+        self._index = index
+        magic, version, _, _, self._count, self._keys_offset = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise SceneGraphError(f"シーンの索引の形式が違います: {self.file_path}")
+
+        self.ids = _SceneIds(self)
+        self.index = _SceneIndex(self)
+        self.symbols = Symbols()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # 番号: Scene
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if start not in self.index:
+            raise SceneGraphError(f"開始シーン '{start}' がありません")
+        self.start = self.index[start]
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, scene_id):
+        return scene_id in self.index
+
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+    def _record(self, index):
+        return INDEX_RECORD.unpack_from(self._index, INDEX_HEADER.size + index * INDEX_RECORD.size)
+
+    def _key(self, index):
+        key_offset, key_length, _, _ = self._record(index)
+        start = self._keys_offset + key_offset
+        return bytes(self._index[start:start + key_length])  # memoryview の場合もバイト列で比べる
+
+    # シーンIDの番号を二分探索で求める（なければ None）
+    def _find(self, scene_id):
+        key = scene_id.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._key(low) == key:
+            return low
+        return None
+
+    def _decode(self, index):
+        _, _, start, end = self._record(index)
+        scene_data = json.loads(bytes(self._source[start:end]))
+        return compile_scene(index, self.ids[index], scene_data, self.index, self.symbols)
+
+    # 数の記録はロックの中で行う（デコードは先読みのスレッドを待たせないようにロックの外で行う）
+    def __getitem__(self, index):
+        with self._lock:
+            scene = self._cache.get(index)
+            if scene is not None:
+                self._cache.move_to_end(index)
+                self.hits += 1
+                return scene
+            self.misses += 1
+        return self._remember(index, self._decode(index))
+
+    # デコードしたシーンを覚える（別のスレッドが先に覚えていた場合は、同じオブジェクトを使うようにそちらを返す）
+    def _remember(self, index, scene):
+        with self._lock:
+            scene = self._cache.setdefault(index, scene)
+            self._cache.move_to_end(index)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scene
+
+    # シーンIDからシーンを取得する
+    def by_id(self, scene_id):
+        return self[self.index[scene_id]]
+
+    # キャッシュを変えずにシーンを取得する（キャッシュにない場合はデコードするだけで覚えない）
+    # 先読みのスレッドが、遷移先として覚えておいたシーンを追い出さないようにする
+    def peek(self, index):
+        with self._lock:
+            scene = self._cache.get(index)
+        if scene is not None:
+            return scene
+        return self._decode(index)
+
+    # 指定したシーンから遷移できるシーンを先にデコードしておく（デコードしたシーンを返す）
+    def warm_neighbors(self, index):
+        return [self[choice.next] for choice in self[index].choices]
+
+    def close(self):
+        for buffer in (self._source, self._index):
+            if isinstance(buffer, memoryview):
+                buffer.release()
+            else:
+                buffer.close()
+        for file in (self._source_file, self._index_file):
+            if file is not None:
+                file.close()
+
+
+# シーンを開く関数（大きなファイルは遅延読み込みのストア、それ以外はコンパイル済みのグラフ）
+# lazy=None の場合はファイルサイズで決める
+def open_scenes(file_path="scenes.json", lazy=None, start="start"):
+    if not os.path.exists(file_path):
+        return load_scene_graph(file_path, start)
+    if lazy is None:
+        lazy = os.path.getsize(file_path) > LAZY_THRESHOLD
+    if lazy:
+        return SceneStore(file_path, start)
+    return load_scene_graph(file_path, start)
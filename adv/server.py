@@ -0,0 +1,533 @@
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from array import array
+from collections import deque
+
+from conditions import available_choices
+from game_state import GameState
+from items import SceneItems
+from replay import DEFAULT_SCENE_FILE
+from scene_graph import load_scene_graph
+
+# 複数のプレイヤーに同じストーリーを提供するテキストサーバー（pygame は使わない）
+# 1行1コマンドの TCP プロトコルで、応答は1行の JSON
+#
+#   NEW              新しいセッションを始める（応答の "player" が再開用のID）
+#   RESUME <ID>      セッションを再開する
+#   LOOK             現在のシーンを表示する
+#   CHOOSE <番号>     選択肢を選ぶ（0から、条件を満たす選択肢の中での番号）
+#   TAKE <番号>       シーン内のアイテムを拾う（0から）
+#   CLICK <x> <y>    座標でアイテムをクリックする（画面と同じ判定）
+#   STATS            サーバーの統計
+#   QUIT             切断する
+#
+# シーングラフは起動時に一度だけコンパイルし、すべてのセッションで共有する（セッションからは変更しない）
+# 各セッションは現在のシーン番号・GameState・訪れたシーンの SceneItems だけを持つ
+# 変更のあったセッションは一定間隔でまとめてセーブファイルに追記し（1回の fsync）、
+# しばらく操作のないセッションはメモリから追い出して、次に使われたときにセーブから読み込み直す
+#
+#   python server.py --port 8765
+#   python loadgen.py --port 8765 --sessions 10000
+
+LATENCY_SAMPLES = 65536  # 処理時間の統計に使う直近の件数
+MAX_LINE_BYTES = 4096  # 1行のコマンドの最大の長さ（改行のないまま超えた接続は切断する）
+
+logger = logging.getLogger(__name__)
+
+
+class CommandError(Exception):
+    pass
+
+
+# 1人分のセッション
+class PlayerSession:
+    __slots__ = ("player", "scene", "state", "scene_items", "last_active", "dirty")
+
+    def __init__(self, player, scene, state, scene_items):
+        self.player = player
+        self.scene = scene  # 現在のシーン番号
+        self.state = state  # インベントリ・フラグ（game_state.GameState）
+        self.scene_items = scene_items  # 訪れたシーンのアイテム（items.SceneItems）
+        self.last_active = time.monotonic()
+        self.dirty = True  # セーブしていない変更がある
+
+
+# セッションのセーブファイル（1行1セッションの JSON を追記し、プレイヤーごとに最新の行の位置を索引に持つ）
+# 書き込みはまとめて行い、古い行が増えたら最新の行だけのファイルに作り直す
+# write_batch はワーカースレッドから、get はイベントループから呼ばれるので、索引の更新はロックの中で行う
+class SessionStore:
+    def __init__(self, path, compact_ratio=4):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.index = {}  # プレイヤーID: 最新の行の位置
+        self.lines = 0  # ファイルの行数（古い行も含む）
+        self._lock = threading.Lock()  # 索引と読み込み用のファイル
+        self._write_lock = threading.Lock()  # 書き込みを1つずつにする
+        self._scan()
+        self._writer = open(path, "ab")
+        self._reader = open(path, "rb")
+
+    def _scan(self):
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    player = json.loads(line)["player"]
+                except (ValueError, KeyError, TypeError):
+                    break  # 書き込み途中で終わった行（以降は読まない）
+                self.index[player] = offset
+                self.lines += 1
+                offset += len(line)
+        if offset != os.path.getsize(self.path):
+            with open(self.path, "r+b") as file:
+                file.truncate(offset)
+
+    def __contains__(self, player):
+        return player in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    # ファイルを読むので、イベントループからは run_in_executor で呼ぶ
+    def get(self, player):
+        with self._lock:
+            offset = self.index.get(player)
+            if offset is None:
+                return None
+            self._reader.seek(offset)
+            line = self._reader.readline()
+        return json.loads(line)
+
+    # records（[(プレイヤーID, 行のバイト列), ...]）を書き込んで1回だけ fsync する（ワーカースレッドで呼ぶ）
+    def write_batch(self, records):
+        with self._write_lock:
+            updates = {}
+            for player, line in records:
+                updates[player] = self._writer.tell()
+                self._writer.write(line)
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            with self._lock:
+                self.index.update(updates)
+            self.lines += len(records)
+            if self.lines > self.compact_ratio * max(len(self.index), 1024):
+                self._compact()
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            index = dict(self.index)
+        new_index = {}
+        with open(self.path, "rb") as reader, open(tmp_path, "wb") as writer:
+            for player, offset in index.items():
+                reader.seek(offset)
+                new_index[player] = writer.tell()
+                writer.write(reader.readline())
+            writer.flush()
+            os.fsync(writer.fileno())
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            self._reader.close()
+            self._reader = open(self.path, "rb")
+            self.index = new_index
+        self._writer.close()
+        self._writer = open(self.path, "ab")
+        self.lines = len(new_index)
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        with self._lock:
+            self._reader.close()
+
+
+class StoryServer:
+    def __init__(self, scenes, store=None, idle_seconds=300.0, flush_interval=1.0, capacity=1):
+        self.scenes = scenes  # コンパイル済みのシーングラフ（共有、変更しない）
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.sessions = {}  # プレイヤーID: PlayerSession（メモリにあるものだけ）
+        self._dirty = set()  # セーブしていない変更があるプレイヤーID
+        self._views = {}  # シーン番号: 変わらない部分の JSON
+        self.connections = 0
+        self.actions = 0
+        self.evicted = 0
+        self.loaded = 0
+        self.flushes = 0
+        self._latency = array("q", bytes(8 * LATENCY_SAMPLES))  # 直近の処理時間（ナノ秒）
+        self._latency_count = 0
+        # アイテム名のビットを先に割り当てておく（起動後は共有の表を書き換えない）
+        for scene in scenes:
+            for spec in scene.items:
+                scenes.symbols.item_bit(spec.name)
+
+    # ---- セッション ----
+
+    def new_session(self):
+        player = secrets.token_hex(8)
+        session = PlayerSession(player, self.scenes.start, GameState(self.scenes.symbols, self.capacity),
+                                SceneItems())
+        self._enter(session, self.scenes.start)
+        self.sessions[player] = session
+        self._dirty.add(player)
+        return session
+
+    # メモリにあるセッション（追い出したセッションは、コマンドを処理する前に load で読み込んでおく）
+    def session(self, player):
+        return self.sessions.get(player)
+
+    # コマンドの処理に必要で、セーブから読み込まないといけないプレイヤーID（なければ None）
+    def missing_session(self, player, line):
+        if self.store is None:
+            return None
+        words = line.split()
+        command = words[0].upper() if words else ""
+        if command == "RESUME" and len(words) == 2:
+            player = words[1]
+        elif command in ("", "NEW", "STATS", "RESUME"):
+            return None
+        if player is None or player in self.sessions or player not in self.store:
+            return None
+        return player
+
+    # 追い出したセッションをセーブから読み込む（ファイルの読み込みはワーカースレッド）
+    async def load(self, player):
+        data = await asyncio.get_running_loop().run_in_executor(None, self.store.get, player)
+        # 読み込んでいる間に別の接続が読み込んだ場合は、そちらを使う
+        if data is not None and player not in self.sessions:
+            self.sessions[player] = self._restore(data)
+            self.loaded += 1
+
+    def _enter(self, session, scene_index):
+        session.scene = scene_index
+        session.scene_items.load_scene_items(scene_index, self.scenes[scene_index])
+
+    # セーブの形: {"player", "current_scene", "game_state", "scene_items"}（game_utils.save_game と同じ項目）
+    def _encode(self, session):
+        ids = self.scenes.ids
+        return (json.dumps({
+            "player": session.player,
+            "current_scene": ids[session.scene],
+            "game_state": session.state.to_data(),
+            "scene_items": {ids[scene]: session.scene_items.entries(scene)
+                            for scene in session.scene_items.items},
+        }, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _restore(self, data):
+        scenes = self.scenes
+        state = GameState.from_data(data["game_state"], scenes.symbols, self.capacity)
+        scene_items = SceneItems()
+        for scene_id, entries in data["scene_items"].items():
+            if scene_id in scenes:
+                scene_items.restore(scenes.index[scene_id], entries)
+        scene = scenes.index.get(data["current_scene"], scenes.start)
+        session = PlayerSession(data["player"], scene, state, scene_items)
+        session.dirty = False
+        self._enter(session, scene)
+        return session
+
+    # ---- 表示 ----
+
+    # シーンの変わらない部分（ID・本文・条件のない選択肢）を一度だけ JSON にしておく
+    def _scene_view(self, scene):
+        view = self._views.get(scene.index)
+        if view is None:
+            unconditional = all(choice.test is None for choice in scene.choices)
+            choices = (json.dumps([choice.text for choice in scene.choices], ensure_ascii=False)
+                       if unconditional else None)
+            view = self._views[scene.index] = (
+                '{"scene":%s,"text":%s' % (json.dumps(scene.id, ensure_ascii=False),
+                                          json.dumps(scene.text, ensure_ascii=False)),
+                choices)
+        return view
+
+    def view(self, session, extra=""):
+        scene = self.scenes[session.scene]
+        head, choices = self._scene_view(scene)
+        if choices is None:
+            choices = json.dumps([choice.text for choice in available_choices(scene.choices, session.state)],
+                                 ensure_ascii=False)
+        items = json.dumps([c.item.name for c in session.scene_items.available_items(session.scene)],
+                           ensure_ascii=False)
+        inventory = json.dumps(list(session.state.inventory), ensure_ascii=False)
+        return f'{head},"choices":{choices},"items":{items},"inventory":{inventory}{extra}}}\n'
+
+    # ---- コマンド ----
+
+    # 1行のコマンドを処理して、応答の行と現在のプレイヤーIDを返す
+    def handle(self, player, line):
+        started = time.perf_counter_ns()
+        try:
+            reply, player = self._dispatch(player, line.split())
+        except CommandError as e:
+            reply = json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+        self.actions += 1
+        self._latency[self._latency_count % LATENCY_SAMPLES] = time.perf_counter_ns() - started
+        self._latency_count += 1
+        return reply, player
+
+    def _dispatch(self, player, words):
+        if not words:
+            raise CommandError("コマンドがありません")
+        command = words[0].upper()
+
+        if command == "NEW":
+            session = self.new_session()
+            return self.view(session, ',"player":"%s"' % session.player), session.player
+        if command == "RESUME":
+            if len(words) != 2:
+                raise CommandError("RESUME <プレイヤーID>")
+            session = self.session(words[1])
+            if session is None:
+                raise CommandError("セッションがありません")
+            session.last_active = time.monotonic()
+            return self.view(session, ',"player":"%s"' % session.player), session.player
+        if command == "STATS":
+            return json.dumps(self.stats()) + "\n", player
+
+        if player is None:
+            raise CommandError("NEW または RESUME でセッションを始めてください")
+        session = self.session(player)
+        if session is None:
+            raise CommandError("セッションがありません")
+        session.last_active = time.monotonic()
+
+        if command == "LOOK":
+            return self.view(session), player
+        if command == "CHOOSE":
+            choices = available_choices(self.scenes[session.scene].choices, session.state)
+            choice = choices[self._number(words, len(choices))]
+            self._enter(session, choice.next)
+            self._touch(session)
+            return self.view(session), player
+        if command == "TAKE":
+            clickable_items = session.scene_items.available_items(session.scene)
+            clickable_item = clickable_items[self._number(words, len(clickable_items))]
+            session.scene_items.take(session.scene, clickable_item, session.state)
+            self._touch(session)
+            return self.view(session), player
+        if command == "CLICK":
+            if len(words) != 3:
+                raise CommandError("CLICK <x> <y>")
+            try:
+                pos = (int(words[1]), int(words[2]))
+            except ValueError:
+                raise CommandError("座標は整数で指定してください")
+            if session.scene_items.handle_click(session.scene, pos, session.state):
+                self._touch(session)
+            return self.view(session), player
+        raise CommandError(f"不明なコマンドです: {words[0]}")
+
+    @staticmethod
+    def _number(words, count):
+        try:
+            number = int(words[1])
+        except (IndexError, ValueError):
+            raise CommandError(f"{words[0].upper()} <番号>")
+        if not 0 <= number < count:
+            raise CommandError(f"番号は0から{count - 1}までです" if count else "選べるものがありません")
+        return number
+
+    def _touch(self, session):
+        session.dirty = True
+        self._dirty.add(session.player)
+
+    # ---- セーブ・追い出し ----
+
+    # 変更のあったセッションをまとめてセーブする（書き込みはワーカースレッド）
+    # 書き込みに失敗した場合は、次の flush で書き直せるように変更ありのまま残す
+    async def flush(self):
+        if self.store is None or not self._dirty:
+            return 0
+        players, self._dirty = self._dirty, set()
+        records = []
+        for player in players:
+            session = self.sessions.get(player)
+            if session is not None:
+                records.append((player, self._encode(session)))
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.write_batch, records)
+        except BaseException:
+            self._dirty |= players
+            raise
+        # 書き込み中に変更されたセッションは、次の flush まで変更ありのままにする
+        for player, _ in records:
+            session = self.sessions.get(player)
+            if session is not None and player not in self._dirty:
+                session.dirty = False
+        self.flushes += 1
+        return len(records)
+
+    # しばらく操作のない、セーブ済みのセッションをメモリから追い出す
+    def evict_idle(self, now=None):
+        if self.store is None:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.idle_seconds
+        idle = [player for player, session in self.sessions.items()
+                if session.last_active < deadline and not session.dirty and player in self.store]
+        for player in idle:
+            del self.sessions[player]
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def maintain(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # 書き込みに失敗しても止めない（変更のあったセッションは次の回に書き直す）
+            try:
+                await self.flush()
+                self.evict_idle()
+            except Exception:
+                logger.exception("セッションのセーブに失敗しました")
+
+    def stats(self):
+        count = min(self._latency_count, LATENCY_SAMPLES)
+        samples = sorted(self._latency[:count])
+
+        def percentile(p):
+            return samples[min(int(p * count), count - 1)] / 1000 if count else 0.0
+
+        return {
+            "connections": self.connections,
+            "sessions": len(self.sessions),
+            "saved": len(self.store) if self.store is not None else 0,
+            "actions": self.actions,
+            "evicted": self.evicted,
+            "loaded": self.loaded,
+            "flushes": self.flushes,
+            "p50_us": percentile(0.50),
+            "p99_us": percentile(0.99),
+            "max_us": samples[-1] / 1000 if count else 0.0,
+        }
+
+
+# 1つの接続（受け取ったデータを行に分けてコマンドとして処理する）
+class StoryProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.player = None
+        self.transport = None
+        self._buffer = b""
+        self._lines = deque()  # まだ処理していない行
+        self._loading = False  # セッションを読み込み中（終わるまで次の行を処理しない）
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+
+    def connection_lost(self, exc):
+        self.server.connections -= 1
+
+    def data_received(self, data):
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > MAX_LINE_BYTES or any(len(line) > MAX_LINE_BYTES for line in lines):
+            error = json.dumps({"error": f"1行は{MAX_LINE_BYTES}バイトまでです"}, ensure_ascii=False) + "\n"
+            self.transport.write(error.encode("utf-8"))
+            self.transport.close()
+            self._buffer = b""
+            self._lines.clear()
+            return
+        self._lines.extend(line.decode("utf-8", "replace").strip() for line in lines)
+        if not self._loading:
+            self._process()
+
+    # たまっている行を順に処理する（追い出したセッションが必要な行では、読み込みを待ってから続ける）
+    def _process(self, loaded=False):
+        replies = []
+        while self._lines:
+            text = self._lines[0]
+            if text.upper() == "QUIT":
+                self.transport.write("".join(replies).encode("utf-8"))
+                self.transport.close()
+                self._lines.clear()
+                return
+            player = None if loaded else self.server.missing_session(self.player, text)
+            if player is not None:
+                self._loading = True
+                self.transport.pause_reading()
+                asyncio.get_running_loop().create_task(self._load(player))
+                break
+            loaded = False
+            self._lines.popleft()
+            reply, self.player = self.server.handle(self.player, text)
+            replies.append(reply)
+        if replies:
+            self.transport.write("".join(replies).encode("utf-8"))
+
+    async def _load(self, player):
+        try:
+            await self.server.load(player)
+        except Exception:
+            logger.exception("セッションを読み込めませんでした: %s", player)
+        finally:
+            self._loading = False
+        if self.transport.is_closing():
+            return
+        self.transport.resume_reading()
+        self._process(loaded=True)
+
+
+def raise_file_limit():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def serve(story, host, port):
+    loop = asyncio.get_running_loop()
+    listener = await loop.create_server(lambda: StoryProtocol(story), host, port, backlog=4096)
+    maintenance = asyncio.create_task(story.maintain())
+    print(f"{host}:{port} で待ち受けています（シーン {len(story.scenes)}個）")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        maintenance.cancel()
+        await story.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数セッションのテキストサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenes", default=DEFAULT_SCENE_FILE, help="シーンファイルのパス")
+    parser.add_argument("--store", default="sessions.jsonl", help="セッションのセーブファイル")
+    parser.add_argument("--no-store", action="store_true", help="セッションをセーブしない")
+    parser.add_argument("--idle", type=float, default=300.0, help="メモリから追い出すまでの無操作時間（秒）")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="セーブをまとめて書き込む間隔（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    raise_file_limit()
+    store = None if args.no_store else SessionStore(args.store)
+    story = StoryServer(load_scene_graph(args.scenes), store, idle_seconds=args.idle,
+                        flush_interval=args.flush_interval)
+    # 共有のシーングラフは GC の対象から外しておく（セッションが増えたときの全体の GC を短くする）
+    gc.freeze()
+    try:
+        asyncio.run(serve(story, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store is not None:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
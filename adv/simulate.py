@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from conditions import BatchEvaluator, batch_supported
+from engine import PlaythroughStats, random_playthroughs
+from game_utils import load_scenes
+from replay import DEFAULT_SCENE_FILE
+from scene_graph import compile_scenes
+
+# 自動プレイによるストーリー検証
+# ランダムプレイを大量に実行し、シーンごとの到達数・手数・アイテム取得数を集計する
+#
+#   python simulate.py --runs 1000000 --workers 8 --seed 1
+
+_worker_scenes = None
+_worker_evaluator = None  # 選択肢の条件の一括評価（NumPy がなければ None）
+
+
+# ワーカーの初期化（コンパイル済みの条件は pickle できないので、シーンデータの辞書を受け取ってワーカーでコンパイルする）
+def _init_worker(scene_data, scenes=None):
+    global _worker_scenes, _worker_evaluator
+    if scenes is None:
+        scenes = compile_scenes(scene_data)
+    _worker_scenes = scenes
+    _worker_evaluator = BatchEvaluator(scenes.symbols) if batch_supported() else None
+
+
+# 1バッチ分のプレイを実行する（バッチごとに決まった乱数の種を使うので結果は再現できる）
+def _run_batch(args):
+    seed, batch_index, runs, max_steps, end_scenes = args
+    rng = random.Random(f"{seed}-{batch_index}")
+    stats = PlaythroughStats()
+    # バッチ内のプレイは同時に進め、同じシーンにいるプレイの条件をまとめて評価する
+    for session in random_playthroughs(_worker_scenes, rng, runs, max_steps, end_scenes,
+                                       evaluator=_worker_evaluator):
+        stats.add(session, end_scenes)
+    return stats
+
+
+# プレイを複数プロセスに分けて実行し、結果を集計する関数（scene_data は load_scenes で読み込んだ辞書）
+def run_simulation(scene_data, runs, seed=0, workers=None, max_steps=200, end_scenes=("ending",),
+                   batch_size=10000):
+    end_scenes = tuple(end_scenes)
+    batches = []
+    for batch_index, start in enumerate(range(0, runs, batch_size)):
+        batches.append((seed, batch_index, min(batch_size, runs - start), max_steps, end_scenes))
+
+    # ワーカーを起動する前にコンパイルして、シーンの誤りをここで報告する
+    scenes = compile_scenes(scene_data)
+    stats = PlaythroughStats()
+    if workers == 1:
+        _init_worker(scene_data, scenes)
+        for batch in batches:
+            stats.merge(_run_batch(batch))
+        return stats
+
+    with Pool(processes=workers, initializer=_init_worker, initargs=(scene_data,)) as pool:
+        for batch_stats in pool.imap_unordered(_run_batch, batches):
+            stats.merge(batch_stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ランダムプレイでストーリーを検証する")
+    parser.add_argument("--scenes", default=DEFAULT_SCENE_FILE, help="シーンファイルのパス")
+    parser.add_argument("--runs", type=int, default=10000, help="プレイ回数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ワーカープロセス数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--max-steps", type=int, default=200, help="1回のプレイの最大手数")
+    parser.add_argument("--end", nargs="+", default=["ending"], help="終了とみなすシーンID")
+    parser.add_argument("--batch-size", type=int, default=10000, help="1タスクあたりのプレイ回数")
+    parser.add_argument("--output", help="集計結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    scenes = load_scenes(args.scenes)
+    started = time.perf_counter()
+    stats = run_simulation(scenes, args.runs, args.seed, args.workers, args.max_steps,
+                           args.end, args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    result = stats.to_dict()
+    result["elapsed_seconds"] = elapsed
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=4)
+
+    print(f"{stats.runs} 回のプレイ（{elapsed:.2f} 秒）: 終了シーン到達 {stats.finished} 回、"
+          f"平均手数 {stats.mean_path_length():.1f}")
+    for scene_id, count in stats.scene_reach.most_common():
+        print(f"  {scene_id}: {count}")
+
+
+if __name__ == "__main__":
+    main()
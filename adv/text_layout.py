@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict
+
+# テキストレイアウトのキャッシュ
+# 折り返し結果と各行のサーフェスを保持し、毎フレームの再計算・再レンダリングを避ける
+# ウォームアップのスレッドからも使えるように、キャッシュの出し入れはロックで守る
+
+
+# レイアウト済みのテキスト（行ごとのサーフェスを保持）
+class TextLayout:
+    __slots__ = ("lines", "surfaces", "line_height", "height", "nbytes")
+
+    def __init__(self, lines, surfaces, line_height):
+        self.lines = lines
+        self.surfaces = surfaces
+        self.line_height = line_height
+        self.height = len(lines) * line_height
+        self.nbytes = sum(s.get_width() * s.get_height() * s.get_bytesize() for s in surfaces)
+
+    def draw(self, surface, x, y):
+        for i, line_surface in enumerate(self.surfaces):
+            surface.blit(line_surface, (x, y + i * self.line_height))
+        return y + self.height
+
+
+def _render(font, line, color):
+    return font.render(line, True, color)
+
+
+class TextLayoutCache:
+    # max_bytes を指定すると行サーフェスの合計サイズでも追い出す
+    # render(font, line, color) で行のレンダリング方法を差し替えられる
+    def __init__(self, max_entries=256, max_bytes=None, render=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._render = render or _render
+        self._layouts = OrderedDict()  # (text, font, color, max_width): TextLayout
+        self._advances = {}  # font: {文字: 幅}
+        self._heights = OrderedDict()  # (text, font, max_width): 折り返した高さ
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._layouts)
+
+    # 1文字の送り幅を取得（フォントごとに一度だけ計測）
+    def advance(self, font, char):
+        advances = self._advances.get(font)
+        if advances is None:
+            advances = self._advances[font] = {}
+        width = advances.get(char)
+        if width is None:
+            width = advances[char] = font.size(char)[0]
+        return width
+
+    # テキストを最大幅で折り返す（1文字ずつ送り幅を足していくので線形時間）
+    def wrap(self, text, font, max_width):
+        lines = []
+        start = 0
+        line_width = 0
+        for i, char in enumerate(text):
+            width = self.advance(font, char)
+            if line_width + width < max_width:
+                line_width += width
+            else:
+                lines.append(text[start:i])
+                start = i
+                line_width = width
+
+        if start < len(text):  # 最後の行を追加
+            lines.append(text[start:])
+
+        return lines
+
+    # レイアウトを取得（なければ折り返してレンダリングし、キャッシュに入れる）
+    def get(self, text, font, color, max_width):
+        key = (text, font, tuple(color), max_width)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                self.hits += 1
+                return layout
+            self.misses += 1
+
+        # 折り返しとレンダリングはロックの外で行う（同時に同じテキストを作った場合は後のものが残る）
+        lines = self.wrap(text, font, max_width)
+        surfaces = [self._render(font, line, color) for line in lines]
+        layout = TextLayout(lines, surfaces, font.get_height())
+        with self._lock:
+            old = self._layouts.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._layouts[key] = layout
+            self.nbytes += layout.nbytes
+            while len(self._layouts) > 1 and (
+                    len(self._layouts) > self.max_entries or
+                    (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                _, evicted = self._layouts.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return layout
+
+    # 折り返した高さだけを求める（行はレンダリングしない、論理座標での配置用）
+    def measure(self, text, font, max_width):
+        key = (text, font, max_width)
+        with self._lock:
+            height = self._heights.get(key)
+            if height is not None:
+                self._heights.move_to_end(key)
+                return height
+        height = len(self.wrap(text, font, max_width)) * font.get_height()
+        with self._lock:
+            self._heights[key] = height
+            while len(self._heights) > self.max_entries:
+                self._heights.popitem(last=False)
+        return height
+
+    # キャッシュ済みかどうか（LRUの順番は変えない）
+    def __contains__(self, key):
+        text, font, color, max_width = key
+        return (text, font, tuple(color), max_width) in self._layouts
+
+    # text のレイアウトをすべて捨てる（フォント・色・幅によらず）
+    def invalidate_text(self, text):
+        with self._lock:
+            for key in [k for k in self._layouts if k[0] == text]:
+                self.nbytes -= self._layouts.pop(key).nbytes
+            for key in [k for k in self._heights if k[0] == text]:
+                del self._heights[key]
+
+    # fonts 以外のフォントのレイアウト・高さ・文字幅を捨てる（使わなくなった大きさのフォントを手放す）
+    def retain_fonts(self, fonts):
+        fonts = set(fonts)
+        with self._lock:
+            for key in [k for k in self._layouts if k[1] not in fonts]:
+                self.nbytes -= self._layouts.pop(key).nbytes
+            for key in [k for k in self._heights if k[1] not in fonts]:
+                del self._heights[key]
+            for font in [f for f in self._advances if f not in fonts]:
+                del self._advances[font]
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+            self._advances.clear()
+            self._heights.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._layouts),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
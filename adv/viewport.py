@@ -0,0 +1,74 @@
+import math
+
+import pygame
+
+# 解像度に依存しない表示
+# ゲームは論理座標（800×600）で配置し、出力（ウィンドウ・フルスクリーン）の大きさに合わせて
+# 縦横比を保ったまま拡大した位置に、出力の解像度で直接描画する（フレームを丸ごと拡大縮小しない）
+# 余った部分は黒い帯になる。クリック位置は to_logical で論理座標に戻す
+# 倍率が 1 で余白がない場合（ウィンドウが論理サイズと同じ場合）は、どの変換も元の値をそのまま返す
+
+RECT_CACHE_SIZE = 1024
+
+
+class Viewport:
+    def __init__(self, logical_size, output_size=None):
+        self.logical_size = tuple(logical_size)
+        self.revision = 0  # 大きさが変わるたびに増える
+        self.resize(output_size or logical_size)
+
+    # 出力の大きさを変える（変わらなければ False）
+    def resize(self, output_size):
+        output_size = tuple(output_size)
+        if getattr(self, "output_size", None) == output_size:
+            return False
+        self.output_size = output_size
+        width, height = self.logical_size
+        self.scale = min(output_size[0] / width, output_size[1] / height)
+        self.size = (round(width * self.scale), round(height * self.scale))
+        self.offset = ((output_size[0] - self.size[0]) // 2, (output_size[1] - self.size[1]) // 2)
+        self.identity = self.scale == 1 and self.offset == (0, 0)
+        self._rects = {}  # 変換した矩形 (x, y, w, h) → 出力の矩形（ボタンなど毎フレーム同じ矩形を変換するため）
+        self.revision += 1
+        return True
+
+    # 論理座標の長さ → 出力の長さ
+    def length(self, value):
+        return round(value * self.scale)
+
+    # 論理座標の点 → 出力の点
+    def point(self, pos):
+        if self.identity:
+            return pos
+        return (self.offset[0] + round(pos[0] * self.scale), self.offset[1] + round(pos[1] * self.scale))
+
+    # 論理座標の矩形 → 出力の矩形（隣り合う矩形の間にすき間ができないように、辺の位置を変換する）
+    def rect(self, rect):
+        rect = pygame.Rect(rect)
+        if self.identity:
+            return rect
+        key = tuple(rect)
+        cached = self._rects.get(key)
+        if cached is None:
+            if len(self._rects) >= RECT_CACHE_SIZE:
+                self._rects.clear()
+            left, top = self.point(rect.topleft)
+            right, bottom = self.point(rect.bottomright)
+            cached = self._rects[key] = pygame.Rect(left, top, right - left, bottom - top)
+        return cached.copy()
+
+    # ゲームの表示範囲（出力の座標）
+    def area(self):
+        return pygame.Rect(self.offset, self.size)
+
+    # 出力の点 → 論理座標の点（クリック位置・マウス位置用）
+    def to_logical(self, pos):
+        if self.identity:
+            return pos
+        return (math.floor((pos[0] - self.offset[0]) / self.scale),
+                math.floor((pos[1] - self.offset[1]) / self.scale))
+
+    # 論理サイズのフォント → 出力で使うフォントのサイズ
+    # 切り捨てるので、出力での文字幅は論理座標での幅を超えない（折り返しや配置がはみ出さない）
+    def font_size(self, size):
+        return max(1, int(size * self.scale))
@@ -0,0 +1,68 @@
+import threading
+from collections import deque
+
+# シーンの先読み（ウォームアップ）
+# シーンを読み込んだ後、ワーカースレッドが現在のシーンから選択肢の遷移先を幅優先でたどり、
+# 各シーンに対して warm_scene(scene) を呼ぶ（本文の折り返し・選択肢やアイテム名のレンダリングなど）
+# memory_used() が memory_cap を超えたら、キャッシュから既存の内容を追い出さないようにそこで止める
+# cancel() でいつでも止められる
+# シーンは scenes.peek() で取得するので、遅延読み込みのストアのキャッシュ（遷移先として覚えたシーン）は追い出さない
+
+
+class SceneWarmup:
+    def __init__(self, warm_scene, memory_used=None, memory_cap=None, max_scenes=None):
+        self.warm_scene = warm_scene
+        self.memory_used = memory_used
+        self.memory_cap = memory_cap
+        self.max_scenes = max_scenes
+        self.warmed = 0
+        self.stopped_by_cap = False
+        self._cancel = threading.Event()
+        self._thread = None
+
+    # start_index のシーンから先読みを始める（実行中の先読みは止める）
+    def start(self, scenes, start_index):
+        self.cancel()
+        self._cancel = threading.Event()
+        self.warmed = 0
+        self.stopped_by_cap = False
+        self._thread = threading.Thread(target=self._run, args=(scenes, start_index, self._cancel),
+                                        name="scene-warmup", daemon=True)
+        self._thread.start()
+
+    def _over_cap(self):
+        return (self.memory_cap is not None and self.memory_used is not None and
+                self.memory_used() >= self.memory_cap)
+
+    def _run(self, scenes, start_index, cancel):
+        seen = {start_index}
+        pending = deque([start_index])
+        while pending and not cancel.is_set():
+            if self.max_scenes is not None and self.warmed >= self.max_scenes:
+                break
+            if self._over_cap():
+                self.stopped_by_cap = True
+                break
+            scene = scenes.peek(pending.popleft())
+            self.warm_scene(scene)
+            self.warmed += 1
+            for choice in scene.choices:
+                if choice.next not in seen:
+                    seen.add(choice.next)
+                    pending.append(choice.next)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # 先読みを止める（スレッドが終わるまで待つ）
+    def cancel(self, timeout=None):
+        self._cancel.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # 先読みが終わるまで待つ（テスト・ベンチマーク用）
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
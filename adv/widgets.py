@@ -0,0 +1,118 @@
+from collections import OrderedDict
+
+import pygame
+
+# 画面の部品
+# ボタンは「通常」「ホバー」「無効（クールダウン中）」の見た目を、ラベルと大きさごとに一度だけ画像にしておき、
+# 描画のたびには貼り付けるだけにする（毎フレームのサーフェスの作成やテキストのレンダリングをしない）
+# 無効の見た目に重ねる半透明の白は、大きさごとに1枚だけ作って共有する
+
+# ボタンの状態
+NORMAL = 0
+HOVER = 1
+DISABLED = 2
+
+
+# ボタンの見た目
+class ButtonStyle:
+    def __init__(self, font, inactive_color, active_color, border_color=(0, 0, 0),
+                 text_color=(0, 0, 0), disabled_text_color=(200, 200, 200),
+                 overlay_color=(255, 255, 255), overlay_alpha=128, border_width=2, hover_border_width=3):
+        self.font = font
+        self.inactive_color = inactive_color
+        self.active_color = active_color
+        self.border_color = border_color
+        self.text_color = text_color
+        self.disabled_text_color = disabled_text_color
+        self.overlay_color = overlay_color
+        self.overlay_alpha = overlay_alpha
+        self.border_width = border_width
+        self.hover_border_width = hover_border_width
+
+
+# マウス位置・クリックできるかどうかからボタンの状態を決める関数
+def button_state(is_hovering, can_click):
+    if not can_click:
+        return DISABLED
+    return HOVER if is_hovering else NORMAL
+
+
+# 状態ごとの画像を持つボタン
+class Button:
+    __slots__ = ("text", "size", "variants", "nbytes")
+
+    def __init__(self, text, size, variants):
+        self.text = text
+        self.size = size
+        self.variants = variants  # 状態の番号: Surface
+        self.nbytes = sum(s.get_width() * s.get_height() * s.get_bytesize() for s in variants)
+
+    def draw(self, surface, pos, state):
+        surface.blit(self.variants[state], pos)
+
+
+# (ラベル, 大きさ) ごとのボタンの LRU キャッシュ
+class ButtonCache:
+    def __init__(self, style, max_entries=128, max_bytes=16 * 1024 * 1024):
+        self.style = style
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.builds = 0
+        self._buttons = OrderedDict()  # (ラベル, 大きさ): Button
+        self._overlays = {}  # 大きさ: 半透明の Surface（無効の見た目用、共有）
+
+    def __len__(self):
+        return len(self._buttons)
+
+    def get(self, text, size):
+        key = (text, size)
+        button = self._buttons.get(key)
+        if button is not None:
+            self._buttons.move_to_end(key)
+            return button
+        button = self._buttons[key] = self._build(text, size)
+        self.nbytes += button.nbytes
+        while len(self._buttons) > 1 and (len(self._buttons) > self.max_entries or
+                                          self.nbytes > self.max_bytes):
+            _, evicted = self._buttons.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return button
+
+    def clear(self):
+        self._buttons.clear()
+        self._overlays.clear()
+        self.nbytes = 0
+
+    def _overlay(self, size):
+        overlay = self._overlays.get(size)
+        if overlay is None:
+            overlay = self._overlays[size] = pygame.Surface(size)
+            overlay.set_alpha(self.style.overlay_alpha)
+            overlay.fill(self.style.overlay_color)
+        return overlay
+
+    def _variant(self, text, size, fill_color, border_width, text_color, overlay=None):
+        style = self.style
+        surface = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()  # 画面と同じ形式にしておくと貼り付けが速い
+        rect = surface.get_rect()
+        pygame.draw.rect(surface, fill_color, rect)
+        pygame.draw.rect(surface, style.border_color, rect, border_width)
+        if overlay is not None:
+            surface.blit(overlay, (0, 0))
+        label = style.font.render(text, True, text_color)
+        surface.blit(label, label.get_rect(center=(size[0] / 2, size[1] / 2)))
+        return surface
+
+    def _build(self, text, size):
+        style = self.style
+        self.builds += 1
+        variants = (
+            self._variant(text, size, style.inactive_color, style.border_width, style.text_color),
+            self._variant(text, size, style.active_color, style.hover_border_width, style.text_color),
+            self._variant(text, size, style.inactive_color, style.border_width, style.disabled_text_color,
+                          self._overlay(size)),
+        )
+        return Button(text, size, variants)